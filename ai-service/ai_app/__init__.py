@@ -1,4 +1,13 @@
 # ai-service app package initializer
 # Keep minimal to avoid importing heavy dependencies during package import in tests
 
+import sys
+from pathlib import Path
+
+# Repository root (/app in docker-compose, where ai-service/ is mounted next to
+# dermasafe_common and dermatology_module): the shared packages, as in main.py
+_WORKSPACE_ROOT = str(Path(__file__).resolve().parent.parent.parent)
+if _WORKSPACE_ROOT not in sys.path:
+    sys.path.append(_WORKSPACE_ROOT)
+
 __all__ = []
@@ -0,0 +1,188 @@
+"""
+Admission control in front of the analysis endpoints
+
+Each gate admits at most `max_in_flight` requests and lets at most
+`max_queue` more wait (FIFO) for a slot; anything beyond that, or a request
+that waits longer than the queue timeout, is shed with a fast 429 and a
+Retry-After derived from the observed service time. The gate runs as ASGI
+middleware, so a rejected request is answered before its upload is read.
+
+- analyze gate: /analyze
+- bulk gate: /analyze/bulk, counted in streams; each stream analyzes up to
+  DERM_BULK_CONCURRENCY images at once, so it has its own small budget
+  instead of taking one analyze slot for many images
+- capture gate: /capture/check-quality, a smaller budget so camera preview
+  traffic cannot starve real analyses
+
+Limits are per process (each pre-fork worker has its own gates).
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+
+ADMISSION_ENABLED = os.getenv("DERM_ADMISSION", "true").lower() in {"1", "true", "yes"}
+ANALYZE_MAX_IN_FLIGHT = int(os.getenv("DERM_ANALYZE_MAX_IN_FLIGHT", "16"))
+ANALYZE_MAX_QUEUE = int(os.getenv("DERM_ANALYZE_MAX_QUEUE", "32"))
+BULK_MAX_IN_FLIGHT = int(os.getenv("DERM_BULK_MAX_IN_FLIGHT", "1"))
+BULK_MAX_QUEUE = int(os.getenv("DERM_BULK_MAX_QUEUE", "2"))
+CAPTURE_MAX_IN_FLIGHT = int(os.getenv("DERM_CAPTURE_MAX_IN_FLIGHT", "4"))
+CAPTURE_MAX_QUEUE = int(os.getenv("DERM_CAPTURE_MAX_QUEUE", "4"))
+# Max time a request waits for a slot; keep it below the backend's 30 s proxy timeout
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("DERM_ADMISSION_QUEUE_TIMEOUT", "20"))
+
+# Smoothing of the service-time average behind Retry-After
+EWMA_ALPHA = 0.2
+RETRY_AFTER_MAX = 60
+
+
+class Overloaded(Exception):
+    """Request shed by a gate; retry_after is in whole seconds"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Gate:
+    """Bounded in-flight count with a bounded FIFO wait queue"""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout if queue_timeout > 0 else None
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_ewma: Optional[float] = None
+        self._wait_ewma: Optional[float] = None
+        self._counters: Dict[str, int] = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: queue ahead x service time / slots"""
+        if self._service_ewma is None:
+            return 1
+        estimate = self._service_ewma * (len(self._waiters) + 1) / self.max_in_flight
+        return int(min(RETRY_AFTER_MAX, max(1, math.ceil(estimate))))
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting in the queue if needed; Overloaded if the request is shed"""
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self._counters["admitted"] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._counters["rejected_queue_full"] += 1
+            raise Overloaded("queue_full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._counters["queued"] += 1
+        started = time.perf_counter()
+        try:
+            # release() hands its slot straight to the waiter (in_flight unchanged)
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # The slot may have been handed over just as the timeout fired: keep it,
+            # otherwise in_flight would never come back down
+            if not (waiter.done() and not waiter.cancelled()):
+                self._counters["rejected_timeout"] += 1
+                raise Overloaded("queue_timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away after the slot was handed over: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self._wait_ewma = self._smooth(self._wait_ewma, time.perf_counter() - started)
+        self._counters["admitted"] += 1
+
+    def release(self, service_seconds: Optional[float] = None) -> None:
+        if service_seconds is not None:
+            self._service_ewma = self._smooth(self._service_ewma, service_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "service_ms_ewma": round(self._service_ewma * 1000, 1) if self._service_ewma is not None else None,
+            "queue_wait_ms_ewma": round(self._wait_ewma * 1000, 1) if self._wait_ewma is not None else None,
+            "retry_after": self.retry_after(),
+            **self._counters,
+        }
+
+    @staticmethod
+    def _smooth(current: Optional[float], sample: float) -> float:
+        return sample if current is None else (1 - EWMA_ALPHA) * current + EWMA_ALPHA * sample
+
+
+analyze_gate = Gate("analyze", ANALYZE_MAX_IN_FLIGHT, ANALYZE_MAX_QUEUE)
+bulk_gate = Gate("bulk", BULK_MAX_IN_FLIGHT, BULK_MAX_QUEUE)
+capture_gate = Gate("capture", CAPTURE_MAX_IN_FLIGHT, CAPTURE_MAX_QUEUE)
+
+# POST path -> gate
+GATED_PATHS: Dict[str, Gate] = {
+    "/analyze": analyze_gate,
+    "/analyze/bulk": bulk_gate,
+    "/capture/check-quality": capture_gate,
+}
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "analyze": analyze_gate.stats(),
+        "bulk": bulk_gate.stats(),
+        "capture": capture_gate.stats(),
+    }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware: gate POSTs to GATED_PATHS, shed the excess with 429 + Retry-After"""
+
+    def __init__(self, app, gates: Optional[Dict[str, Gate]] = None):
+        self.app = app
+        self.gates = GATED_PATHS if gates is None else gates
+
+    async def __call__(self, scope, receive, send):
+        gate = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            gate = self.gates.get(scope["path"].rstrip("/") or "/")
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await gate.acquire()
+        except Overloaded as e:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Dịch vụ đang quá tải, vui lòng thử lại sau", "reason": e.reason, "retry_after": e.retry_after},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            # Slot held until the response is fully sent (including a streamed bulk response)
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - started)
@@ -0,0 +1,213 @@
+"""
+Dynamic micro-batching in front of DermatologyAnalyzer
+
+Concurrent /analyze requests are coalesced for a short window (max batch size,
+max wait) so that one batched encode_image + one matmul against the text
+features serves every caller in the batch. Each caller also gets its image
+features back so they can be cached.
+"""
+import asyncio
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from . import profiling
+from .metrics import CpuAccount, cpu_account
+
+BATCHING_ENABLED = os.getenv("DERM_BATCHING", "true").lower() in {"1", "true", "yes"}
+BATCH_MAX_SIZE = int(os.getenv("DERM_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("DERM_BATCH_MAX_WAIT_MS", "5"))
+
+# Bucket upper bounds (ms) for the queue-wait histogram
+WAIT_BUCKETS_MS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 250.0, 500.0)
+
+
+@dataclass
+class _Pending:
+    image: Any
+    top_k: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    # Request the item belongs to; charged an equal share of the batch's CPU time
+    account: Optional[CpuAccount] = field(default_factory=cpu_account.get)
+
+
+class MicroBatcher:
+    """Coalesce concurrent analyze() calls into batched forwards
+
+    Example:
+        >>> batcher = MicroBatcher(analyzer, max_batch_size=8, max_wait_ms=5)
+        >>> result, features = await batcher.submit(pil_image, top_k=7)
+    """
+
+    def __init__(
+        self,
+        analyzer,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        executor: Optional[Executor] = None,
+    ):
+        self.analyzer = analyzer
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Stats
+        self._batch_sizes: Dict[int, int] = defaultdict(int)
+        self._wait_buckets: List[int] = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._max_queue_depth = 0
+        self._requests = 0
+        self._batches = 0
+        self._batched_items = 0
+        self._errors = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """Start the batching worker on the running event loop"""
+        if self._worker is not None and not self._worker.done():
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker; pending callers receive CancelledError"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        while self._queue is not None and not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.cancel()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def submit(self, image, top_k: int = 5):
+        """Queue one image and wait for its own (AnalysisResult, image features)"""
+        self.start()
+        assert self._queue is not None
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Pending(image=image, top_k=top_k, future=future))
+        self._requests += 1
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return await future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and batch-size / queue-wait histograms for tuning"""
+        wait_hist = {f"le_{b:g}ms": n for b, n in zip(WAIT_BUCKETS_MS, self._wait_buckets)}
+        wait_hist["le_inf"] = self._wait_buckets[-1]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self._max_queue_depth,
+            "requests": self._requests,
+            "batches": self._batches,
+            "errors": self._errors,
+            "mean_batch_size": self._batched_items / self._batches if self._batches else 0.0,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            "queue_wait_histogram": wait_hist,
+        }
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+    async def _collect(self) -> List[_Pending]:
+        """Block for the first request, then gather more until full or the window closes"""
+        assert self._queue is not None
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Window closed: still take whatever is already queued
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = [p for p in batch if not p.future.cancelled()]
+            if not batch:
+                continue
+
+            now = time.perf_counter()
+            for pending in batch:
+                self._observe_wait((now - pending.enqueued_at) * 1000.0)
+            self._batch_sizes[len(batch)] += 1
+            self._batches += 1
+            self._batched_items += len(batch)
+
+            try:
+                outputs = await loop.run_in_executor(self.executor, self._infer, batch)
+            except Exception as e:
+                outputs = [e] * len(batch)
+
+            for pending, output in zip(batch, outputs):
+                if pending.future.done():
+                    continue
+                if isinstance(output, Exception):
+                    self._errors += 1
+                    pending.future.set_exception(output)
+                else:
+                    pending.future.set_result(output)
+
+    def _infer(self, batch: List[_Pending]) -> List[Any]:
+        """One batched encode, then one scoring pass per distinct top_k (normally a single group)"""
+        started = time.thread_time()
+        try:
+            with profiling.region("encode_image"):
+                return self._infer_batch(batch)
+        finally:
+            share = (time.thread_time() - started) / len(batch)
+            for pending in batch:
+                if pending.account is not None:
+                    pending.account.add(share)
+
+    def _infer_batch(self, batch: List[_Pending]) -> List[Any]:
+        features = self.analyzer.embed_batch([pending.image for pending in batch])
+        outputs: List[Any] = list(features)
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i, pending in enumerate(batch):
+            if not isinstance(features[i], Exception):
+                groups[pending.top_k].append(i)
+        for top_k, indices in groups.items():
+            try:
+                results = self.analyzer.analyze_features(np.stack([features[i] for i in indices]), top_k=top_k)
+            except Exception as e:
+                results = [e] * len(indices)
+            for i, result in zip(indices, results):
+                outputs[i] = result if isinstance(result, Exception) else (result, features[i])
+        return outputs
+
+    def _observe_wait(self, wait_ms: float) -> None:
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if wait_ms <= bound:
+                self._wait_buckets[i] += 1
+                return
+        self._wait_buckets[-1] += 1
@@ -0,0 +1,242 @@
+"""
+Bulk analysis: many images in, one NDJSON line per image out
+
+Input is either a zip archive or many `images` parts of one multipart request.
+Per-image symptoms come from a manifest: NDJSON lines or a JSON array of
+{"image": <file name>, "symptoms_selected": [...] | "a, b", "duration": ...},
+given as the `manifest` form field or as manifest.ndjson / manifest.json at
+the root of the archive.
+
+Memory stays bounded whatever the upload size: the upload is spooled to disk
+by the multipart parser, an image is read only when it is scheduled, at most
+`concurrency` images are in flight (their forwards are coalesced by the
+micro-batcher), and each result is streamed out as soon as it completes.
+"""
+import asyncio
+import json
+import os
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .batching import BATCH_MAX_SIZE
+
+
+# Images analysed concurrently per bulk request (default: two full micro-batches)
+BULK_CONCURRENCY = int(os.getenv("DERM_BULK_CONCURRENCY", str(2 * BATCH_MAX_SIZE)))
+# Per-image size limit (uncompressed), protects against zip bombs
+BULK_MAX_IMAGE_MB = float(os.getenv("DERM_BULK_MAX_IMAGE_MB", "25"))
+BULK_MAX_IMAGES = int(os.getenv("DERM_BULK_MAX_IMAGES", "10000"))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+MANIFEST_NAMES = ("manifest.ndjson", "manifest.jsonl", "manifest.json")
+
+
+@dataclass
+class BulkItem:
+    """One image of a bulk request; its bytes are only read when it is scheduled"""
+    index: int
+    name: str
+    read: Callable[[], bytes]
+    symptoms: Dict[str, Any] = field(default_factory=dict)
+
+
+def parse_manifest(text: str) -> Dict[str, Dict[str, Any]]:
+    """File name -> symptoms fields; ValueError on malformed input"""
+    text = text.strip()
+    if not text:
+        return {}
+    if text.startswith("["):
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"manifest không phải JSON hợp lệ: {e}")
+    else:
+        rows = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"manifest dòng {lineno} không phải JSON hợp lệ: {e}")
+
+    manifest: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if not isinstance(row, dict) or not row.get("image"):
+            raise ValueError("mỗi dòng manifest cần trường 'image'")
+        selected = row.get("symptoms_selected") or []
+        if isinstance(selected, str):
+            selected = [s.strip() for s in selected.split(",") if s.strip()]
+        manifest[str(row["image"])] = {"symptoms_selected": selected, "duration": row.get("duration")}
+    return manifest
+
+
+def _symptoms_for(name: str, manifest: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    # Exact path first, then the bare file name (manifest written without folders)
+    return manifest.get(name) or manifest.get(PurePosixPath(name).name) or {}
+
+
+def _is_image(name: str) -> bool:
+    path = PurePosixPath(name)
+    if any(part.startswith(".") or part == "__MACOSX" for part in path.parts):
+        return False
+    return path.suffix.lower() in IMAGE_EXTENSIONS
+
+
+def _too_large(name: str, size: int, max_bytes: int) -> Callable[[], bytes]:
+    def read() -> bytes:
+        raise ValueError(f"{name}: {size / 2**20:.1f} MB vượt giới hạn {max_bytes / 2**20:.0f} MB")
+    return read
+
+
+def iter_archive(
+    fileobj: BinaryIO,
+    manifest: Optional[Dict[str, Dict[str, Any]]] = None,
+    max_image_mb: float = BULK_MAX_IMAGE_MB,
+    max_images: int = BULK_MAX_IMAGES,
+) -> Iterator[BulkItem]:
+    """Images of a zip archive in archive order (manifest field overrides the one inside)"""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"archive không phải file zip hợp lệ: {e}")
+
+    if manifest is None:
+        manifest = {}
+        for name in MANIFEST_NAMES:
+            if name in archive.namelist():
+                manifest = parse_manifest(archive.read(name).decode("utf-8"))
+                break
+
+    max_bytes = int(max_image_mb * 2**20)
+    entries = [info for info in archive.infolist() if not info.is_dir() and _is_image(info.filename)]
+    if len(entries) > max_images:
+        raise ValueError(f"archive có {len(entries)} ảnh, tối đa {max_images}")
+
+    def reader(info: zipfile.ZipInfo) -> Callable[[], bytes]:
+        if info.file_size > max_bytes:
+            return _too_large(info.filename, info.file_size, max_bytes)
+        return lambda: archive.read(info)
+
+    # Validated above (bad zip / manifest -> ValueError before streaming starts); items are lazy
+    return (
+        BulkItem(index, info.filename, reader(info), _symptoms_for(info.filename, manifest))
+        for index, info in enumerate(entries)
+    )
+
+
+def iter_uploads(
+    uploads: Iterable[Any],
+    manifest: Optional[Dict[str, Dict[str, Any]]] = None,
+    max_image_mb: float = BULK_MAX_IMAGE_MB,
+) -> Iterator[BulkItem]:
+    """Images sent as repeated multipart parts (UploadFile, spooled to disk by the parser)"""
+    manifest = manifest or {}
+    max_bytes = int(max_image_mb * 2**20)
+
+    def reader(upload) -> Callable[[], bytes]:
+        if upload.size is not None and upload.size > max_bytes:
+            return _too_large(upload.filename, upload.size, max_bytes)
+        return lambda: upload.file.read()
+
+    for index, upload in enumerate(uploads):
+        name = upload.filename or f"image-{index}"
+        yield BulkItem(index, name, reader(upload), _symptoms_for(name, manifest))
+
+
+def iter_paths(
+    paths: Iterable[str],
+    manifest: Optional[Dict[str, Dict[str, Any]]] = None,
+    max_image_mb: float = BULK_MAX_IMAGE_MB,
+) -> Iterator[BulkItem]:
+    """Images already spooled to disk (e.g. inputs of a queued job), named by file name"""
+    manifest = manifest or {}
+    max_bytes = int(max_image_mb * 2**20)
+
+    def reader(path: str, name: str) -> Callable[[], bytes]:
+        size = os.path.getsize(path)
+        if size > max_bytes:
+            return _too_large(name, size, max_bytes)
+        return Path(path).read_bytes
+
+    for index, path in enumerate(paths):
+        name = os.path.basename(path)
+        yield BulkItem(index, name, reader(path, name), _symptoms_for(name, manifest))
+
+
+async def run_bounded(
+    items: Iterator[BulkItem],
+    analyze: Callable[[BulkItem], Awaitable[Dict[str, Any]]],
+    concurrency: int = BULK_CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run analyze over items with at most `concurrency` in flight, yield lines in completion order
+
+    Each line is {"index", "image", "result"} or {"index", "image", "error"}. Pending
+    work is cancelled if the consumer stops early (e.g. the client goes away).
+    """
+    concurrency = max(1, concurrency)
+
+    async def run(item: BulkItem) -> Dict[str, Any]:
+        try:
+            return {"index": item.index, "image": item.name, "result": await analyze(item)}
+        except Exception as e:
+            return {"index": item.index, "image": item.name, "error": str(e) or type(e).__name__}
+
+    pending: set = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(run(item)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def stream_ndjson(
+    items: Iterator[BulkItem],
+    analyze: Callable[[BulkItem], Awaitable[Dict[str, Any]]],
+    concurrency: int = BULK_CONCURRENCY,
+) -> AsyncIterator[bytes]:
+    """NDJSON lines of run_bounded as they complete, closed by a {"summary": ...} line"""
+    started = time.perf_counter()
+    counts = {"images": 0, "ok": 0, "errors": 0}
+    async for line in run_bounded(items, analyze, concurrency):
+        counts["images"] += 1
+        counts["errors" if "error" in line else "ok"] += 1
+        yield (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+
+    summary = {**counts, "seconds": round(time.perf_counter() - started, 3)}
+    yield (json.dumps({"summary": summary}) + "\n").encode("utf-8")
+
+
+def bulk_items(
+    archive: Optional[Any],
+    images: Optional[List[Any]],
+    manifest_text: Optional[str],
+) -> Iterator[BulkItem]:
+    """Items of a bulk request (archive and/or image parts); ValueError on bad input"""
+    manifest = parse_manifest(manifest_text) if isinstance(manifest_text, str) and manifest_text else None
+    # Form fields that are plain strings instead of files are ignored
+    archive = archive if hasattr(archive, "file") else None
+    images = [upload for upload in images or [] if hasattr(upload, "file")]
+    if archive is None and not images:
+        raise ValueError("cần 'archive' (zip) hoặc ít nhất một phần 'images'")
+    if archive is not None and images:
+        raise ValueError("chỉ gửi một trong 'archive' hoặc 'images'")
+    if archive is not None:
+        return iter_archive(archive.file, manifest)
+    return iter_uploads(images, manifest)
@@ -4,10 +4,11 @@ Wraps smart_derma_capture module for use in FastAPI endpoint
 """
 import sys
 from pathlib import Path
-import numpy as np
-from PIL import Image
+from typing import Union
 import io
 
+from .frame import ImageFrame
+
 # Add smart_derma_capture to path
 WORKSPACE_ROOT = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(WORKSPACE_ROOT / "smart_derma_capture"))
@@ -30,12 +31,13 @@ class CaptureService:
         """Check if smart capture is available"""
         return CAPTURE_AVAILABLE and self.capture is not None
     
-    def check_quality(self, image_bytes: bytes) -> dict:
+    def check_quality(self, image: Union[bytes, ImageFrame]) -> dict:
         """
-        Check image quality from bytes
+        Check image quality from bytes or an already decoded frame
         
         Args:
-            image_bytes: Raw image bytes
+            image: Raw image bytes (decoded once at full size) or the
+                request's ImageFrame (its possibly downscaled decode is reused)
             
         Returns:
             Dict with is_acceptable, score, issues, recommendation
@@ -52,14 +54,32 @@ class CaptureService:
                 'suggestions': []
             }
         
-        # Convert bytes to numpy array
-        pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        np_image = np.array(pil_image)
-        # OpenCV uses BGR, convert from RGB
-        import cv2
-        cv_image = cv2.cvtColor(np_image, cv2.COLOR_RGB2BGR)
+        # Quality-only callers: one full-size decode, no draft pass first
+        frame = image if isinstance(image, ImageFrame) else ImageFrame(image, min_side=0)
+        # Thresholds are tuned for full-size photos; scale them instead of decoding again
+        return self.capture.check_quality(frame.bgr, scale=frame.scale)
+    
+    def enhance_frame(self, frame: ImageFrame, auto_crop: bool = False) -> tuple[ImageFrame, dict]:
+        """
+        Process a decoded frame: check quality and enhance if needed
+        
+        The enhanced array is wrapped in a new frame (no JPEG round-trip), so it
+        goes straight to the analyzer's preprocessing.
+        
+        Returns:
+            Tuple of (enhanced_frame, quality_report)
+        """
+        if not self.is_available():
+            return frame, {
+                'quality_before': {'score': 100, 'is_acceptable': True},
+                'quality_after': {'score': 100, 'is_acceptable': True},
+                'improvement': 0,
+                'final_acceptable': True
+            }
         
-        return self.capture.check_quality(cv_image)
+        # SmartCapture.process copies its input, so the read-only view is enough
+        enhanced_cv, report = self.capture.process(frame.bgr, auto_crop=auto_crop)
+        return ImageFrame.from_bgr(enhanced_cv), report
     
     def process(self, image_bytes: bytes, auto_crop: bool = False) -> tuple[bytes, dict]:
         """
@@ -80,21 +100,11 @@ class CaptureService:
                 'final_acceptable': True
             }
         
-        # Convert bytes to numpy array
-        pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        np_image = np.array(pil_image)
-        import cv2
-        cv_image = cv2.cvtColor(np_image, cv2.COLOR_RGB2BGR)
-        
-        # Process with smart capture
-        enhanced_cv, report = self.capture.process(cv_image, auto_crop=auto_crop)
+        enhanced, report = self.enhance_frame(ImageFrame(image_bytes), auto_crop=auto_crop)
         
         # Convert back to bytes
-        enhanced_rgb = cv2.cvtColor(enhanced_cv, cv2.COLOR_BGR2RGB)
-        enhanced_pil = Image.fromarray(enhanced_rgb)
-        
         output_buffer = io.BytesIO()
-        enhanced_pil.save(output_buffer, format='JPEG', quality=95)
+        enhanced.pil.save(output_buffer, format='JPEG', quality=95)
         enhanced_bytes = output_buffer.getvalue()
         
         return enhanced_bytes, report
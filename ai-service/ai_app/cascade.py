@@ -0,0 +1,110 @@
+"""
+Two-tier cascade for /analyze
+
+The cheap ONNX CVModel (MobileNetV3 from training/train.py) answers first.
+DermLIP only runs when the fast tier is uncertain:
+
+- max probability below DERM_CASCADE_MIN_PROB
+- margin between top-1 and top-2 below DERM_CASCADE_MIN_MARGIN
+- a high-risk class within the fast tier's top-k with at least
+  DERM_CASCADE_HIGH_RISK_MIN_PROB (never trust the fast tier alone there)
+"""
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional
+
+from .logic.rules import HIGH_RISK_DISEASES
+
+
+CASCADE_ENABLED = os.getenv("DERM_CASCADE", "false").lower() in {"1", "true", "yes"}
+CASCADE_MIN_PROB = float(os.getenv("DERM_CASCADE_MIN_PROB", "0.7"))
+CASCADE_MIN_MARGIN = float(os.getenv("DERM_CASCADE_MIN_MARGIN", "0.3"))
+CASCADE_HIGH_RISK_TOP_K = int(os.getenv("DERM_CASCADE_HIGH_RISK_TOP_K", "2"))
+CASCADE_HIGH_RISK_MIN_PROB = float(os.getenv("DERM_CASCADE_HIGH_RISK_MIN_PROB", "0.05"))
+CASCADE_HIGH_RISK = [
+    d.strip() for d in os.getenv("DERM_CASCADE_HIGH_RISK", ",".join(HIGH_RISK_DISEASES)).split(",") if d.strip()
+]
+
+# Tier that produced the image scores of a response
+TIER_FAST = "fast"
+TIER_DERMLIP = "dermlip"
+TIER_STUB = "stub"
+
+
+class Cascade:
+    """Escalation policy + counters around the fast CVModel
+
+    Example:
+        >>> cascade = Cascade(create_model_from_env())
+        >>> scores = cascade.model.predict(image_bytes)
+        >>> reason = cascade.escalation_reason(scores)  # None -> answer with the fast tier
+    """
+
+    def __init__(
+        self,
+        model,
+        min_prob: float = CASCADE_MIN_PROB,
+        min_margin: float = CASCADE_MIN_MARGIN,
+        high_risk_top_k: int = CASCADE_HIGH_RISK_TOP_K,
+        high_risk_min_prob: float = CASCADE_HIGH_RISK_MIN_PROB,
+        high_risk: Iterable[str] = CASCADE_HIGH_RISK,
+    ):
+        self.model = model
+        self.min_prob = min_prob
+        self.min_margin = min_margin
+        self.high_risk_top_k = max(0, high_risk_top_k)
+        self.high_risk_min_prob = high_risk_min_prob
+        self.high_risk = {d.lower() for d in high_risk}
+
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, int] = defaultdict(int)
+        self._reasons: Dict[str, int] = defaultdict(int)
+        self._decisions = 0
+        self._escalated = 0
+
+    def escalation_reason(self, scores: Dict[str, float]) -> Optional[str]:
+        """Why the fast tier's answer must be checked by DermLIP (None = trust it)"""
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        if not ranked:
+            return "no_scores"
+        if any(
+            name.lower() in self.high_risk and prob >= self.high_risk_min_prob
+            for name, prob in ranked[: self.high_risk_top_k]
+        ):
+            return "high_risk"
+        top1 = ranked[0][1]
+        if top1 < self.min_prob:
+            return "low_confidence"
+        top2 = ranked[1][1] if len(ranked) > 1 else 0.0
+        if top1 - top2 < self.min_margin:
+            return "low_margin"
+        return None
+
+    def record_decision(self, reason: Optional[str]) -> None:
+        """Count one fast-tier decision (reason None = answered by the fast tier)"""
+        with self._lock:
+            self._decisions += 1
+            if reason is not None:
+                self._escalated += 1
+                self._reasons[reason] += 1
+
+    def record_tier(self, tier: str) -> None:
+        """Count the tier that finally produced the image scores (cache hits included)"""
+        with self._lock:
+            self._tiers[tier] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "min_prob": self.min_prob,
+                "min_margin": self.min_margin,
+                "high_risk_top_k": self.high_risk_top_k,
+                "high_risk_min_prob": self.high_risk_min_prob,
+                "high_risk": sorted(self.high_risk),
+                "decisions": self._decisions,
+                "escalated": self._escalated,
+                "escalation_rate": self._escalated / self._decisions if self._decisions else 0.0,
+                "escalation_reasons": dict(self._reasons),
+                "answered_by": dict(self._tiers),
+            }
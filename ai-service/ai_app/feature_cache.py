@@ -0,0 +1,224 @@
+"""
+Image-feature cache for /analyze
+
+The image embedding does not depend on symptoms or duration, so resubmitting
+the same photo only needs the matmul against the text features plus the
+rules. Entries are keyed by SHA-256 of the uploaded bytes.
+
+Perceptual lookups (dHash, Hamming distance) are opt-in: they let a recompressed
+copy of the same photo hit, but also a different photo with a similar
+composition - another patient, same body site and framing - which would get
+the cached features and therefore the same analysis. Only enable them where
+uploads come from one user, and keep the distance small.
+
+- memory tier: bounded LRU (exact lookups, perceptual when enabled)
+- disk tier (optional): one .npy per SHA-256, exact lookups only
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+FEATURE_CACHE_ENABLED = os.getenv("DERM_FEATURE_CACHE", "true").lower() in {"1", "true", "yes"}
+FEATURE_CACHE_SIZE = int(os.getenv("DERM_FEATURE_CACHE_SIZE", "2048"))
+# Near-duplicate hits across uploads (see module docstring): off by default
+FEATURE_CACHE_PERCEPTUAL = os.getenv("DERM_FEATURE_CACHE_PERCEPTUAL", "false").lower() in {"1", "true", "yes"}
+# Max Hamming distance (bits out of 256) for a perceptual hit when enabled
+FEATURE_CACHE_PHASH_DISTANCE = int(os.getenv("DERM_FEATURE_CACHE_PHASH_DISTANCE", "4"))
+FEATURE_CACHE_DIR = os.getenv("DERM_FEATURE_CACHE_DIR") or None
+FEATURE_CACHE_DISK_ENTRIES = int(os.getenv("DERM_FEATURE_CACHE_DISK_ENTRIES", "50000"))
+
+# dHash grid: 16x16 comparisons -> 256-bit hash
+PHASH_SIZE = 16
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = PHASH_SIZE) -> int:
+    """Difference hash: compare adjacent pixels of a (hash_size+1) x hash_size grayscale thumbnail"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+@dataclass(frozen=True)
+class ImageKey:
+    """Cache key of one upload: model version + pipeline variant + hashes"""
+    namespace: str
+    sha256: str
+    phash: Optional[int] = None
+
+    @property
+    def exact(self) -> str:
+        return f"{self.namespace}|{self.sha256}"
+
+
+class ImageFeatureCache:
+    """Bounded LRU of normalized image features with optional disk tier"""
+
+    def __init__(
+        self,
+        max_entries: int = FEATURE_CACHE_SIZE,
+        phash_max_distance: int = FEATURE_CACHE_PHASH_DISTANCE if FEATURE_CACHE_PERCEPTUAL else -1,
+        disk_dir: Optional[str] = FEATURE_CACHE_DIR,
+        max_disk_entries: int = FEATURE_CACHE_DISK_ENTRIES,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.phash_max_distance = phash_max_distance
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_entries = max_disk_entries
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # exact key -> (features, namespace, phash)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, str, Optional[int]]]" = OrderedDict()
+        self._counters: Dict[str, int] = {
+            "hits_exact": 0,
+            "hits_perceptual": 0,
+            "hits_disk": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+        self._disk_writes = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    @property
+    def perceptual(self) -> bool:
+        """Whether near-duplicate lookups are on (callers can skip computing the dHash otherwise)"""
+        return self.phash_max_distance >= 0
+
+    def get(self, key: ImageKey) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key.exact)
+            if entry is not None:
+                self._entries.move_to_end(key.exact)
+                self._counters["hits_exact"] += 1
+                return entry[0]
+
+            if key.phash is not None and self.perceptual:
+                match = self._nearest(key)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self._counters["hits_perceptual"] += 1
+                    return self._entries[match][0]
+
+        features = self._disk_get(key)
+        with self._lock:
+            if features is not None:
+                self._counters["hits_disk"] += 1
+                self._put(key, features)
+            else:
+                self._counters["misses"] += 1
+        return features
+
+    def put(self, key: ImageKey, features: np.ndarray) -> None:
+        features = np.asarray(features, dtype=np.float32)
+        with self._lock:
+            self._counters["stores"] += 1
+            self._put(key, features)
+        self._disk_put(key, features)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, namespace_prefix: str) -> int:
+        """Drop the memory-tier entries of one model version (disk entries are namespaced, never hit again)"""
+        with self._lock:
+            stale = [k for k, (_, namespace, _) in self._entries.items() if namespace.startswith(namespace_prefix)]
+            for exact in stale:
+                del self._entries[exact]
+            self._counters["invalidations"] += len(stale)
+            return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = sum(self._counters[k] for k in ("hits_exact", "hits_perceptual", "hits_disk", "misses"))
+            hits = lookups - self._counters["misses"]
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "perceptual": self.perceptual,
+                "phash_max_distance": self.phash_max_distance,
+                "disk_tier": str(self.disk_dir) if self.disk_dir else None,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                **self._counters,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals (memory tier, caller holds the lock)
+    # ------------------------------------------------------------------
+    def _put(self, key: ImageKey, features: np.ndarray) -> None:
+        self._entries[key.exact] = (features, key.namespace, key.phash)
+        self._entries.move_to_end(key.exact)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _nearest(self, key: ImageKey) -> Optional[str]:
+        best, best_distance = None, self.phash_max_distance + 1
+        for exact, (_, namespace, phash) in self._entries.items():
+            if phash is None or namespace != key.namespace:
+                continue
+            distance = (phash ^ key.phash).bit_count()
+            if distance < best_distance:
+                best, best_distance = exact, distance
+        return best
+
+    # ------------------------------------------------------------------
+    # Disk tier (exact lookups only)
+    # ------------------------------------------------------------------
+    def _disk_path(self, key: ImageKey) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / f"{hashlib.sha256(key.exact.encode()).hexdigest()}.npy"
+
+    def _disk_get(self, key: ImageKey) -> Optional[np.ndarray]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+        try:
+            return np.load(path)
+        except Exception:
+            return None
+
+    def _disk_put(self, key: ImageKey, features: np.ndarray) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, features)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"⚠️ Feature cache disk write failed: {e}")
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Drop the oldest files once the disk tier exceeds its entry budget"""
+        files = sorted(self.disk_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime)
+        for path in files[: max(0, len(files) - self.max_disk_entries)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,169 @@
+"""
+Request-scoped image frame: decode once, share views
+
+One /analyze request used to decode the upload in check_quality, again in
+capture_service.process (followed by a JPEG re-encode) and once more for the
+analyzer. An ImageFrame decodes lazily exactly once and hands out:
+
+- pil: the decoded RGB PIL image (what DermatologyAnalyzer preprocesses)
+- rgb: HxWx3 uint8 array, read-only
+- bgr: BGR copy of rgb for OpenCV, made once (a channel-reversed view has a
+  negative stride, which cv2 would copy on every call)
+
+The frame is shared by tasks running concurrently on the decode stage, so
+decoding is guarded by a lock; a decode error is cached and re-raised.
+
+Phone uploads (12-48 MP) are decoded at reduced resolution: JPEG uses DCT
+domain downscaling (draft, 1/2 .. 1/8), other formats a box reduce, down to
+the smallest scale whose short side is still >= DERM_DECODE_MIN_SIDE (the
+largest consumer: SmartCapture enhances at 512 px, DermLIP works at 224 px).
+EXIF orientation is applied once here. The quality check's thresholds (blur,
+resolution) are calibrated on full-size photos: it runs on this same decode and
+scales them by `scale` (decoded / original size) instead of decoding again.
+Callers that only check quality build the frame with min_side=0, a single
+full-size decode. decode_info["decodes"] counts every decode of the frame.
+"""
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+# Short side the decoded image must keep; 0 decodes at full resolution
+DECODE_MIN_SIDE = int(os.getenv("DERM_DECODE_MIN_SIDE", "512"))
+
+_EXIF_ORIENTATION = 0x0112
+
+
+class ImageFrame:
+    """Decoded image shared by quality check, enhancement and inference
+
+    Example:
+        >>> frame = ImageFrame(image_bytes)
+        >>> capture_service.check_quality(frame)   # uses frame.bgr
+        >>> analyzer.analyze(frame.pil)
+    """
+
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        rgb: Optional[np.ndarray] = None,
+        min_side: int = DECODE_MIN_SIDE,
+    ):
+        if data is None and rgb is None:
+            raise ValueError("ImageFrame needs encoded bytes or an RGB array")
+        self.data = data
+        self.min_side = max(0, min_side)
+        # Set after decoding: original/decoded size, scale, time (see _decode)
+        self.decode_info: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._pil: Optional[Image.Image] = None
+        self._rgb: Optional[np.ndarray] = None
+        self._bgr: Optional[np.ndarray] = None
+        self._decodes = 0
+        self._error: Optional[Exception] = None
+        if rgb is not None:
+            self._rgb = _readonly(rgb)
+
+    @classmethod
+    def of(cls, image: Union[bytes, "ImageFrame"]) -> "ImageFrame":
+        """Accept either raw bytes (legacy callers) or an existing frame"""
+        return image if isinstance(image, ImageFrame) else cls(image)
+
+    @classmethod
+    def from_bgr(cls, bgr: np.ndarray) -> "ImageFrame":
+        """Wrap an OpenCV (BGR) result, e.g. the enhanced image, without re-encoding"""
+        return cls(rgb=bgr[..., ::-1])
+
+    def decode(self) -> Image.Image:
+        """Decode now (call on a worker thread) and return the RGB PIL image"""
+        return self.pil
+
+    @property
+    def pil(self) -> Image.Image:
+        with self._lock:
+            if self._pil is None:
+                if self._rgb is not None:
+                    # Only array-backed frames pay this copy (PIL keeps its own layout)
+                    self._pil = Image.fromarray(np.ascontiguousarray(self._rgb), "RGB")
+                else:
+                    self._decode()
+            return self._pil
+
+    @property
+    def rgb(self) -> np.ndarray:
+        with self._lock:
+            if self._rgb is None:
+                if self._pil is None:
+                    self._decode()
+                self._rgb = _readonly(np.asarray(self._pil))
+            return self._rgb
+
+    @property
+    def bgr(self) -> np.ndarray:
+        rgb = self.rgb
+        with self._lock:
+            if self._bgr is None:
+                self._bgr = _readonly(np.ascontiguousarray(rgb[..., ::-1]))
+            return self._bgr
+
+    @property
+    def scale(self) -> float:
+        """Decoded / original size (1.0 at full resolution or for array-backed frames); decodes if needed"""
+        if self.data is None:
+            return 1.0
+        self.decode()
+        return self.decode_info["scale"]
+
+    @property
+    def size(self) -> tuple:
+        """(width, height)"""
+        return self.pil.size
+
+    def _decode(self) -> None:
+        # Caller holds the lock
+        if self._error is not None:
+            raise self._error
+        started = time.perf_counter()
+        self._decodes += 1
+        try:
+            image = Image.open(io.BytesIO(self.data))
+            original_size = image.size
+            if self.min_side and image.format == "JPEG":
+                # DCT-domain downscale: result is the smallest 1/2^k scale with both sides >= min_side
+                image.draft("RGB", (self.min_side, self.min_side))
+            image.load()
+
+            if self.min_side:
+                factor = min(image.size) // self.min_side
+                if factor >= 2:
+                    # Non-JPEG formats (or JPEGs beyond 1/8): cheap box reduce
+                    image = image.reduce(factor)
+
+            transposed = image.getexif().get(_EXIF_ORIENTATION, 1) not in (0, 1)
+            if transposed:
+                image = ImageOps.exif_transpose(image)
+
+            self._pil = image if image.mode == "RGB" else image.convert("RGB")
+        except Exception as e:
+            self._error = e
+            raise
+
+        self.decode_info = {
+            "original_size": list(original_size),
+            "decoded_size": list(self._pil.size),
+            "scale": round(max(self._pil.size) / max(original_size), 4),
+            "exif_transposed": transposed,
+            "decode_ms": round((time.perf_counter() - started) * 1000.0, 2),
+            "decodes": self._decodes,
+        }
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
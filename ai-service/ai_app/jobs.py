@@ -0,0 +1,431 @@
+"""
+Asynchronous analysis jobs
+
+POST /jobs spools the inputs to disk and answers with a job id right away; a
+small pool of workers in the process runs the job and stores the result in
+SQLite, where GET /jobs/{id} reads it. Long work (bulk archives, TTA, PanDerm)
+therefore never holds an HTTP connection open through a proxy timeout.
+
+- store: one SQLite file (WAL), shared by pre-fork workers, so any worker can
+  answer a poll
+- claim: a queued job is claimed with a conditional UPDATE, so it runs exactly
+  once even when several processes see it
+- recovery: jobs left running by a dead process (same host) go back to queued,
+  queued jobs nobody holds are picked up by the periodic sweep
+- TTL: finished jobs and their inputs are deleted DERM_JOB_TTL_SECONDS after
+  they finish
+"""
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+
+JOBS_ENABLED = os.getenv("DERM_JOBS", "true").lower() in {"1", "true", "yes"}
+JOB_WORKERS = int(os.getenv("DERM_JOB_WORKERS", "2"))
+# SQLite database + spooled inputs; put it on a shared volume when several workers serve /jobs
+JOBS_DIR = os.getenv("DERM_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "dermasafe-jobs")
+JOB_TTL_SECONDS = float(os.getenv("DERM_JOB_TTL_SECONDS", "3600"))
+# Submissions beyond this many queued jobs are rejected (503 + Retry-After)
+JOB_MAX_QUEUED = int(os.getenv("DERM_JOB_MAX_QUEUED", "1000"))
+# Min interval between progress writes of one job
+PROGRESS_FLUSH_SECONDS = 1.0
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at);
+"""
+
+
+class QueueFullError(RuntimeError):
+    """Too many queued jobs; the client should retry later"""
+
+
+@dataclass
+class Job:
+    """A claimed job as seen by its handler"""
+    id: str
+    kind: str
+    params: Dict[str, Any]
+    input_dir: Path
+
+
+# handler(job, report) -> JSON-serialisable result; report(done, total) publishes progress
+Reporter = Callable[[int, Optional[int]], Awaitable[None]]
+Handler = Callable[[Job, Reporter], Awaitable[Any]]
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """SQLite persistence of jobs (blocking; JobQueue calls it off the event loop)"""
+
+    def __init__(self, directory: str = JOBS_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.directory / "jobs.sqlite3"), check_same_thread=False, timeout=30.0)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            self._db.commit()
+
+    def input_dir(self, job_id: str) -> Path:
+        return self.directory / "inputs" / job_id
+
+    def _execute(self, sql: str, args: Tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            cursor = self._db.execute(sql, args)
+            self._db.commit()
+            return cursor
+
+    def _query(self, sql: str, args: Tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def create(self, job_id: str, kind: str, params: Dict[str, Any], total: Optional[int]) -> None:
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, params, progress_total, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, QUEUED, json.dumps(params, ensure_ascii=False), total, time.time()),
+        )
+
+    def get(self, job_id: str) -> Optional[sqlite3.Row]:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def claim(self, job_id: str, owner: str) -> Optional[Job]:
+        """queued -> running for this owner; None if another worker got it first (or it was cancelled)"""
+        cursor = self._execute(
+            "UPDATE jobs SET status = ?, owner = ?, started_at = ? WHERE id = ? AND status = ?",
+            (RUNNING, owner, time.time(), job_id, QUEUED),
+        )
+        if cursor.rowcount != 1:
+            return None
+        row = self.get(job_id)
+        return Job(id=row["id"], kind=row["kind"], params=json.loads(row["params"]), input_dir=self.input_dir(job_id))
+
+    def progress(self, job_id: str, done: int, total: Optional[int]) -> None:
+        self._execute(
+            "UPDATE jobs SET progress_done = ?, progress_total = COALESCE(?, progress_total) WHERE id = ?",
+            (done, total, job_id),
+        )
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id),
+        )
+
+    def cancel_queued(self, job_id: str) -> bool:
+        cursor = self._execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, time.time(), job_id, QUEUED),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, job_id: str) -> None:
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(self.input_dir(job_id), ignore_errors=True)
+
+    def queued_ids(self) -> List[str]:
+        return [row["id"] for row in self._query("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))]
+
+    def requeue_orphans(self, owner: str) -> int:
+        """Jobs left running by a process of this host that no longer exists go back to queued
+
+        Owners are "host:pid:token"; the token tells a restarted process that reuses
+        a pid (pid 1 in a container) from the one that claimed the job.
+        """
+        host, pid, _ = owner.split(":")
+        requeued = 0
+        for row in self._query("SELECT id, owner FROM jobs WHERE status = ?", (RUNNING,)):
+            parts = (row["owner"] or "").split(":")
+            if len(parts) != 3 or parts[0] != host or not parts[1].isdigit() or row["owner"] == owner:
+                continue
+            if parts[1] == pid or not _pid_alive(int(parts[1])):
+                cursor = self._execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL WHERE id = ? AND owner = ?",
+                    (QUEUED, row["id"], row["owner"]),
+                )
+                requeued += cursor.rowcount
+        return requeued
+
+    def expire(self, ttl_seconds: float) -> int:
+        """Delete finished jobs (and inputs) older than the TTL"""
+        cutoff = time.time() - ttl_seconds
+        rows = self._query(
+            "SELECT id FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?", (*FINISHED, cutoff)
+        )
+        for row in rows:
+            self.delete(row["id"])
+        return len(rows)
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._query("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JobQueue:
+    """Local worker pool over a JobStore
+
+    Example:
+        >>> queue = JobQueue(JobStore(), {"analyze": _job_analyze})
+        >>> await queue.start()
+        >>> job = await queue.submit("analyze", {"model": None}, files=[("image/a.jpg", upload.file)])
+        >>> (await queue.describe(job["id"]))["status"]
+        'queued'
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handlers: Dict[str, Handler],
+        workers: int = JOB_WORKERS,
+        ttl_seconds: float = JOB_TTL_SECONDS,
+        max_queued: int = JOB_MAX_QUEUED,
+    ):
+        self.store = store
+        self.handlers = dict(handlers)
+        self.workers = max(1, workers)
+        self.ttl_seconds = ttl_seconds
+        self.max_queued = max_queued
+        self.owner = f"{socket.gethostname().replace(':', '-')}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._known: set = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested: set = set()
+        self._progress: Dict[str, Tuple[int, Optional[int]]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._counters: Dict[str, int] = {"submitted": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "expired": 0}
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        await self._sweep()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(loop.create_task(self._sweeper()))
+
+    async def close(self) -> None:
+        # Jobs interrupted by shutdown stay running in the store; the next start on this host requeues them
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.store.close()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    async def submit(
+        self,
+        kind: str,
+        params: Dict[str, Any],
+        files: Optional[List[Tuple[str, BinaryIO]]] = None,
+        total: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Spool input files (relative path, file object) under the job's input dir, then queue the job"""
+        if kind not in self.handlers:
+            raise ValueError(f"Không hỗ trợ loại job '{kind}'")
+        queued = (await asyncio.to_thread(self.store.counts)).get(QUEUED, 0)
+        if queued >= self.max_queued:
+            raise QueueFullError(f"Hàng đợi job đã đầy ({queued} job)")
+
+        job_id = uuid.uuid4().hex
+        input_dir = self.store.input_dir(job_id)
+        try:
+            await asyncio.to_thread(self._spool, input_dir, files or [])
+            await asyncio.to_thread(self.store.create, job_id, kind, params, total)
+        except Exception:
+            shutil.rmtree(input_dir, ignore_errors=True)
+            raise
+        self._counters["submitted"] += 1
+        self._enqueue(job_id)
+        return await self.describe(job_id)
+
+    async def describe(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        """Status of a job (None if unknown or expired), result included when asked and available"""
+        row = await asyncio.to_thread(self.store.get, job_id)
+        if row is None:
+            return None
+        done, total = self._progress.get(job_id, (row["progress_done"], row["progress_total"]))
+        info: Dict[str, Any] = {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": {"done": done, "total": total},
+            "created_at": _iso(row["created_at"]),
+            "started_at": _iso(row["started_at"]),
+            "finished_at": _iso(row["finished_at"]),
+            "expires_at": _iso(row["finished_at"] + self.ttl_seconds) if row["finished_at"] else None,
+            "error": row["error"],
+        }
+        if with_result and row["status"] == SUCCEEDED:
+            info["result"] = json.loads(row["result"]) if row["result"] is not None else None
+        return info
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued job or one running in this process, delete a finished one
+
+        Returns the resulting status ("cancelled" / "deleted"), None if the job is unknown;
+        raises ValueError if the job runs in another process.
+        """
+        row = await asyncio.to_thread(self.store.get, job_id)
+        if row is None:
+            return None
+        if row["status"] in FINISHED:
+            await asyncio.to_thread(self.store.delete, job_id)
+            return "deleted"
+        if await asyncio.to_thread(self.store.cancel_queued, job_id):
+            self._counters["cancelled"] += 1
+            return CANCELLED
+        task = self._running.get(job_id)
+        if task is None:
+            raise ValueError("Job đang chạy ở một worker khác, không thể hủy từ worker này")
+        self._cancel_requested.add(job_id)
+        task.cancel()
+        return CANCELLED
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "owner": self.owner,
+            "directory": str(self.store.directory),
+            "ttl_seconds": self.ttl_seconds,
+            "max_queued": self.max_queued,
+            "local_queue": self._queue.qsize(),
+            "running_here": sorted(self._running),
+            "by_status": self.store.counts(),
+            **self._counters,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _spool(input_dir: Path, files: List[Tuple[str, BinaryIO]]) -> None:
+        input_dir.mkdir(parents=True, exist_ok=True)
+        for relpath, fileobj in files:
+            path = input_dir / relpath
+            if input_dir.resolve() not in path.resolve().parents:
+                raise ValueError(f"Tên file không hợp lệ: {relpath}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fileobj.seek(0)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(fileobj, out)
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._known:
+            self._known.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"⚠️ Job {job_id} crashed: {e}")
+            finally:
+                self._known.discard(job_id)
+                self._running.pop(job_id, None)
+                self._progress.pop(job_id, None)
+                self._cancel_requested.discard(job_id)
+
+    async def _run(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.claim, job_id, self.owner)
+        if job is None:
+            return
+        last_flush = 0.0
+
+        async def report(done: int, total: Optional[int] = None) -> None:
+            nonlocal last_flush
+            self._progress[job_id] = (done, total if total is not None else self._progress.get(job_id, (0, None))[1])
+            now = time.monotonic()
+            if now - last_flush >= PROGRESS_FLUSH_SECONDS:
+                last_flush = now
+                await asyncio.to_thread(self.store.progress, job_id, done, total)
+
+        # Own task per job so DELETE /jobs/{id} can cancel it without stopping the worker
+        task = asyncio.ensure_future(self.handlers[job.kind](job, report))
+        self._running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            # Shutdown (not DELETE /jobs/{id}): leave the job running so it is requeued
+            if job_id not in self._cancel_requested:
+                raise
+            await asyncio.to_thread(self.store.finish, job_id, CANCELLED)
+            self._counters["cancelled"] += 1
+        except Exception as e:
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, None, str(e) or type(e).__name__)
+            self._counters["failed"] += 1
+        else:
+            done, total = self._progress.get(job_id, (0, None))
+            await asyncio.to_thread(self.store.progress, job_id, done, total)
+            await asyncio.to_thread(self.store.finish, job_id, SUCCEEDED, result)
+            self._counters["succeeded"] += 1
+        # The result is in SQLite; inputs are no longer needed
+        shutil.rmtree(job.input_dir, ignore_errors=True)
+
+    async def _sweep(self) -> None:
+        """Requeue orphans, adopt queued jobs nobody holds, expire finished jobs past the TTL"""
+        requeued = await asyncio.to_thread(self.store.requeue_orphans, self.owner)
+        if requeued:
+            print(f"♻️ Requeued {requeued} job(s) interrupted by a dead worker")
+        for job_id in await asyncio.to_thread(self.store.queued_ids):
+            self._enqueue(job_id)
+        self._counters["expired"] += await asyncio.to_thread(self.store.expire, self.ttl_seconds)
+
+    async def _sweeper(self) -> None:
+        interval = max(1.0, min(60.0, self.ttl_seconds / 2))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._sweep()
+            except Exception as e:
+                print(f"⚠️ Job sweep failed: {e}")
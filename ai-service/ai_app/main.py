@@ -1,10 +1,14 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from typing import Optional, Dict
+from fastapi import APIRouter, FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Any, Optional, Dict, Tuple
+import asyncio
 import json
+import os
 import sys
+import time
+from contextlib import ExitStack, asynccontextmanager, nullcontext
 from pathlib import Path
-import io
+import numpy as np
 from PIL import Image
 
 # Thêm dermatology_module vào Python path
@@ -15,52 +19,665 @@ sys.path.insert(0, str(WORKSPACE_ROOT))
 
 import importlib
 
-# We'll try to import the real DermatologyAnalyzer lazily; if it fails (missing heavy deps)
-# we'll fall back to a lightweight stub implementation below.
+# The real DermatologyAnalyzer is imported and loaded in the background by the app lifespan;
+# if it fails (missing heavy deps) we fall back to stub scores.
 
 
 from .schemas import AnalyzeResult, Symptoms, DiseaseInfo
 from .logic.rules import decide_risk, adjust_scores, WARNING_FLAGS, INFLAMMATION_SYMPTOMS, CRITICAL_FLAGS, SEVERE_FLAGS, apply_duration_adjustment
 from .capture import capture_service
+from .frame import ImageFrame
 from .routes import router as capture_router
+from .batching import BATCHING_ENABLED, BATCH_MAX_SIZE
+from .pipeline import decode_stage, model_stage, pipeline_stats, shutdown_pipeline, start_pipeline
+from .feature_cache import ImageFeatureCache, ImageKey, FEATURE_CACHE_ENABLED, content_hash, perceptual_hash
+from .cascade import Cascade, CASCADE_ENABLED, TIER_FAST, TIER_DERMLIP, TIER_STUB
+from .model import create_model_from_env
+from .registry import ModelEntry, ModelNotLoadedError, ModelRegistry, UnknownModelError
+from .bulk import BulkItem, BULK_MAX_IMAGES, bulk_items, iter_archive, iter_paths, parse_manifest, run_bounded, stream_ndjson
+from .admission import AdmissionMiddleware, ADMISSION_ENABLED, admission_stats
+from .metrics import MetricsMiddleware, metrics_response, register_saturation, stage_timer
+from .profiling import PROFILER, ProfilingMiddleware
+from .jobs import Job, JobQueue, JobStore, QueueFullError, Reporter, JOBS_ENABLED
 
-app = FastAPI(title="DermaSafe-AI Service", version="0.3.0")
+router = APIRouter()
 
-# Mount capture routes
-app.include_router(capture_router)
+# Engine phân tích: "torch" (open_clip) hoặc "onnx" (ONNX Runtime, không cần torch)
+DERM_BACKEND = os.getenv("DERM_BACKEND", "torch").lower()
+DERM_ONNX_DIR = os.getenv("DERM_ONNX_DIR", "/app/models/dermlip-onnx")
+# Mô hình open_clip cho engine torch (ví dụ DermLIP PanDerm)
+DERM_MODEL_NAME = os.getenv("DERM_MODEL_NAME", "hf-hub:redlessone/DermLIP_ViT-B-16")
+# Khóa mô hình mặc định trong registry (AVAILABLE_MODELS); trống: khóa ứng với DERM_MODEL_NAME
+DERM_DEFAULT_MODEL = os.getenv("DERM_DEFAULT_MODEL", "").strip().lower()
+# Số lần forward khởi động (allocator + kernel warmup) trước khi /ready trả 200
+DERM_WARMUP_RUNS = int(os.getenv("DERM_WARMUP_RUNS", "3"))
 
-# Khởi tạo DermatologyAnalyzer (thử import bằng importlib để tránh import-time errors)
-DERMATOLOGY_ANALYZER = None
 DermAnalysisResult = None
-try:
-    analyzer_mod = importlib.import_module("dermatology_module.analyzer")
+FEATURE_CACHE: Optional[ImageFeatureCache] = None
+# Cascade: CVModel (ONNX, nhanh) trả lời trước, chỉ chuyển lên DermLIP khi không chắc chắn
+CASCADE: Optional[Cascade] = None
+# Pre-fork (ai_app.prefork): analyzer đã tải trong master, worker chỉ warmup
+PRELOADED_ANALYZER = None
+# Job bất đồng bộ (POST /jobs): worker pool trong process, kết quả lưu SQLite
+JOBS: Optional[JobQueue] = None
+
+# Trạng thái mô hình: loading -> warming -> ready, hoặc stub nếu không tải được
+# (pre-fork: preloaded -> warming -> ready)
+def _initial_model_state(status: str = "loading") -> Dict[str, Any]:
+    return {"status": status, "error": None, "load_seconds": None, "warmup_seconds": None, "warmup_runs": 0}
+
+
+MODEL_STATE: Dict[str, Any] = _initial_model_state()
+
+# Điểm giả lập khi không có analyzer hoặc phân tích lỗi
+STUB_CV_SCORES: Dict[str, float] = {
+    "melanoma": 0.05,
+    "nevus": 0.7,
+    "eczema": 0.2,
+    "acne": 0.05,
+}
+
+
+def _model_specs() -> Tuple[Dict[str, str], str]:
+    """(khóa -> mô hình, khóa mặc định) cho registry
+
+    Engine torch: AVAILABLE_MODELS (+ DERM_MODEL_NAME nếu không nằm trong đó).
+    Engine onnx: chỉ một artifact (DERM_ONNX_DIR), dưới khóa mặc định.
+    """
+    try:
+        specs = dict(importlib.import_module("dermatology_module.config").AVAILABLE_MODELS)
+    except Exception:
+        specs = {}
+    default = DERM_DEFAULT_MODEL or next((k for k, v in specs.items() if v == DERM_MODEL_NAME), "custom")
+    if DERM_BACKEND == "onnx":
+        return {default: DERM_ONNX_DIR}, default
+    specs.setdefault(default, DERM_MODEL_NAME)
+    return specs, default
+
+
+MODEL_SPECS, DEFAULT_MODEL = _model_specs()
+
+
+def _create_analyzer(key: str = DEFAULT_MODEL):
+    """Khởi tạo DermatologyAnalyzer (import bằng importlib để tránh import-time errors)"""
+    global DermAnalysisResult
     models_mod = importlib.import_module("dermatology_module.models")
-    DermatologyAnalyzer = analyzer_mod.DermatologyAnalyzer
+    if DERM_BACKEND == "onnx":
+        onnx_mod = importlib.import_module("dermatology_module.onnx_analyzer")
+        DermatologyAnalyzer = onnx_mod.OnnxDermatologyAnalyzer
+        analyzer_kwargs = {"model_dir": MODEL_SPECS[key]}
+    else:
+        analyzer_mod = importlib.import_module("dermatology_module.analyzer")
+        DermatologyAnalyzer = analyzer_mod.DermatologyAnalyzer
+        analyzer_kwargs = {"model_name": MODEL_SPECS[key]}
+        # DERM_WEIGHTS_DIR là artifact của mô hình mặc định; mô hình khác tải qua open_clip
+        if key != DEFAULT_MODEL:
+            analyzer_kwargs["weights_dir"] = ""
     DermAnalysisResult = models_mod.AnalysisResult
+    return DermatologyAnalyzer(**analyzer_kwargs)
+
+
+def _warmup(analyzer, runs: int = DERM_WARMUP_RUNS) -> int:
+    """Chạy vài forward trên ảnh giả để allocator và kernel được khởi động trước request đầu tiên"""
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8), "RGB")
+    # Lần cuối chạy đúng kích thước batch lớn nhất mà micro-batcher sẽ gửi
+    sizes = [1] * runs
+    if runs and BATCHING_ENABLED:
+        sizes[-1] = BATCH_MAX_SIZE
+    for size in sizes:
+        features = analyzer.embed_batch([image] * size)
+        if isinstance(features[0], Exception):
+            raise features[0]
+        analyzer.analyze_features(np.stack(features), top_k=7)
+    return len(sizes)
+
+
+def _load_cascade() -> None:
+    """Tải CVModel cho tier nhanh (USE_MODEL=true + MODEL_PATH); lỗi thì tắt cascade"""
+    global CASCADE
+    if not CASCADE_ENABLED:
+        return
+    fast_model = create_model_from_env()
+    if fast_model is None:
+        print("⚠️ DERM_CASCADE=true nhưng USE_MODEL chưa bật, bỏ qua cascade")
+        return
     try:
-        DERMATOLOGY_ANALYZER = DermatologyAnalyzer()
-        print("✅ DermatologyAnalyzer đã được khởi tạo thành công")
+        fast_model.load()
+        fast_model.predict_image(Image.new("RGB", (224, 224)))
     except Exception as e:
+        print(f"⚠️ Không thể tải CVModel cho cascade: {e}")
+        return
+    CASCADE = Cascade(fast_model)
+    print("✅ Cascade CVModel -> DermLIP đã bật")
+
+
+def _load_weights():
+    """Khởi tạo analyzer của mô hình mặc định; None (và trạng thái stub) nếu không tải được"""
+    started = time.perf_counter()
+    try:
+        analyzer = _create_analyzer(DEFAULT_MODEL)
+        print(f"✅ DermatologyAnalyzer ({DERM_BACKEND}, {DEFAULT_MODEL}) đã được khởi tạo thành công")
+    except Exception as e:
+        # Import/tải thất bại (thiếu torch/open_clip, không tải được trọng số) -> stub
         print(f"⚠️ Không thể khởi tạo DermatologyAnalyzer: {e}")
         print("⚠️ Sẽ sử dụng stub scores")
-        DERMATOLOGY_ANALYZER = None
-except Exception as e:
-    # Import failed (likely missing heavy deps like torch/open_clip) -> use stub
-    print(f"⚠️ Không thể import dermatology_module: {e}")
-    print("⚠️ Sẽ sử dụng stub implementation cho môi trường test nhẹ")
-    DERMATOLOGY_ANALYZER = None
-    DermAnalysisResult = None
+        MODEL_STATE.update(status="stub", error=str(e))
+        return None
+    MODEL_STATE["load_seconds"] = round(time.perf_counter() - started, 3)
+    return analyzer
+
+
+def _on_retire(entry: ModelEntry, replaced_by: Optional[ModelEntry]) -> None:
+    """Mô hình bị thay bằng phiên bản trọng số khác -> bỏ image features cũ trong bộ nhớ"""
+    if FEATURE_CACHE is not None and replaced_by is not None and replaced_by.version != entry.version:
+        dropped = FEATURE_CACHE.invalidate(f"{entry.version}|")
+        print(f"♻️ {entry.key}: {entry.version} -> {replaced_by.version}, dropped {dropped} cached features")
+
+
+def _new_registry() -> ModelRegistry:
+    """Registry các mô hình đã tải (route theo field model=, hot swap, LRU eviction)"""
+    return ModelRegistry(
+        MODEL_SPECS,
+        DEFAULT_MODEL,
+        loader=_create_analyzer,
+        warmup=_warmup,
+        batch_executor=model_stage.executor,
+        on_retire=_on_retire,
+    )
+
+
+REGISTRY = _new_registry()
+
+
+async def _publish(analyzer) -> None:
+    """Warmup (trên executor của stage model) rồi đưa analyzer mặc định vào phục vụ"""
+    global FEATURE_CACHE
+    MODEL_STATE["status"] = "warming"
+    # Cache image features: gửi lại cùng ảnh (chỉ đổi triệu chứng/thời gian) không chạy lại mô hình
+    if FEATURE_CACHE_ENABLED:
+        FEATURE_CACHE = ImageFeatureCache()
+    entry = await REGISTRY.install(
+        DEFAULT_MODEL, analyzer, MODEL_STATE["load_seconds"] or 0.0, executor=model_stage.executor
+    )
+    MODEL_STATE.update(warmup_seconds=entry.warmup_seconds, warmup_runs=entry.warmup_runs, status="ready")
+    print(f"✅ Model ready (load {MODEL_STATE['load_seconds']}s, warmup {MODEL_STATE['warmup_seconds']}s)")
+
+
+async def _boot() -> None:
+    """Tải cascade + mô hình mặc định trên executor của stage model (cùng thread sẽ chạy suy luận)
+
+    Worker pre-fork: trọng số đã có sẵn (chia sẻ copy-on-write), chỉ còn cascade + warmup.
+    """
+    await model_stage.run(_load_cascade)
+    if MODEL_STATE["status"] == "preloaded":
+        analyzer = PRELOADED_ANALYZER
+    else:
+        analyzer = await model_stage.run(_load_weights)
+    if analyzer is not None:
+        await _publish(analyzer)
+
+
+def preload_model() -> bool:
+    """
+    Tải trọng số trong process master trước khi fork worker (ai_app.prefork)
+
+    Không warmup ở đây: mỗi worker tự warmup trong lifespan sau khi fork.
+    """
+    global PRELOADED_ANALYZER
+    PRELOADED_ANALYZER = _load_weights()
+    if PRELOADED_ANALYZER is None:
+        return False
+    MODEL_STATE["status"] = "preloaded"
+    return True
+
+
+def _reset_after_shutdown() -> None:
+    """Lifespan kết thúc: app kế tiếp trong cùng process (ví dụ TestClient thứ hai) khởi động lại từ đầu
+
+    Executor của các stage được tạo lại (start_pipeline), registry mới thay registry đã đóng,
+    trạng thái mô hình quay về loading (hoặc preloaded nếu master pre-fork đã tải trọng số).
+    """
+    global FEATURE_CACHE, CASCADE, JOBS
+    FEATURE_CACHE = None
+    CASCADE = None
+    JOBS = None
+    status = "preloaded" if PRELOADED_ANALYZER is not None else "loading"
+    MODEL_STATE.clear()
+    MODEL_STATE.update(_initial_model_state(status))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tải mô hình nền: service nhận request (/health) ngay, /ready chờ đến khi warm
+    global JOBS, REGISTRY
+    start_pipeline()
+    if REGISTRY.closed:
+        REGISTRY = _new_registry()
+    loader = None
+    if MODEL_STATE["status"] in ("loading", "preloaded"):
+        loader = asyncio.create_task(_boot())
+    # Job queue mở sau fork: mỗi worker có connection SQLite và worker pool riêng
+    if JOBS_ENABLED:
+        JOBS = JobQueue(JobStore(), {"analyze": _job_analyze, "bulk": _job_bulk})
+        await JOBS.start()
+    try:
+        yield
+    finally:
+        if loader is not None and not loader.done():
+            loader.cancel()
+        if JOBS is not None:
+            await JOBS.close()
+        await REGISTRY.close()
+        shutdown_pipeline()
+        _reset_after_shutdown()
 
 
-@app.get("/health")
+@router.get("/health")
 async def health():
+    """Liveness: process còn sống (kể cả khi mô hình đang tải hoặc chạy stub)"""
+    default = REGISTRY.get(REGISTRY.default)
+    analyzer = default.analyzer if default is not None else None
     return {
         "status": "ok",
-        "dermatology_analyzer": "active" if DERMATOLOGY_ANALYZER else "inactive"
+        "model": MODEL_STATE["status"],
+        "default_model": REGISTRY.default,
+        "dermatology_analyzer": "active" if analyzer else "inactive",
+        "backend": getattr(analyzer, "backend", None),
+        "precision": getattr(analyzer, "precision", None),
     }
 
 
-@app.post("/analyze", response_model=AnalyzeResult)
+@router.get("/ready")
+async def ready():
+    """Readiness: 200 chỉ khi mô hình thật đã tải và warmup xong (503 khi đang tải hoặc stub)"""
+    status_code = 200 if MODEL_STATE["status"] == "ready" else 503
+    return JSONResponse(status_code=status_code, content={"ready": status_code == 200, **MODEL_STATE})
+
+
+@router.get("/stats/batching")
+async def batching_stats():
+    """Queue depth và histogram kích thước batch để tinh chỉnh micro-batching
+
+    Các trường gốc là của mô hình mặc định; "models" có batcher của từng mô hình đã tải.
+    """
+    batchers = {key: entry.batcher for key, entry in REGISTRY.entries() if entry.batcher is not None}
+    if not batchers:
+        return {"enabled": False}
+    default = batchers.get(REGISTRY.default)
+    return {
+        "enabled": True,
+        **(default.stats() if default is not None else {}),
+        "models": {key: batcher.stats() for key, batcher in batchers.items()},
+    }
+
+
+@router.get("/stats/feature-cache")
+async def feature_cache_stats():
+    """Số lần hit (exact / perceptual / disk) và miss của cache image features"""
+    if FEATURE_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **FEATURE_CACHE.stats()}
+
+
+@router.get("/stats/cascade")
+async def cascade_stats():
+    """Tỉ lệ chuyển lên DermLIP (escalation) và lý do"""
+    if CASCADE is None:
+        return {"enabled": False}
+    return {"enabled": True, **CASCADE.stats()}
+
+
+@router.get("/models")
+async def models():
+    """Registry: mô hình mặc định, mô hình đã tải (phiên bản, bộ nhớ, in-flight), ngân sách bộ nhớ"""
+    return REGISTRY.stats()
+
+
+def _model_key(model: str) -> str:
+    try:
+        return REGISTRY.resolve(model)
+    except UnknownModelError:
+        raise HTTPException(status_code=404, detail=f"Không có mô hình '{model}' (có: {sorted(REGISTRY.specs)})")
+
+
+@router.post("/models/{model}/load")
+async def load_model(model: str):
+    """Tải + warmup một mô hình (không làm gì nếu đã tải)"""
+    key = _model_key(model)
+    try:
+        entry = await REGISTRY.load(key)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Không thể tải mô hình {key}: {e}")
+    return {"model": key, **entry.info()}
+
+
+@router.post("/models/{model}/reload")
+async def reload_model(model: str):
+    """Tải lại (ví dụ trọng số mới) rồi hoán đổi nguyên tử; request đang chạy hoàn tất trên bản cũ"""
+    key = _model_key(model)
+    try:
+        entry = await REGISTRY.reload(key)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Không thể tải lại mô hình {key}: {e}")
+    return {"model": key, **entry.info()}
+
+
+@router.post("/models/{model}/default")
+async def set_default_model(model: str):
+    """Đổi mô hình mặc định (tải + warmup trước, sau đó mới chuyển traffic)"""
+    key = _model_key(model)
+    try:
+        entry = await REGISTRY.set_default(key)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Không thể tải mô hình {key}: {e}")
+    return {"default": REGISTRY.default, **entry.info()}
+
+
+@router.delete("/models/{model}")
+async def unload_model(model: str):
+    """Gỡ một mô hình không phải mặc định (sau khi các request đang dùng nó hoàn tất)"""
+    key = _model_key(model)
+    try:
+        unloaded = await REGISTRY.evict(key)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"model": key, "unloaded": unloaded}
+
+
+def _saturation():
+    """Gauge cho /metrics: gate admission, stage pipeline, hàng đợi micro-batcher, job"""
+    for gate, stats in admission_stats().items():
+        if isinstance(stats, dict):
+            yield "derm_admission_in_flight", {"gate": gate}, stats["in_flight"]
+            yield "derm_admission_waiting", {"gate": gate}, stats["waiting"]
+    for stage, stats in pipeline_stats().items():
+        yield "derm_stage_in_flight", {"stage": stage}, stats["in_stage"]
+    for key, entry in REGISTRY.entries():
+        if entry.batcher is not None:
+            yield "derm_batch_queue_depth", {"model": key}, entry.batcher.queue_depth()
+        yield "derm_model_in_flight", {"model": key}, entry.in_flight
+    if JOBS is not None:
+        stats = JOBS.stats()
+        yield "derm_jobs_local_queue", {}, stats["local_queue"]
+        for status, count in stats["by_status"].items():
+            yield "derm_jobs", {"status": status}, count
+
+
+register_saturation(
+    {
+        "derm_admission_in_flight": "Requests admitted by an admission gate and not finished",
+        "derm_admission_waiting": "Requests waiting in an admission gate queue",
+        "derm_stage_in_flight": "Tasks queued or running in a pipeline stage",
+        "derm_batch_queue_depth": "Images waiting for the next micro-batch",
+        "derm_model_in_flight": "Requests pinning a loaded model",
+        "derm_jobs_local_queue": "Jobs waiting for a worker of this process",
+        "derm_jobs": "Jobs in the store by status",
+    },
+    _saturation,
+)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus: latency theo route và theo stage, CPU mỗi request, gauge in-flight / hàng đợi"""
+    return metrics_response()
+
+
+def _check_profile_token(request: Request) -> None:
+    if not PROFILER.enabled:
+        raise HTTPException(status_code=404, detail="Profiler đang tắt (chưa đặt DERM_PROFILE_TOKEN)")
+    if not PROFILER.authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Sai hoặc thiếu X-Profile-Token")
+
+
+@router.get("/admin/profile")
+async def profile_status(request: Request):
+    """Profiler: capture đang chạy, số request còn được hẹn profile, các file đã ghi gần đây"""
+    _check_profile_token(request)
+    return PROFILER.stats()
+
+
+@router.post("/admin/profile")
+async def profile_arm(
+    request: Request,
+    requests: Optional[int] = None,
+    seconds: Optional[float] = None,
+    path: Optional[str] = None,
+):
+    """Bật profiler cho N request kế tiếp (lọc theo tiền tố path) hoặc cho mọi thứ trong T giây"""
+    _check_profile_token(request)
+    try:
+        return PROFILER.arm(requests=requests, seconds=seconds, path=path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/stats/admission")
+async def admission():
+    """Admission control: in-flight, hàng chờ, số request bị từ chối (429) và thời gian phục vụ trung bình"""
+    return admission_stats()
+
+
+@router.get("/stats/pipeline")
+async def stage_stats():
+    """Số tác vụ đang chờ/chạy trong từng stage (decode, model)"""
+    return pipeline_stats()
+
+
+async def _run_quality(frame: ImageFrame) -> Optional[dict]:
+    """Stage decode: kiểm tra chất lượng cơ bản trên ảnh gốc"""
+    try:
+        with stage_timer("quality"):
+            return await decode_stage.run(capture_service.check_quality, frame)
+    except Exception as e:
+        print(f"⚠️ Basic quality check failed: {e}")
+        return None
+
+
+def _cache_key(frame: ImageFrame, namespace: str) -> ImageKey:
+    """Khóa cache của ảnh gốc (SHA-256 của bytes + perceptual hash nếu bật tra gần đúng)"""
+    phash = perceptual_hash(frame.pil) if FEATURE_CACHE is not None and FEATURE_CACHE.perceptual else None
+    return ImageKey(namespace=namespace, sha256=content_hash(frame.data), phash=phash)
+
+
+def _scores_from_result(derm_result) -> Dict[str, float]:
+    cv_scores: Dict[str, float] = {derm_result.primary_disease.name: derm_result.primary_disease.confidence}
+    for alt_disease in derm_result.alternative_diseases:
+        cv_scores[alt_disease.name] = alt_disease.confidence
+    return cv_scores
+
+
+def _single_view_margin(derm_result) -> float:
+    alternatives = derm_result.alternative_diseases
+    second = alternatives[0].confidence if alternatives else 0.0
+    return derm_result.primary_disease.confidence - second
+
+
+async def _refine_with_tta(analyzer, frame: ImageFrame, features, derm_result):
+    """Ca khó phân định (margin nhỏ, DERM_TTA=auto): các view TTA chạy trong một batch ở stage model"""
+    if not analyzer.needs_tta(_single_view_margin(derm_result)):
+        return derm_result
+    try:
+        with stage_timer("tta"):
+            pil_image = await decode_stage.run(frame.decode)
+            return await model_stage.run(analyzer.analyze_with_tta, pil_image, top_k=7, image_features=features)
+    except Exception as e:
+        print(f"⚠️ TTA failed: {e}")
+        return derm_result
+
+
+async def _fast_tier(frame: ImageFrame) -> Tuple[Optional[Dict[str, float]], Optional[str]]:
+    """Tier nhanh của cascade: (scores của CVModel, lý do cần chuyển lên DermLIP hoặc None)"""
+    try:
+        # CVModel nhẹ, chạy ở stage decode để không xếp hàng sau các forward DermLIP
+        with stage_timer("fast_tier"):
+            pil_image = await decode_stage.run(frame.decode)
+            scores = await decode_stage.run(CASCADE.model.predict_image, pil_image)
+    except Exception as e:
+        print(f"⚠️ CVModel (cascade) failed: {e}")
+        scores, reason = None, "fast_tier_error"
+    else:
+        reason = CASCADE.escalation_reason(scores)
+    CASCADE.record_decision(reason)
+    return scores, reason
+
+
+def _pin_model(model_key: str, load: bool):
+    """REGISTRY.use, trừ chế độ stub: mô hình mặc định không tải được (thiếu torch / trọng số)"""
+    if MODEL_STATE["status"] == "stub" and model_key == REGISTRY.default and REGISTRY.get(model_key) is None:
+        return nullcontext(None)
+    return REGISTRY.use(model_key, load=load)
+
+
+async def _run_inference(
+    frame: ImageFrame, enhance: bool, model_key: str, wait_for_model: bool = False
+) -> Tuple[Any, Dict[str, float], str]:
+    """Cache image features -> tier nhanh (cascade) -> stage decode (enhance + decode) -> stage model (DermLIP)
+
+    Bản mô hình được giữ suốt request: hot swap giữa chừng không ảnh hưởng request này.
+    Mô hình bị gỡ (LRU) sau khi request đã kiểm tra: wait_for_model=True (bulk, job) thì tải
+    lại rồi chạy, không thì ModelNotLoadedError (503). Không bao giờ trả stub scores thay
+    cho mô hình đã được chọn.
+
+    Returns:
+        (derm_result, cv_scores, model_tier)
+    """
+    async with _pin_model(model_key, load=wait_for_model) as entry:
+        derm_result, cv_scores, tier = await _run_tiers(frame, enhance, entry)
+    if CASCADE is not None:
+        CASCADE.record_tier(tier)
+    return derm_result, cv_scores, tier
+
+
+async def _run_tiers(frame: ImageFrame, enhance: bool, entry: Optional[ModelEntry]) -> Tuple[Any, Dict[str, float], str]:
+    enhance = enhance and capture_service.is_available()
+    analyzer = entry.analyzer if entry is not None else None
+    cache_key = None
+    try:
+        if analyzer is not None and FEATURE_CACHE is not None:
+            # Namespace theo phiên bản mô hình (tên + trọng số) và biến thể ảnh (gốc / đã enhance)
+            namespace = f"{entry.version}|{'enhanced' if enhance else 'raw'}"
+            with stage_timer("cache_lookup"):
+                cache_key = await decode_stage.run(_cache_key, frame, namespace)
+                features = FEATURE_CACHE.get(cache_key)
+            if features is not None:
+                # Hit: chỉ còn matmul với text features + rules
+                derm_result = analyzer.analyze_features(features, top_k=7)[0]
+                if not enhance:
+                    # Features của ảnh đã enhance không khớp các view TTA dựng từ ảnh gốc
+                    derm_result = await _refine_with_tta(analyzer, frame, features, derm_result)
+                return derm_result, _scores_from_result(derm_result), TIER_DERMLIP
+    except Exception as e:
+        print(f"⚠️ Feature cache lookup failed: {e}")
+        cache_key = None
+
+    # Tier nhanh: CVModel trên ảnh gốc; chỉ chuyển lên DermLIP khi không chắc chắn
+    fast_scores = None
+    if CASCADE is not None:
+        fast_scores, reason = await _fast_tier(frame)
+        if reason is None:
+            return None, fast_scores, TIER_FAST
+
+    if analyzer is None:
+        # Stub scores nếu không có analyzer (ưu tiên điểm của tier nhanh nếu có)
+        if fast_scores is not None:
+            return None, fast_scores, TIER_FAST
+        return None, dict(STUB_CV_SCORES), TIER_STUB
+
+    # Smart capture enhancement (if enabled and available)
+    if enhance:
+        try:
+            # Ảnh đã enhance đi thẳng vào tiền xử lý, không encode/decode JPEG lại
+            with stage_timer("enhance"):
+                frame, quality_report = await decode_stage.run(capture_service.enhance_frame, frame, auto_crop=False)
+            print(f"✅ Image enhanced. Quality improved by {quality_report.get('improvement', 0):.1f} points")
+        except Exception as e:
+            print(f"⚠️ Enhancement failed: {e}. Using original image.")
+
+    try:
+        # PIL Image của frame (chỉ decode nếu chưa bước nào decode trước đó)
+        with stage_timer("decode"):
+            pil_image = await decode_stage.run(frame.decode)
+
+        # Phân tích (qua micro-batcher nếu bật); gồm cả thời gian chờ gom batch
+        with stage_timer("encode_image"):
+            if entry.batcher is not None:
+                async with model_stage.slot():
+                    derm_result, features = await entry.batcher.submit(pil_image, top_k=7)
+            else:
+                features = (await model_stage.run(analyzer.embed_batch, [pil_image]))[0]
+                if isinstance(features, Exception):
+                    raise features
+                derm_result = analyzer.analyze_features(features, top_k=7)[0]
+    except Exception as e:
+        print(f"Lỗi khi phân tích với DermatologyAnalyzer: {e}")
+        # Fallback: điểm của tier nhanh nếu có, không thì stub scores
+        if fast_scores is not None:
+            return None, fast_scores, TIER_FAST
+        return None, dict(STUB_CV_SCORES), TIER_STUB
+
+    if cache_key is not None:
+        FEATURE_CACHE.put(cache_key, features)
+
+    derm_result = await _refine_with_tta(analyzer, frame, features, derm_result)
+
+    # Tạo cv_scores từ kết quả phân tích
+    return derm_result, _scores_from_result(derm_result), TIER_DERMLIP
+
+
+def _not_loaded(model_key: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Mô hình {model_key} đang được tải, vui lòng thử lại sau"},
+        headers={"Retry-After": "10"},
+    )
+
+
+def _model_unavailable(model: Optional[str]) -> Tuple[Optional[str], Optional[JSONResponse]]:
+    """(khóa mô hình, None) hoặc (None, response lỗi) khi mô hình chưa phục vụ được"""
+    # Mô hình chưa sẵn sàng: từ chối thay vì trả stub scores
+    if MODEL_STATE["status"] in ("loading", "preloaded", "warming"):
+        return None, JSONResponse(
+            status_code=503,
+            content={"detail": "Mô hình đang được tải, vui lòng thử lại sau"},
+            headers={"Retry-After": "5"},
+        )
+
+    # Chọn mô hình; mô hình chưa tải thì tải nền và báo client thử lại
+    try:
+        model_key = REGISTRY.resolve(model)
+    except UnknownModelError:
+        return None, JSONResponse(
+            status_code=400,
+            content={"detail": f"Không có mô hình '{model}' (có: {sorted(REGISTRY.specs)})"},
+        )
+    if model_key != REGISTRY.default and REGISTRY.get(model_key) is None:
+        REGISTRY.load_in_background(model_key)
+        return None, _not_loaded(model_key)
+    return model_key, None
+
+
+def _parse_symptoms(
+    symptoms_json: Optional[str],
+    symptoms_selected: Optional[str],
+    duration: Optional[str],
+) -> Symptoms:
+    """Symptoms từ JSON có cấu trúc hoặc CSV (tương thích cũ); ValueError nếu JSON không hợp lệ"""
+    if symptoms_json:
+        try:
+            parsed = json.loads(symptoms_json)
+        except json.JSONDecodeError:
+            raise ValueError("symptoms_json không phải JSON hợp lệ")
+        return Symptoms(**parsed)
+    # Backward-compat: accept CSV in symptoms_selected and optional duration string
+    selected = []
+    if symptoms_selected:
+        selected = [s.strip() for s in symptoms_selected.split(",") if s.strip()]
+    return Symptoms(symptoms_selected=selected, duration=duration)  # type: ignore[arg-type]
+
+
+@router.post("/analyze", response_model=AnalyzeResult)
 async def analyze(
     image: UploadFile = File(...),
     # Backward-compat: allow either structured JSON ('symptoms_json') or simple CSV ('symptoms_selected')
@@ -68,83 +685,275 @@ async def analyze(
     symptoms_selected: Optional[str] = Form(None),
     duration: Optional[str] = Form(None),
     enhance: Optional[bool] = Form(False),  # New: enable smart capture enhancement
+    model: Optional[str] = Form(None),  # Khóa mô hình trong registry (mặc định: DERM_DEFAULT_MODEL)
 ):
-    # Đọc ảnh
-    image_bytes = await image.read()
-    
-    # Smart capture enhancement (if enabled and available)
-    # Luôn kiểm tra chất lượng cơ bản (dùng cho nhận diện 'undetectable' hoặc 'normal')
-    quality_basic = None
+    model_key, unavailable = _model_unavailable(model)
+    if unavailable is not None:
+        return unavailable
+
+    # Phân tích triệu chứng
+    try:
+        symptoms_model = _parse_symptoms(symptoms_json, symptoms_selected, duration)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+
+    # Đọc ảnh; frame decode một lần và dùng chung cho quality / enhance / suy luận
+    with stage_timer("upload_read"):
+        image_bytes = await image.read()
+    try:
+        result = await _analyze_frame(ImageFrame(image_bytes), symptoms_model, bool(enhance), model_key)
+    except ModelNotLoadedError:
+        # Bị gỡ (LRU) giữa lúc kiểm tra và lúc chạy: đã tải lại nền, client thử lại
+        return _not_loaded(model_key)
+    with stage_timer("serialization"):
+        body = result.model_dump_json()
+    return Response(content=body, media_type="application/json")
+
+
+@router.post("/analyze/bulk")
+async def analyze_bulk(request: Request):
+    """
+    Phân tích nhiều ảnh trong một request, trả NDJSON: mỗi ảnh một dòng ngay khi xong
+
+    multipart/form-data:
+        - archive: file zip chứa ảnh (có thể kèm manifest.ndjson / manifest.json)
+        - images: hoặc nhiều phần ảnh lặp lại
+        - manifest: NDJSON / JSON array {"image", "symptoms_selected", "duration"} theo tên file
+        - enhance, model: như /analyze, áp dụng cho mọi ảnh
+
+    Mỗi dòng: {"index", "image", "result": AnalyzeResult} hoặc {"index", "image", "error"};
+    dòng cuối: {"summary": {...}}.
+    """
+    # Form tự parse (không qua tham số File/Form): FastAPI đóng file upload khi handler
+    # trả về, trước khi StreamingResponse chạy; ở đây form được đóng khi stream kết thúc
+    form = await request.form(max_files=BULK_MAX_IMAGES + 1)
+    model_key, unavailable = _model_unavailable(form.get("model"))
+    if unavailable is not None:
+        await form.close()
+        return unavailable
+    enhance = str(form.get("enhance") or "false").lower() in {"1", "true", "yes", "on"}
+    try:
+        items = bulk_items(form.get("archive"), form.getlist("images"), form.get("manifest"))
+    except ValueError as e:
+        await form.close()
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+
+    async def analyze_one(item: BulkItem) -> Dict[str, Any]:
+        return await _analyze_item(item, enhance, model_key)
+
+    async def body():
+        try:
+            # Giữ mô hình suốt stream để LRU không gỡ nó giữa chừng (đã bị gỡ thì tải lại)
+            async with _pin_model(model_key, load=True):
+                async for line in stream_ndjson(items, analyze_one):
+                    yield line
+        finally:
+            await form.close()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+async def _analyze_item(item: BulkItem, enhance: bool, model_key: str) -> Dict[str, Any]:
+    """Một ảnh của bulk request / bulk job -> AnalyzeResult dạng JSON"""
+    symptoms_model = Symptoms(**item.symptoms)
+    frame = ImageFrame(await decode_stage.run(item.read))
+    # Ảnh hỏng -> dòng error thay vì stub scores
     try:
-        quality_basic = capture_service.check_quality(image_bytes)
+        await decode_stage.run(frame.decode)
     except Exception as e:
-        print(f"⚠️ Basic quality check failed: {e}")
+        raise ValueError(f"Không decode được ảnh: {e}")
+    result = await _analyze_frame(frame, symptoms_model, enhance, model_key, wait_for_model=True)
+    return result.model_dump(mode="json")
 
-    quality_report = None
-    if enhance and capture_service.is_available():
+
+# ----------------------------------------------------------------------
+# Job bất đồng bộ: POST /jobs -> id, GET /jobs/{id} (trạng thái), GET /jobs/{id}/result
+# ----------------------------------------------------------------------
+def _form_flag(value: Any) -> bool:
+    return str(value or "false").lower() in {"1", "true", "yes", "on"}
+
+
+def _upload_name(upload: Any, fallback: str) -> str:
+    # Chỉ giữ tên file (bỏ thư mục) khi ghi input của job ra đĩa
+    name = os.path.basename((upload.filename or "").replace("\\", "/"))
+    return name if name and not name.startswith(".") else fallback
+
+
+async def _serve_model(model_key: str) -> None:
+    """Job chờ mô hình sẵn sàng (thay vì 503 như /analyze); mô hình chưa tải thì tải luôn"""
+    while MODEL_STATE["status"] in ("loading", "preloaded", "warming"):
+        await asyncio.sleep(0.5)
+    if MODEL_STATE["status"] == "ready" and REGISTRY.get(model_key) is None:
+        await REGISTRY.load(model_key)
+
+
+async def _job_analyze(job: Job, report: Reporter) -> Dict[str, Any]:
+    """Job một ảnh: như POST /analyze"""
+    params = job.params
+    model_key = REGISTRY.resolve(params.get("model"))
+    await _serve_model(model_key)
+    await report(0, 1)
+    image_bytes = await decode_stage.run((job.input_dir / params["image"]).read_bytes)
+    result = await _analyze_frame(
+        ImageFrame(image_bytes), Symptoms(**params["symptoms"]), params["enhance"], model_key, wait_for_model=True
+    )
+    await report(1, 1)
+    return result.model_dump(mode="json")
+
+
+async def _job_bulk(job: Job, report: Reporter) -> Dict[str, Any]:
+    """Job nhiều ảnh: như POST /analyze/bulk, kết quả xếp theo thứ tự ảnh"""
+    params = job.params
+    model_key = REGISTRY.resolve(params.get("model"))
+    await _serve_model(model_key)
+    manifest = parse_manifest(params["manifest"]) if params.get("manifest") else None
+    started = time.perf_counter()
+    lines = []
+    with ExitStack() as stack:
+        if params.get("archive"):
+            archive = stack.enter_context(open(job.input_dir / params["archive"], "rb"))
+            items = iter_archive(archive, manifest)
+        else:
+            items = iter_paths([str(job.input_dir / name) for name in params["images"]], manifest)
+        async with _pin_model(model_key, load=True):
+            async for line in run_bounded(items, lambda item: _analyze_item(item, params["enhance"], model_key)):
+                lines.append(line)
+                await report(len(lines))
+    errors = sum(1 for line in lines if "error" in line)
+    return {
+        "results": sorted(lines, key=lambda line: line["index"]),
+        "summary": {
+            "images": len(lines),
+            "ok": len(lines) - errors,
+            "errors": errors,
+            "seconds": round(time.perf_counter() - started, 3),
+        },
+    }
+
+
+def _jobs_or_503() -> JobQueue:
+    if JOBS is None:
+        raise HTTPException(status_code=503, detail="Job bất đồng bộ đang tắt (DERM_JOBS=false)")
+    return JOBS
+
+
+def _job_links(info: Dict[str, Any]) -> Dict[str, Any]:
+    return {**info, "status_url": f"/jobs/{info['id']}", "result_url": f"/jobs/{info['id']}/result"}
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(request: Request):
+    """
+    Đưa phân tích vào hàng đợi, trả job id ngay (không giữ kết nối HTTP suốt quá trình phân tích)
+
+    multipart/form-data, cùng trường với:
+        - /analyze: image + symptoms_json / symptoms_selected / duration -> job "analyze"
+        - /analyze/bulk: archive hoặc images + manifest -> job "bulk"
+        - enhance, model: như /analyze (job chờ mô hình tải xong thay vì trả 503)
+
+    Theo dõi bằng GET /jobs/{id}; kết quả ở GET /jobs/{id}/result.
+    """
+    jobs = _jobs_or_503()
+    form = await request.form(max_files=BULK_MAX_IMAGES + 1)
+    try:
+        model = form.get("model")
         try:
-            image_bytes, quality_report = capture_service.process(image_bytes, auto_crop=False)
-            print(f"✅ Image enhanced. Quality improved by {quality_report.get('improvement', 0):.1f} points")
-        except Exception as e:
-            print(f"⚠️ Enhancement failed: {e}. Using original image.")
-    
-    # Phân tích bằng DermatologyAnalyzer
-    derm_result = None  # type: ignore
-    cv_scores: Dict[str, float] = {}
-    
-    if DERMATOLOGY_ANALYZER is not None:
+            model_key = REGISTRY.resolve(model)
+        except UnknownModelError:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": f"Không có mô hình '{model}' (có: {sorted(REGISTRY.specs)})"},
+            )
+        params: Dict[str, Any] = {"model": model_key, "enhance": _form_flag(form.get("enhance"))}
+        image = form.get("image")
         try:
-            # Chuyển bytes thành PIL Image
-            pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            
-            # Phân tích
-            derm_result = DERMATOLOGY_ANALYZER.analyze(pil_image, top_k=7)
-            
-            # Tạo cv_scores từ kết quả phân tích
-            cv_scores[derm_result.primary_disease.name] = derm_result.primary_disease.confidence
-            for alt_disease in derm_result.alternative_diseases:
-                cv_scores[alt_disease.name] = alt_disease.confidence
-                
-        except Exception as e:
-            print(f"Lỗi khi phân tích với DermatologyAnalyzer: {e}")
-            # Fallback to stub scores
-            cv_scores = {
-                "melanoma": 0.05,
-                "nevus": 0.7,
-                "eczema": 0.2,
-                "acne": 0.05,
-            }
-    else:
-        # Stub scores nếu không có analyzer
-        cv_scores = {
-            "melanoma": 0.05,
-            "nevus": 0.7,
-            "eczema": 0.2,
-            "acne": 0.05,
-        }
+            if hasattr(image, "file"):
+                kind = "analyze"
+                symptoms_model = _parse_symptoms(form.get("symptoms_json"), form.get("symptoms_selected"), form.get("duration"))
+                params.update(symptoms=symptoms_model.model_dump(mode="json"), image=f"image/{_upload_name(image, 'image')}")
+                files, total = [(params["image"], image.file)], 1
+            else:
+                kind = "bulk"
+                # Kiểm tra archive / manifest ngay để lỗi đầu vào trả 400 thay vì job failed
+                total = sum(1 for _ in bulk_items(form.get("archive"), form.getlist("images"), form.get("manifest")))
+                params["manifest"] = form.get("manifest") if isinstance(form.get("manifest"), str) else None
+                archive = form.get("archive")
+                if hasattr(archive, "file"):
+                    params["archive"] = "archive.zip"
+                    files = [(params["archive"], archive.file)]
+                else:
+                    uploads = [u for u in form.getlist("images") if hasattr(u, "file")]
+                    # images/<thứ tự>/<tên gốc>: giữ tên để khớp manifest, tránh trùng tên
+                    params["images"] = [f"images/{i:05d}/{_upload_name(u, f'image-{i}')}" for i, u in enumerate(uploads)]
+                    files = [(path, u.file) for path, u in zip(params["images"], uploads)]
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"detail": str(e)})
 
-    # Phân tích triệu chứng
-    symptoms_model: Symptoms
-    if symptoms_json:
         try:
-            parsed = json.loads(symptoms_json)
-        except json.JSONDecodeError:
-            return JSONResponse(status_code=400, content={"detail": "symptoms_json không phải JSON hợp lệ"})
-        symptoms_model = Symptoms(**parsed)
-    else:
-        # Backward-compat: accept CSV in symptoms_selected and optional duration string
-        selected = []
-        if symptoms_selected:
-            selected = [s.strip() for s in symptoms_selected.split(",") if s.strip()]
-        symptoms_model = Symptoms(symptoms_selected=selected, duration=duration)  # type: ignore[arg-type]
+            info = await jobs.submit(kind, params, files=files, total=total)
+        except QueueFullError as e:
+            return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "30"})
+    finally:
+        await form.close()
+    return JSONResponse(status_code=202, content=_job_links(info), headers={"Location": f"/jobs/{info['id']}"})
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Trạng thái (queued / running / succeeded / failed / cancelled), tiến độ, thời điểm hết hạn"""
+    info = await _jobs_or_503().describe(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Không có job này (hoặc đã hết hạn)")
+    return _job_links(info)
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """Kết quả: 200 khi xong, 202 + Retry-After khi còn chạy, 410 nếu bị hủy, 500 nếu lỗi"""
+    info = await _jobs_or_503().describe(job_id, with_result=True)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Không có job này (hoặc đã hết hạn)")
+    if info["status"] == "succeeded":
+        return info["result"]
+    if info["status"] in ("queued", "running"):
+        return JSONResponse(status_code=202, content=_job_links(info), headers={"Retry-After": "2"})
+    if info["status"] == "cancelled":
+        return JSONResponse(status_code=410, content={"detail": "Job đã bị hủy", **info})
+    return JSONResponse(status_code=500, content={"detail": info["error"], **info})
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Hủy job đang chờ / đang chạy trên worker này, hoặc xóa job đã xong"""
+    try:
+        outcome = await _jobs_or_503().cancel(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if outcome is None:
+        raise HTTPException(status_code=404, detail="Không có job này (hoặc đã hết hạn)")
+    return {"id": job_id, "status": outcome}
 
+
+@router.get("/stats/jobs")
+async def job_stats():
+    """Số job theo trạng thái, worker pool và TTL của process này"""
+    if JOBS is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(JOBS.stats)}
+
+
+def _apply_rules(cv_scores: Dict[str, float], symptoms_model: Symptoms, quality_basic: Optional[dict]):
+    """Rules: điều chỉnh điểm theo triệu chứng, mức rủi ro, thời gian và detection_status
+
+    Returns:
+        (adjusted_scores, adj_expl, risk, reason, det_status, det_message)
+    """
     # Điều chỉnh điểm theo triệu chứng và quyết định mức độ rủi ro
     adjusted_scores, adj_expl = adjust_scores(cv_scores, symptoms_model.symptoms_selected)
     risk, reason = decide_risk(adjusted_scores, symptoms_model.symptoms_selected, symptoms_model.duration)
     # Apply additional duration-based adjustment as a safety layer
     risk, reason = apply_duration_adjustment(risk, reason, symptoms_model.symptoms_selected, symptoms_model.duration)
     
-    # Tạo response
     # Xác định detection_status (normal / undetectable / detected)
     # Sử dụng heuristic dựa trên chất lượng ảnh, điểm mô hình và triệu chứng đã chọn
     det_status = "detected"
@@ -184,12 +993,34 @@ async def analyze(
     except Exception as e:
         print(f"⚠️ detection_status evaluation failed: {e}")
 
+    return adjusted_scores, adj_expl, risk, reason, det_status, det_message
+
+
+async def _analyze_frame(
+    frame: ImageFrame, symptoms_model: Symptoms, enhance: bool, model_key: str, wait_for_model: bool = False
+) -> AnalyzeResult:
+    """Quality + suy luận song song, rồi rules (triệu chứng, thời gian) và dựng AnalyzeResult"""
+    # Luôn kiểm tra chất lượng cơ bản (dùng cho nhận diện 'undetectable' hoặc 'normal').
+    # Kiểm tra chất lượng và suy luận độc lập nên chạy song song, ngoài event loop.
+    quality_basic, (derm_result, cv_scores, model_tier) = await asyncio.gather(
+        _run_quality(frame),
+        _run_inference(frame, enhance, model_key, wait_for_model),
+    )
+
+    with stage_timer("rules"):
+        adjusted_scores, adj_expl, risk, reason, det_status, det_message = _apply_rules(
+            cv_scores, symptoms_model, quality_basic
+        )
+
     result = AnalyzeResult(
         risk=risk,
         reason=reason,
         cv_scores=adjusted_scores,
         detection_status=det_status,
         detection_message=det_message,
+        model_tier=model_tier,
+        model=model_key if model_tier == TIER_DERMLIP else None,
+        image_decode=frame.decode_info,
         explanations={
             "image_evidence": cv_scores,
             "symptom_evidence": {
@@ -197,6 +1028,8 @@ async def analyze(
                 "duration": symptoms_model.duration,
             },
             "adjustments": adj_expl.get("adjustments", []),
+            # TTA: số view, độ đồng thuận và độ phân tán xác suất top-1 giữa các view
+            "image_uncertainty": (derm_result.metadata or {}).get("tta") if derm_result else None,
             "final_decision": {
                 "risk": risk,
                 "reason": reason,
@@ -233,3 +1066,22 @@ async def analyze(
         result.recommendations = derm_result.recommendations
     
     return result
+
+
+def create_app() -> FastAPI:
+    """App factory: routes + lifespan tải mô hình nền"""
+    app = FastAPI(title="DermaSafe-AI Service", version="0.3.0", lifespan=lifespan)
+    # Profiler theo yêu cầu (DERM_PROFILE_TOKEN); trong cùng: chỉ profile request đã được nhận
+    app.add_middleware(ProfilingMiddleware, profiler=PROFILER)
+    # Admission control: /analyze và /capture/check-quality có ngân sách riêng, vượt quá -> 429
+    if ADMISSION_ENABLED:
+        app.add_middleware(AdmissionMiddleware)
+    # Ngoài cùng: request bị admission từ chối (429) cũng được đếm
+    app.add_middleware(MetricsMiddleware)
+    # Mount capture routes
+    app.include_router(capture_router)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,183 @@
+"""
+Prometheus metrics for the AI service (GET /metrics)
+
+- derm_request_seconds / derm_requests_in_flight: per route (path template)
+- derm_request_cpu_seconds: CPU time spent on behalf of one request: the
+  request's own steps on the event loop plus its share of the executor work
+  (decode, quality, enhance, and a per-item share of each batched forward)
+- derm_stage_seconds: per pipeline stage of /analyze (upload_read, decode,
+  quality, enhance, encode_image, rules, serialization, ...)
+- saturation gauges read at scrape time: admission gates, pipeline stages,
+  micro-batcher queues, jobs
+
+With the pre-fork launcher set PROMETHEUS_MULTIPROC_DIR so histograms and
+counters are aggregated across workers (scrape-time gauges then come from the
+worker that answered and carry its pid).
+"""
+import contextvars
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from starlette.responses import Response
+from starlette.routing import Match
+
+from dermasafe_common.cputime import CpuAccount, Metered
+
+from . import profiling
+
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "derm_request_seconds", "Request latency", ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUEST_CPU_SECONDS = Histogram(
+    "derm_request_cpu_seconds", "CPU time spent on behalf of one request", ["route"], buckets=STAGE_BUCKETS
+)
+STAGE_SECONDS = Histogram("derm_stage_seconds", "Latency of one /analyze pipeline stage", ["stage"], buckets=STAGE_BUCKETS)
+IN_FLIGHT = Gauge("derm_requests_in_flight", "Requests being handled", ["route"], multiprocess_mode="livesum")
+
+
+# ----------------------------------------------------------------------
+# Per-request CPU accounting
+# ----------------------------------------------------------------------
+cpu_account: "contextvars.ContextVar[Optional[CpuAccount]]" = contextvars.ContextVar("cpu_account", default=None)
+
+
+def charged(fn: Callable, account: Optional[CpuAccount] = None) -> Callable:
+    """Wrap a callable run on an executor so its thread CPU time is charged to the request"""
+    account = account or cpu_account.get()
+    if account is None:
+        return fn
+
+    def run(*args, **kwargs):
+        started = time.thread_time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            account.add(time.thread_time() - started)
+    return run
+
+
+class _StageTimer:
+    __slots__ = ("stage", "started", "region")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        # skip=1: the region belongs to the caller's frame, not to this __enter__
+        self.region = profiling.region(self.stage, skip=1)
+        self.region.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.labels(stage=self.stage).observe(time.perf_counter() - self.started)
+        self.region.__exit__(*exc)
+        return False
+
+
+def stage_timer(stage: str):
+    """Context manager timing one pipeline stage (shown as "[stage]" in profiles)"""
+    return _StageTimer(stage)
+
+
+# ----------------------------------------------------------------------
+# Middleware
+# ----------------------------------------------------------------------
+def _route(scope) -> str:
+    """Path template of the matching route (bounded label cardinality), 'unmatched' otherwise"""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: latency, in-flight and CPU time per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = _route(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        account = CpuAccount()
+        token = cpu_account.set(account)
+        gauge = IN_FLIGHT.labels(route=route)
+        gauge.inc()
+        started = time.perf_counter()
+        try:
+            await Metered(self.app(scope, receive, send_wrapper), account)
+        finally:
+            cpu_account.reset(token)
+            gauge.dec()
+            REQUEST_SECONDS.labels(method=scope["method"], route=route, status=str(status["code"])).observe(
+                time.perf_counter() - started
+            )
+            REQUEST_CPU_SECONDS.labels(route=route).observe(account.seconds)
+
+
+# ----------------------------------------------------------------------
+# Scrape-time saturation gauges
+# ----------------------------------------------------------------------
+# name -> (help, label names); a source yields (name, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+class SaturationCollector:
+    """Gauges read from live objects (gates, stages, batchers, jobs) at scrape time"""
+
+    def __init__(self, metrics: Dict[str, str], source: Callable[[], Iterable[Sample]]):
+        self.metrics = metrics
+        self.source = source
+
+    def collect(self):
+        families: Dict[str, Any] = {}
+        pid = {"pid": str(os.getpid())} if MULTIPROC_DIR else {}
+        for name, labels, value in self.source():
+            labels = {**labels, **pid}
+            if name not in families:
+                families[name] = GaugeMetricFamily(name, self.metrics[name], labels=list(labels))
+            families[name].add_metric(list(labels.values()), value)
+        return list(families.values())
+
+
+_collectors = []
+
+
+def register_saturation(metrics: Dict[str, str], source: Callable[[], Iterable[Sample]]) -> None:
+    collector = SaturationCollector(metrics, source)
+    _collectors.append(collector)
+    if not MULTIPROC_DIR:
+        REGISTRY.register(collector)
+
+
+def metrics_response() -> Response:
+    registry = REGISTRY
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _collectors:
+            registry.register(collector)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
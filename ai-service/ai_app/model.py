@@ -25,12 +25,15 @@ class CVModel:
         self._loaded = True
 
     def predict(self, image_bytes: bytes) -> Dict[str, float]:
+        return self.predict_image(Image.open(io.BytesIO(image_bytes)))
+
+    def predict_image(self, image: Image.Image) -> Dict[str, float]:
         if not self._loaded:
             self.load()
         assert self._session is not None
 
         # Preprocess image to model input (example: 224x224 RGB, normalize 0-1)
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB').resize((224, 224))
+        img = image.convert('RGB').resize((224, 224))
         x = np.asarray(img, dtype=np.float32) / 255.0  # HWC
         x = np.transpose(x, (2, 0, 1))  # CHW
         x = np.expand_dims(x, axis=0)   # NCHW
@@ -0,0 +1,108 @@
+"""
+Staged execution for blocking work in the AI service
+
+Blocking work (PIL decode, quality check, enhancement, torch inference) is
+kept off the event loop:
+
+- decode stage: bounded thread pool for decode / quality / enhancement
+- model stage: dedicated executor for inference (one thread by default,
+  torch already parallelises inside a forward)
+
+Each stage has its own queue limit: once the limit is reached, callers wait
+for a free slot instead of piling more work onto the executor.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from . import profiling
+from .metrics import charged
+
+DECODE_WORKERS = int(os.getenv("DERM_DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+DECODE_QUEUE_LIMIT = int(os.getenv("DERM_DECODE_QUEUE_LIMIT", "32"))
+MODEL_WORKERS = int(os.getenv("DERM_MODEL_WORKERS", "1"))
+MODEL_QUEUE_LIMIT = int(os.getenv("DERM_MODEL_QUEUE_LIMIT", "64"))
+
+
+class Stage:
+    """A named executor with a bounded number of queued + running tasks"""
+
+    def __init__(self, name: str, workers: int, queue_limit: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_limit = max(1, queue_limit)
+        self.executor = self._new_executor()
+        self._executor_closed = False
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_stage = 0
+        self._completed = 0
+
+    def _new_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-stage")
+
+    def _slots(self) -> asyncio.Semaphore:
+        # Created lazily so that it binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.queue_limit)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the stage's queue slots (waits while the stage is full)"""
+        async with self._slots():
+            self._in_stage += 1
+            try:
+                yield
+            finally:
+                self._in_stage -= 1
+                self._completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking callable on this stage's executor"""
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            # Thread CPU time of the call is charged to the request that scheduled it;
+            # in profiles the call sits under the caller's stage
+            call = profiling.in_region(functools.partial(fn, *args, **kwargs))
+            return await loop.run_in_executor(self.executor, charged(call))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_stage": self._in_stage,
+            "completed": self._completed,
+        }
+
+    def start(self) -> None:
+        """Fresh executor and queue slots after a shutdown (next app lifespan, e.g. a second TestClient)"""
+        if self._executor_closed:
+            self.executor = self._new_executor()
+            self._executor_closed = False
+        # The semaphore binds to the loop it was first used on
+        self._semaphore = None
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self._executor_closed = True
+
+
+decode_stage = Stage("decode", DECODE_WORKERS, DECODE_QUEUE_LIMIT)
+model_stage = Stage("model", MODEL_WORKERS, MODEL_QUEUE_LIMIT)
+
+
+def pipeline_stats() -> Dict[str, Any]:
+    return {"decode": decode_stage.stats(), "model": model_stage.stats()}
+
+
+def start_pipeline() -> None:
+    decode_stage.start()
+    model_stage.start()
+
+
+def shutdown_pipeline() -> None:
+    decode_stage.shutdown()
+    model_stage.shutdown()
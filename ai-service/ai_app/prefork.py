@@ -0,0 +1,232 @@
+"""
+Pre-fork launcher: load DermLIP once, share its weights across workers
+
+`uvicorn --workers N` (or gunicorn) imports the app in every worker, so each
+worker loads its own copy of the model. Here the master loads the weights
+once, freezes the GC (so collections in the workers do not touch the
+refcount/GC headers of the shared objects and trigger copy-on-write), binds
+the listening socket and forks the workers. Workers only load the cascade
+and warm up in the app lifespan.
+
+    python -m ai_app.prefork                # DERM_WORKERS workers on :8001
+    python -m ai_app.prefork --report       # + RSS/PSS/USS per process once ready
+
+Only the torch backend is preloaded: an ONNX Runtime session owns thread pools
+that do not survive fork, so with DERM_BACKEND=onnx each worker loads its own
+session (the launcher still shares the socket and supervises the workers).
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+PREFORK_WORKERS = int(os.getenv("DERM_WORKERS", "2"))
+PREFORK_HOST = os.getenv("DERM_HOST", "0.0.0.0")
+PREFORK_PORT = int(os.getenv("DERM_PORT", "8001"))
+# Intra-op threads per worker; default splits the cores between the workers
+TORCH_THREADS = int(os.getenv("DERM_TORCH_THREADS", "0"))
+# A worker that dies sooner than this after fork failed to boot: stop instead of respawning
+BOOT_GRACE_SECONDS = 10.0
+
+
+def memory_usage(pid: int) -> Optional[Dict[str, float]]:
+    """RSS / PSS / USS (MB) of one process from /proc/<pid>/smaps_rollup (Linux)"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "uss_mb": round(uss / 1024, 1),
+    }
+
+
+def memory_report(master: int, workers: List[int]) -> Dict:
+    processes = {"master": memory_usage(master)}
+    for i, pid in enumerate(workers):
+        processes[f"worker-{i}"] = memory_usage(pid)
+    known = [m for m in processes.values() if m]
+    return {
+        "processes": processes,
+        # PSS splits shared pages between the processes sharing them: the sum is the real footprint
+        "total_pss_mb": round(sum(m["pss_mb"] for m in known), 1),
+        "total_rss_mb": round(sum(m["rss_mb"] for m in known), 1),
+    }
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(sock: socket.socket, torch_threads: int) -> None:
+    """Worker process body (after fork)"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+
+    import uvicorn
+    from . import main
+
+    config = uvicorn.Config(main.app, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _reset_metrics_dir() -> None:
+    """Multi-process Prometheus metrics: drop the files of a previous run before forking"""
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+
+
+def _metrics_process_dead(pid: int) -> None:
+    """Drop the live gauges (in-flight) of a worker that exited"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+
+
+class Master:
+    """Fork N workers sharing one socket, restart the ones that die"""
+
+    def __init__(self, sock: socket.socket, workers: int, torch_threads: int):
+        self.sock = sock
+        self.workers = max(1, workers)
+        self.torch_threads = torch_threads
+        self.pids: Dict[int, int] = {}  # pid -> slot
+        self.started: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _serve(self.sock, self.torch_threads)
+            except BaseException as e:
+                print(f"⚠️ Worker {slot} failed: {e}", flush=True)
+                code = 1
+            finally:
+                os._exit(code)
+        self.pids[pid] = slot
+        self.started[pid] = time.monotonic()
+        print(f"✅ Worker {slot} started (pid {pid})", flush=True)
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self, report: bool = False) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        if report:
+            self._report_when_ready()
+
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = self.pids.pop(pid, None)
+            started = self.started.pop(pid, 0.0)
+            _metrics_process_dead(pid)
+            if slot is None or self.stopping:
+                continue
+            if time.monotonic() - started < BOOT_GRACE_SECONDS:
+                print(f"⚠️ Worker {slot} (pid {pid}) failed to boot, shutting down", flush=True)
+                self.stop(signal.SIGTERM, None)
+                return 1
+            print(f"⚠️ Worker {slot} (pid {pid}) exited with status {status}, restarting", flush=True)
+            time.sleep(1.0)
+            self.spawn(slot)
+        return 0
+
+    def _report_when_ready(self, timeout: float = 600.0) -> None:
+        """Wait for /ready on the shared port, then print the memory report"""
+        import urllib.request
+
+        host, port = self.sock.getsockname()[:2]
+        url = f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}/ready"
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self.stopping:
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    if response.status == 200:
+                        break
+            except Exception:
+                pass
+            time.sleep(1.0)
+        # /ready answers from one worker: give the others time to finish warmup
+        time.sleep(5.0)
+        print(json.dumps(memory_report(os.getpid(), list(self.pids)), indent=2), flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-fork AI service workers sharing the model weights")
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    parser.add_argument("--host", default=PREFORK_HOST)
+    parser.add_argument("--port", type=int, default=PREFORK_PORT)
+    parser.add_argument("--torch-threads", type=int, default=TORCH_THREADS,
+                        help="intra-op threads per worker (0: cores // workers)")
+    parser.add_argument("--no-preload", action="store_true", help="each worker loads its own model (baseline)")
+    parser.add_argument("--report", action="store_true", help="print RSS/PSS/USS per process once ready")
+    args = parser.parse_args(argv)
+
+    _reset_metrics_dir()
+    from . import main as service
+
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    if args.no_preload:
+        print("⚠️ Preload disabled: every worker loads its own model", flush=True)
+    elif service.DERM_BACKEND != "torch":
+        print(f"⚠️ Backend {service.DERM_BACKEND}: sessions are not fork-safe, every worker loads its own", flush=True)
+    elif service.preload_model():
+        print(f"✅ Weights preloaded in master (load {service.MODEL_STATE['load_seconds']}s)", flush=True)
+
+    # Move everything allocated so far to the permanent generation: the workers' GC
+    # never writes to these objects, so their pages stay shared
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind(args.host, args.port)
+    print(f"✅ Listening on {args.host}:{args.port} with {args.workers} workers", flush=True)
+    return Master(sock, args.workers, torch_threads).run(report=args.report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+"""
+On-demand sampling profiler for live requests (dermasafe_common.profiling)
+
+Off unless DERM_PROFILE_TOKEN is set. Output goes to DERM_PROFILE_DIR every
+DERM_PROFILE_INTERVAL_MS in DERM_PROFILE_FORMATS; triggers and output format
+are described in dermasafe_common.profiling.
+
+Pipeline stages show up as "[stage]" frames (stage_timer on the event loop,
+Stage.run and the micro-batcher on the executor threads). So decode (PIL),
+quality / enhance (OpenCV), encode_image (model forward) and serialization
+(Pydantic) are separate towers even though they run on different threads.
+
+Captures are per process: with the pre-fork launcher each worker profiles its
+own requests.
+"""
+from dermasafe_common.profiling import ProfilingMiddleware, in_region, profiler_from_env, region
+
+__all__ = ["PROFILER", "ProfilingMiddleware", "in_region", "region"]
+
+PROFILER = profiler_from_env("DERM_", "dermasafe-profiles")
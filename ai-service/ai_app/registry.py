@@ -0,0 +1,335 @@
+"""
+Multi-model registry for /analyze
+
+Keeps one or more analyzers (DermLIP ViT, PanDerm, ...) loaded side by side,
+each with its own micro-batcher:
+
+- load + warm a model off the event loop, then install it atomically: requests
+  that already hold the old entry finish on it, new requests see the new one
+- route per request by model key (the default model when none is given)
+- evict idle models in LRU order once the loaded models exceed a memory budget
+
+An entry is only closed (batcher stopped, references dropped) once it is both
+retired (replaced or evicted) and no request is using it.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .batching import MicroBatcher, BATCHING_ENABLED
+
+
+# Memory budget (MB) for all loaded models; 0 disables eviction
+MODEL_MEMORY_MB = float(os.getenv("DERM_MODEL_MEMORY_MB", "0"))
+
+
+class UnknownModelError(KeyError):
+    """Requested model key is not in the registry's specs"""
+
+
+class ModelNotLoadedError(RuntimeError):
+    """Requested model is not loaded (not yet, or evicted); a background load has been started"""
+
+    def __init__(self, key: str):
+        super().__init__(f"Model {key} is not loaded")
+        self.key = key
+
+
+@dataclass(eq=False)
+class ModelEntry:
+    """One loaded analyzer and the state the registry tracks for it"""
+    key: str
+    analyzer: Any
+    batcher: Optional[MicroBatcher]
+    version: str
+    memory_bytes: int
+    load_seconds: float
+    warmup_seconds: float
+    warmup_runs: int
+    last_used: float
+    in_flight: int = 0
+    retired: bool = False
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "backend": getattr(self.analyzer, "backend", None),
+            "precision": getattr(self.analyzer, "precision", None),
+            "memory_mb": round(self.memory_bytes / 2**20, 1),
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_runs": self.warmup_runs,
+            "in_flight": self.in_flight,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+        }
+
+
+class ModelRegistry:
+    """Load, warm, swap and evict analyzers keyed by model name
+
+    Example:
+        >>> registry = ModelRegistry(AVAILABLE_MODELS, "dermlip-vit", loader=_create_analyzer, warmup=_warmup)
+        >>> await registry.load("dermlip-panderm")
+        >>> async with registry.use("dermlip-panderm") as entry:
+        ...     result, features = await entry.batcher.submit(pil_image, top_k=7)
+    """
+
+    def __init__(
+        self,
+        specs: Dict[str, str],
+        default: str,
+        loader: Callable[[str], Any],
+        warmup: Callable[[Any], int],
+        memory_budget_mb: float = MODEL_MEMORY_MB,
+        batching: bool = BATCHING_ENABLED,
+        batch_executor: Optional[Executor] = None,
+        on_retire: Optional[Callable[[ModelEntry, Optional[ModelEntry]], None]] = None,
+    ):
+        if default not in specs:
+            raise UnknownModelError(default)
+        self.specs = dict(specs)
+        self.default = default
+        self.loader = loader
+        self.warmup = warmup
+        self.memory_budget = int(max(0.0, memory_budget_mb) * 2**20)
+        self.batching = batching
+        self.batch_executor = batch_executor
+        self.on_retire = on_retire
+
+        # Least recently used first
+        self._entries: "OrderedDict[str, ModelEntry]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._background: Dict[str, asyncio.Task] = {}
+        self._errors: Dict[str, str] = {}
+        self._retired: List[ModelEntry] = []
+        # Runtime loads get their own thread so they never queue behind inference on the model stage
+        self._load_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-load")
+        self._counters: Dict[str, int] = {"loads": 0, "swaps": 0, "evictions": 0, "load_errors": 0}
+        self.closed = False
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+    def resolve(self, key: Optional[str]) -> str:
+        """Model key of a request (None -> default); UnknownModelError if not registered"""
+        if not key:
+            return self.default
+        key = key.strip().lower()
+        if key not in self.specs:
+            raise UnknownModelError(key)
+        return key
+
+    def get(self, key: str) -> Optional[ModelEntry]:
+        return self._entries.get(key)
+
+    def entries(self) -> List[Tuple[str, ModelEntry]]:
+        return list(self._entries.items())
+
+    def is_loading(self, key: str) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def use(self, key: str, load: bool = False):
+        """Pin the current entry of a model for one request
+
+        A model that is not loaded (never loaded, or evicted since the caller checked) is
+        loaded first when load=True; otherwise a background load is started and
+        ModelNotLoadedError is raised, so the caller can answer 503 instead of guessing.
+        """
+        entry = self._entries.get(key)
+        while entry is None or entry.retired:
+            if not load:
+                self.load_in_background(key)
+                raise ModelNotLoadedError(key)
+            entry = await self.load(key)
+        entry.in_flight += 1
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(key)
+        try:
+            yield entry
+        finally:
+            entry.in_flight -= 1
+            if entry.retired and entry.in_flight == 0:
+                await self._close(entry)
+
+    # ------------------------------------------------------------------
+    # Load / swap / evict
+    # ------------------------------------------------------------------
+    async def load(self, key: str, executor: Optional[Executor] = None) -> ModelEntry:
+        """Load + warm a model unless it is already loaded (concurrent callers share one load)"""
+        key = self.resolve(key)
+        async with self._lock(key):
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = await self._build_and_install(key, None, executor)
+            return entry
+
+    async def reload(self, key: str) -> ModelEntry:
+        """Load a fresh copy (e.g. new weights on disk) and swap it in without dropping requests"""
+        key = self.resolve(key)
+        async with self._lock(key):
+            return await self._build_and_install(key, None, None)
+
+    async def install(self, key: str, analyzer, load_seconds: float = 0.0, executor: Optional[Executor] = None) -> ModelEntry:
+        """Warm an analyzer loaded elsewhere (e.g. pre-fork master) and install it under key"""
+        key = self.resolve(key)
+        async with self._lock(key):
+            return await self._build_and_install(key, (analyzer, load_seconds), executor)
+
+    def load_in_background(self, key: str) -> None:
+        """Start loading a model for a later request (no-op if already loaded or loading)"""
+        key = self.resolve(key)
+        if key in self._entries or key in self._background:
+            return
+        task = asyncio.get_running_loop().create_task(self._load_quietly(key))
+        self._background[key] = task
+        task.add_done_callback(lambda _: self._background.pop(key, None))
+
+    async def set_default(self, key: str) -> ModelEntry:
+        """Make key the default model (loaded and warmed first, so the switch is instant)"""
+        entry = await self.load(key)
+        self.default = entry.key
+        return entry
+
+    async def evict(self, key: str) -> bool:
+        """Unload a model (never the default); in-flight requests finish first"""
+        key = self.resolve(key)
+        if key == self.default:
+            raise ValueError("Không thể gỡ mô hình mặc định")
+        async with self._lock(key):
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self._counters["evictions"] += 1
+            await self._retire(entry, None)
+            return True
+
+    async def close(self) -> None:
+        for task in list(self._background.values()):
+            task.cancel()
+        for entry in list(self._entries.values()) + self._retired:
+            if entry.batcher is not None:
+                await entry.batcher.stop()
+        self._entries.clear()
+        self._retired.clear()
+        self._load_executor.shutdown(wait=False, cancel_futures=True)
+        self.closed = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default": self.default,
+            "available": sorted(self.specs),
+            "memory_budget_mb": round(self.memory_budget / 2**20, 1) if self.memory_budget else None,
+            "memory_used_mb": round(self._memory_used() / 2**20, 1),
+            "loaded": {key: entry.info() for key, entry in self._entries.items()},
+            "loading": sorted(key for key in self.specs if self.is_loading(key)),
+            "retired_in_flight": len(self._retired),
+            "errors": dict(self._errors),
+            **self._counters,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _lock(self, key: str) -> asyncio.Lock:
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    def _build(self, key: str, preloaded) -> ModelEntry:
+        """Blocking: load (unless preloaded) and warm one analyzer"""
+        if preloaded is None:
+            started = time.perf_counter()
+            analyzer = self.loader(key)
+            load_seconds = time.perf_counter() - started
+        else:
+            analyzer, load_seconds = preloaded
+        started = time.perf_counter()
+        try:
+            warmup_runs = self.warmup(analyzer)
+        except Exception as e:
+            print(f"⚠️ Warmup of {key} failed: {e}")
+            warmup_runs = 0
+        batcher = MicroBatcher(analyzer, executor=self.batch_executor) if self.batching else None
+        return ModelEntry(
+            key=key,
+            analyzer=analyzer,
+            batcher=batcher,
+            version=analyzer.model_id,
+            memory_bytes=analyzer.memory_bytes(),
+            load_seconds=round(load_seconds, 3),
+            warmup_seconds=round(time.perf_counter() - started, 3),
+            warmup_runs=warmup_runs,
+            last_used=time.monotonic(),
+        )
+
+    async def _build_and_install(self, key: str, preloaded, executor: Optional[Executor]) -> ModelEntry:
+        loop = asyncio.get_running_loop()
+        try:
+            entry = await loop.run_in_executor(executor or self._load_executor, self._build, key, preloaded)
+        except Exception as e:
+            self._counters["load_errors"] += 1
+            self._errors[key] = str(e)
+            raise
+        self._errors.pop(key, None)
+        self._counters["loads"] += 1
+
+        # Atomic swap: a single dict assignment on the event loop
+        old = self._entries.get(key)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if old is not None:
+            self._counters["swaps"] += 1
+            await self._retire(old, entry)
+        await self._enforce_budget(keep=key)
+        return entry
+
+    async def _load_quietly(self, key: str) -> None:
+        try:
+            await self.load(key)
+        except Exception as e:
+            print(f"⚠️ Không thể tải mô hình {key}: {e}")
+
+    async def _retire(self, entry: ModelEntry, replaced_by: Optional[ModelEntry]) -> None:
+        entry.retired = True
+        if self.on_retire is not None:
+            self.on_retire(entry, replaced_by)
+        if entry.in_flight == 0:
+            await self._close(entry)
+        else:
+            self._retired.append(entry)
+
+    async def _close(self, entry: ModelEntry) -> None:
+        if entry in self._retired:
+            self._retired.remove(entry)
+        if entry.batcher is not None:
+            await entry.batcher.stop()
+        # Drop the last registry reference; the weights are freed once requests release theirs
+        entry.analyzer = None
+        entry.batcher = None
+        print(f"♻️ Model {entry.key} ({entry.version}) unloaded")
+
+    def _memory_used(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values())
+
+    async def _enforce_budget(self, keep: str) -> None:
+        """Evict idle models, least recently used first, until the loaded models fit the budget"""
+        if not self.memory_budget:
+            return
+        while self._memory_used() > self.memory_budget:
+            victim = next(
+                (e for k, e in self._entries.items() if k not in (keep, self.default) and e.in_flight == 0),
+                None,
+            )
+            if victim is None:
+                print(f"⚠️ Model memory {self._memory_used() / 2**20:.0f} MB exceeds budget, nothing idle to evict")
+                return
+            del self._entries[victim.key]
+            self._counters["evictions"] += 1
+            await self._retire(victim, None)
@@ -4,6 +4,7 @@ Smart Capture API endpoint for quality check and guidelines
 from fastapi import APIRouter, UploadFile, File
 from typing import Dict
 from .capture import capture_service
+from .pipeline import decode_stage
 
 router = APIRouter(prefix="/capture", tags=["capture"])
 
@@ -34,4 +35,5 @@ async def check_quality(image: UploadFile = File(...)) -> Dict:
         }
     """
     image_bytes = await image.read()
-    return capture_service.check_quality(image_bytes)
+    # Decode + OpenCV chạy trong thread pool, không chặn event loop
+    return await decode_stage.run(capture_service.check_quality, image_bytes)
@@ -62,6 +62,12 @@ class AnalyzeResult(BaseModel):
         description="Trạng thái nhận diện: detected=phát hiện tổn thương, normal=da bình thường, undetectable=không nhận diện được"
     )
     detection_message: Optional[str] = Field(default=None, description="Thông điệp giải thích cho trạng thái nhận diện")
+    # Tier mô hình đã cho ra điểm ảnh (cascade)
+    model_tier: Optional[Literal["fast", "dermlip", "stub"]] = Field(
+        default=None,
+        description="Tier trả lời: fast=CVModel (ONNX), dermlip=DermatologyAnalyzer, stub=điểm giả lập"
+    )
+    model: Optional[str] = Field(default=None, description="Khóa mô hình DermLIP đã trả lời (khi model_tier=dermlip)")
     
     # Thông tin chi tiết từ dermatology_module
     primary_disease: Optional[DiseaseInfo] = Field(default=None, description="Chẩn đoán chính")
@@ -71,5 +77,11 @@ class AnalyzeResult(BaseModel):
     overall_severity: Optional[str] = Field(default=None, description="Mức độ nghiêm trọng tổng thể")
     recommendations: Optional[List[str]] = Field(default=None, description="Khuyến nghị hành động")
 
+    # Decode ảnh (tùy chọn): kích thước gốc/sau decode, tỉ lệ thu nhỏ và thời gian
+    image_decode: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Thông tin decode: original_size, decoded_size, scale, exif_transposed, decode_ms"
+    )
+
     # Giải thích (tùy chọn): cách mô hình quyết định
     explanations: Optional[Dict[str, Any]] = Field(default=None, description="Giải thích kèm bằng chứng hình ảnh/triệu chứng")
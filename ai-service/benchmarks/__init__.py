@@ -0,0 +1,17 @@
+"""
+Reproducible benchmark suite for the analysis pipeline
+
+Times the analyzer (classify / analyze / batch_analyze), the rule engine
+(adjust_scores / decide_risk / apply_duration_adjustment), the symptom
+validator and smart capture (check_quality / process) on synthetic skin
+images of several resolutions, and writes a JSON report (throughput,
+p50/p95/p99 latency, peak RSS) that can be compared against a stored baseline.
+
+    python -m benchmarks run --out bench.json                 # stub weights, runs offline
+    python -m benchmarks run --engine onnx --weights models/dermlip-onnx
+    python -m benchmarks compare baseline.json bench.json     # exit 1 on regression
+
+Inputs are generated from a fixed seed, and each scenario runs a fixed
+number of iterations after a warmup, so two runs on the same machine and
+configuration do the same work.
+"""
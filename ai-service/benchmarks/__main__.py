@@ -0,0 +1,116 @@
+"""
+python -m benchmarks run [--quick] [--engine ...] [--weights ...] [--out report.json] [--baseline base.json]
+python -m benchmarks compare baseline.json report.json [--threshold 0.15]
+python -m benchmarks imports [--scale 1.0]
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+
+AI_SERVICE_DIR = Path(__file__).resolve().parent.parent
+WORKSPACE_ROOT = AI_SERVICE_DIR.parent
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _compare(baseline: dict, report: dict, threshold: float) -> int:
+    from .compare import compare, format_table
+
+    result = compare(baseline, report, threshold=threshold)
+    print(format_table(result))
+    return 1 if result["regressions"] else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Analysis pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the suite and write a JSON report")
+    run.add_argument("--engine", default="auto", choices=["auto", "stub", "torch", "onnx"],
+                     help="auto: torch if installed, else the numpy stub engine")
+    run.add_argument("--weights", default="stub",
+                     help="stub (random weights, offline), an open_clip model name or an artifact directory")
+    run.add_argument("--quick", action="store_true", help="two resolutions, fewer iterations (CI smoke run)")
+    run.add_argument("--resolutions", help="comma separated WxH list (default: 320x240,640x480,1280x960,4032x3024)")
+    run.add_argument("--iterations", type=int, help="timed calls per scenario (default 30, quick 10)")
+    run.add_argument("--warmup", type=int, help="untimed calls per scenario (default 3, quick 1)")
+    run.add_argument("--batch-size", type=int, default=16)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--threads", type=int, help="intra-op threads (OMP/MKL and torch); pin for stable numbers")
+    run.add_argument("--only", action="append", help="glob of scenario names to run (repeatable)")
+    run.add_argument("--out", help="report path (default: stdout)")
+    run.add_argument("--baseline", help="compare against this report, exit 1 on regression")
+    run.add_argument("--threshold", type=float, default=0.15)
+
+    diff = sub.add_parser("compare", help="compare a report against a baseline, exit 1 on regression")
+    diff.add_argument("baseline")
+    diff.add_argument("report")
+    diff.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown (default 0.15)")
+
+    imports = sub.add_parser("imports", help="check import-time budgets of the lightweight modules, exit 1 on failure")
+    imports.add_argument("--repeat", type=int, default=3, help="fresh interpreters per module (best run counts)")
+    imports.add_argument("--scale", type=float, default=1.0, help="multiply every budget (slow machines)")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        return _compare(_load(args.baseline), _load(args.report), args.threshold)
+    if args.command == "imports":
+        from .imports import check, format_table
+
+        rows = check([str(WORKSPACE_ROOT), str(AI_SERVICE_DIR)], repeat=args.repeat, scale=args.scale)
+        print(format_table(rows))
+        return 0 if all(row["ok"] for row in rows) else 1
+
+    # Thread pools size themselves on import: set the limits first
+    if args.threads:
+        for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            os.environ[name] = str(args.threads)
+    for path in (str(WORKSPACE_ROOT), str(AI_SERVICE_DIR)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    from . import synthetic
+    from .suite import SuiteConfig, run_suite
+
+    if args.threads:
+        try:
+            import torch
+
+            torch.set_num_threads(args.threads)
+        except ImportError:
+            pass
+
+    if args.resolutions:
+        resolutions = synthetic.parse_resolutions(args.resolutions)
+    else:
+        resolutions = synthetic.QUICK_RESOLUTIONS if args.quick else synthetic.RESOLUTIONS
+    config = SuiteConfig(
+        engine=args.engine,
+        weights=args.weights,
+        resolutions=resolutions,
+        iterations=args.iterations or (10 if args.quick else 30),
+        warmup=args.warmup if args.warmup is not None else (1 if args.quick else 3),
+        batch_size=args.batch_size,
+        seed=args.seed,
+        only=args.only,
+    )
+    report = run_suite(config, log=lambda line: print(line, file=sys.stderr))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.baseline:
+        return _compare(_load(args.baseline), report, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
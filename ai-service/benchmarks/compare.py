@@ -0,0 +1,94 @@
+"""
+Compare a benchmark report against a stored baseline
+
+A metric regresses when it is worse than the baseline by more than
+`threshold` (relative) and, for latencies and memory, by more than a small
+absolute floor as well, so sub-millisecond scenarios do not flap on noise.
+"""
+from typing import Any, Dict, List, Tuple
+
+
+# metric -> (higher is better, absolute floor)
+METRICS: Dict[str, Tuple[bool, float]] = {
+    "p50_ms": (False, 0.5),
+    "p95_ms": (False, 1.0),
+    "throughput": (True, 0.0),
+}
+RSS_FLOOR_MB = 10.0
+# Config fields that must match for the numbers to be comparable
+CONFIG_KEYS = ("engine", "weights", "model_id", "precision", "iterations", "batch_size", "seed")
+
+
+def _change(base: float, current: float) -> float:
+    return (current - base) / base if base else 0.0
+
+
+def _regressed(base: float, current: float, higher_is_better: bool, floor: float, threshold: float) -> bool:
+    worse = base - current if higher_is_better else current - base
+    return worse > floor and worse > threshold * abs(base)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.15) -> Dict[str, Any]:
+    """
+    Returns:
+        {"rows": [...], "regressions": [...], "missing": [...], "config_mismatch": {...}}
+        where each row is {"scenario", "metric", "baseline", "current", "change", "regression"}
+    """
+    rows: List[Dict[str, Any]] = []
+    base_scenarios = baseline.get("scenarios", {})
+    current_scenarios = current.get("scenarios", {})
+    for name, base in base_scenarios.items():
+        now = current_scenarios.get(name)
+        if now is None:
+            continue
+        for metric, (higher_is_better, floor) in METRICS.items():
+            if metric not in base or metric not in now:
+                continue
+            rows.append({
+                "scenario": name,
+                "metric": metric,
+                "baseline": base[metric],
+                "current": now[metric],
+                "change": round(_change(base[metric], now[metric]), 4),
+                "regression": _regressed(base[metric], now[metric], higher_is_better, floor, threshold),
+            })
+
+    if baseline.get("peak_rss_mb") and current.get("peak_rss_mb"):
+        base, now = baseline["peak_rss_mb"], current["peak_rss_mb"]
+        rows.append({
+            "scenario": "(run)",
+            "metric": "peak_rss_mb",
+            "baseline": base,
+            "current": now,
+            "change": round(_change(base, now), 4),
+            "regression": _regressed(base, now, False, RSS_FLOOR_MB, threshold),
+        })
+
+    base_config, current_config = baseline.get("config", {}), current.get("config", {})
+    return {
+        "threshold": threshold,
+        "rows": rows,
+        "regressions": [row for row in rows if row["regression"]],
+        "missing": sorted(set(base_scenarios) - set(current_scenarios)),
+        "config_mismatch": {
+            key: {"baseline": base_config.get(key), "current": current_config.get(key)}
+            for key in CONFIG_KEYS
+            if base_config.get(key) != current_config.get(key)
+        },
+    }
+
+
+def format_table(result: Dict[str, Any]) -> str:
+    lines = [f"{'scenario':<40} {'metric':<12} {'baseline':>11} {'current':>11} {'change':>8}"]
+    for row in result["rows"]:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(
+            f"{row['scenario']:<40} {row['metric']:<12} {row['baseline']:>11.3f} {row['current']:>11.3f}"
+            f" {row['change']:>+8.1%}{flag}"
+        )
+    for key, values in result["config_mismatch"].items():
+        lines.append(f"warning: config {key} differs (baseline {values['baseline']!r}, current {values['current']!r})")
+    for name in result["missing"]:
+        lines.append(f"warning: scenario {name} missing from the current report")
+    lines.append(f"{len(result['regressions'])} regression(s) beyond {result['threshold']:.0%}")
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+"""
+Analyzer construction for the benchmark, including offline stub-weights engines
+
+- stub: numpy engine with fixed random weights. Real image loading,
+  preprocessing (resize_crop + BatchBuffer), scoring and result building from
+  BaseDermatologyAnalyzer; the image tower is a random ViT-B/16-shaped patch
+  projection. Needs neither torch nor a download.
+- torch: DermatologyAnalyzer. With --weights stub the DermLIP architecture
+  (open_clip ViT-B-16) is built with seeded random weights, so the forward
+  costs what the real model costs without fetching the checkpoint.
+- onnx: OnnxDermatologyAnalyzer on an exported artifact directory.
+"""
+import importlib.util
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from dermatology_module.base import BaseDermatologyAnalyzer
+from dermatology_module.disease_database import EXTENDED_DISEASES
+from dermatology_module.preprocessing import BatchBuffer, PreprocessConfig, resize_crop
+from dermatology_module.tta import top_k_from_probs
+
+
+ENGINES = ("auto", "stub", "torch", "onnx")
+STUB_WEIGHTS = "stub"
+# open_clip architecture of DermLIP ViT-B/16, built without pretrained weights
+STUB_TORCH_ARCH = "ViT-B-16"
+
+
+class StubAnalyzer(BaseDermatologyAnalyzer):
+    """Numpy engine with fixed random weights (patch projection + mean pooling)"""
+
+    backend = "stub"
+
+    def __init__(
+        self,
+        disease_list: Optional[List[str]] = None,
+        embed_dim: int = 512,
+        patch_size: int = 16,
+        seed: int = 0,
+    ):
+        self.model_name = "stub"
+        self.device = "cpu"
+        self.tta = "off"
+        self.disease_list = list(disease_list or EXTENDED_DISEASES)
+        self.preprocess_config = PreprocessConfig()
+        self._batch_buffer = BatchBuffer(self.preprocess_config)
+        self.patch_size = patch_size
+        self.logit_scale = 100.0
+
+        rng = np.random.default_rng(seed)
+        in_dim = 3 * patch_size * patch_size
+        self.projection = (rng.standard_normal((in_dim, embed_dim)) / np.sqrt(in_dim)).astype(np.float32)
+        text = rng.standard_normal((len(self.disease_list), embed_dim)).astype(np.float32)
+        self.text_features = text / np.linalg.norm(text, axis=-1, keepdims=True)
+        self.weights_version = f"seed{seed}"
+
+    def memory_bytes(self) -> int:
+        return self.projection.nbytes + self.text_features.nbytes
+
+    def _load_image(self, image_input: Union[str, Path, Image.Image]) -> np.ndarray:
+        return resize_crop(self._open_image(image_input), self.preprocess_config)
+
+    def _stack(self, arrays: List[np.ndarray]) -> np.ndarray:
+        return self._batch_buffer.fill(arrays)
+
+    def _encode(self, image_batch: np.ndarray) -> np.ndarray:
+        n, c, h, w = image_batch.shape
+        p = self.patch_size
+        patches = image_batch.reshape(n, c, h // p, p, w // p, p).transpose(0, 2, 4, 1, 3, 5).reshape(n, -1, c * p * p)
+        features = (patches @ self.projection).mean(axis=1)
+        return features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+    def _probabilities(self, image_features: np.ndarray) -> np.ndarray:
+        logits = self.logit_scale * image_features @ self.text_features.T
+        logits -= logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def _top_k(self, probs: np.ndarray, top_k: int) -> List[tuple]:
+        return top_k_from_probs(probs, self.disease_list, top_k)
+
+
+def torch_available() -> bool:
+    return all(importlib.util.find_spec(name) is not None for name in ("torch", "open_clip"))
+
+
+def resolve_engine(engine: str, weights: str) -> str:
+    """auto -> torch when torch/open_clip are installed (or real weights are given), else stub"""
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}, got {engine!r}")
+    if engine != "auto":
+        return engine
+    if weights != STUB_WEIGHTS and Path(weights, "manifest.json").exists():
+        return "onnx"
+    return "torch" if weights != STUB_WEIGHTS or torch_available() else "stub"
+
+
+def make_analyzer(engine: str, weights: str = STUB_WEIGHTS, seed: int = 0) -> BaseDermatologyAnalyzer:
+    """
+    Build the analyzer to benchmark (TTA off by default; the TTA scenario asks for it per call)
+
+    Args:
+        engine: stub / torch / onnx (already resolved)
+        weights: "stub", an open_clip model name, or an artifact directory
+                 (safetensors for torch, ONNX export for onnx)
+    """
+    if engine == "stub":
+        if weights != STUB_WEIGHTS:
+            raise ValueError("the stub engine has no real weights; use --engine torch or onnx")
+        return StubAnalyzer(seed=seed)
+
+    if engine == "onnx":
+        if weights == STUB_WEIGHTS:
+            raise ValueError("the onnx engine needs an exported artifact directory (--weights)")
+        from dermatology_module.onnx_analyzer import OnnxDermatologyAnalyzer
+
+        return OnnxDermatologyAnalyzer(weights, tta="off")
+
+    import torch
+    from dermatology_module.analyzer import DermatologyAnalyzer
+
+    torch.manual_seed(seed)
+    options: Dict[str, Any] = {"device": "cpu", "tta": "off"}
+    if weights == STUB_WEIGHTS:
+        # Random init of the same architecture; text features are computed, not cached
+        return DermatologyAnalyzer(model_name=STUB_TORCH_ARCH, weights_dir="", use_text_cache=False, **options)
+    if os.path.isdir(weights):
+        return DermatologyAnalyzer(weights_dir=weights, **options)
+    return DermatologyAnalyzer(model_name=weights, weights_dir="", **options)
@@ -0,0 +1,88 @@
+"""
+Import-time budgets for the lightweight modules
+
+Each module is imported in a fresh interpreter (best of a few runs). The check
+fails when the import pulls in a model engine (torch, open_clip, onnxruntime)
+or takes longer than its budget, so tools that only need disease_database,
+models.Severity or the rule tables stay cheap to import.
+"""
+import json
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+
+HEAVY_MODULES = ("torch", "open_clip", "onnxruntime")
+
+
+@dataclass(frozen=True)
+class Budget:
+    module: str
+    seconds: float
+
+
+# Wall-clock ceilings sized for a cold CI runner; the heavy-module check is the strict part
+BUDGETS = (
+    Budget("dermatology_module", 0.5),
+    Budget("dermatology_module.models", 0.5),
+    Budget("dermatology_module.disease_database", 0.5),
+    Budget("dermatology_module.config", 0.5),
+    # numpy + PIL, shared by every engine
+    Budget("dermatology_module.base", 1.5),
+    Budget("ai_app.logic.rules", 0.5),
+    Budget("ai_app.logic.symptom_validator", 0.5),
+)
+
+_PROBE = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module: str, paths: Sequence[str]) -> Dict[str, Any]:
+    """Import `module` in a fresh interpreter: {"seconds", "heavy"}"""
+    code = _PROBE.format(paths=list(paths), module=module, heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def check(paths: Sequence[str], budgets: Sequence[Budget] = BUDGETS, repeat: int = 3, scale: float = 1.0) -> List[Dict[str, Any]]:
+    """One row per budget; `ok` is False when a heavy module was imported or the budget was exceeded"""
+    rows = []
+    for budget in budgets:
+        try:
+            runs = [probe(budget.module, paths) for _ in range(max(1, repeat))]
+        except subprocess.CalledProcessError as e:
+            error = (e.stderr.strip().splitlines() or ["import failed"])[-1]
+            rows.append({"module": budget.module, "budget_s": budget.seconds * scale, "ok": False, "error": error})
+            continue
+        seconds = min(run["seconds"] for run in runs)
+        heavy = runs[0]["heavy"]
+        rows.append({
+            "module": budget.module,
+            "seconds": round(seconds, 4),
+            "budget_s": budget.seconds * scale,
+            "heavy": heavy,
+            "ok": not heavy and seconds <= budget.seconds * scale,
+        })
+    return rows
+
+
+def format_table(rows: Sequence[Dict[str, Any]]) -> str:
+    lines = [f"{'module':<38} {'import':>9} {'budget':>8}  result"]
+    for row in rows:
+        if "error" in row:
+            result, seconds = f"FAIL ({row['error']})", "-"
+        else:
+            seconds = f"{row['seconds'] * 1000:.0f}ms"
+            if row["heavy"]:
+                result = f"FAIL (imports {', '.join(row['heavy'])})"
+            else:
+                result = "ok" if row["ok"] else "FAIL (over budget)"
+        lines.append(f"{row['module']:<38} {seconds:>9} {row['budget_s'] * 1000:>6.0f}ms  {result}")
+    return "\n".join(lines)
@@ -0,0 +1,247 @@
+"""
+Scenarios, timing loop and JSON report
+
+Every scenario is a callable doing a fixed amount of work (`items` units per
+call). It is called `warmup` times untimed, then `iterations` times, each
+call timed with perf_counter (wall) and process_time (CPU). Stdout is
+discarded while timing (decide_risk prints debug lines).
+
+Peak RSS is the process high-water mark (ru_maxrss): the per-scenario value is
+the mark once that scenario finished, so it only grows across the run and
+includes the generated inputs.
+"""
+import contextlib
+import gc
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import synthetic
+from .engines import make_analyzer, resolve_engine
+
+
+REPORT_SCHEMA = 1
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class Scenario:
+    name: str
+    fn: Callable[[], Any]
+    items: int = 1
+
+
+@dataclass
+class SuiteConfig:
+    engine: str = "auto"
+    weights: str = "stub"
+    resolutions: Tuple[Tuple[int, int], ...] = synthetic.RESOLUTIONS
+    iterations: int = 30
+    warmup: int = 3
+    batch_size: int = 16
+    seed: int = 0
+    only: Optional[Sequence[str]] = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(scenario: Scenario, iterations: int, warmup: int) -> Dict[str, Any]:
+    """Latency percentiles (ms), CPU per call, throughput (items/s) and RSS mark of one scenario"""
+    gc.collect()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(warmup):
+            scenario.fn()
+        wall = np.empty(iterations)
+        cpu = np.empty(iterations)
+        for i in range(iterations):
+            cpu_started = time.process_time()
+            started = time.perf_counter()
+            scenario.fn()
+            wall[i] = time.perf_counter() - started
+            cpu[i] = time.process_time() - cpu_started
+
+    wall_ms = wall * 1000.0
+    stats = {
+        "items": scenario.items,
+        "iterations": iterations,
+        "mean_ms": round(float(wall_ms.mean()), 3),
+        "min_ms": round(float(wall_ms.min()), 3),
+        "max_ms": round(float(wall_ms.max()), 3),
+    }
+    for q, value in zip(PERCENTILES, np.percentile(wall_ms, PERCENTILES)):
+        stats[f"p{q}_ms"] = round(float(value), 3)
+    stats["cpu_ms"] = round(float(cpu.mean() * 1000.0), 3)
+    stats["throughput"] = round(scenario.items * iterations / float(wall.sum()), 2)
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
+
+
+def _analyzer_scenarios(analyzer, config: SuiteConfig) -> List[Scenario]:
+    scenarios = []
+    for resolution in config.resolutions:
+        image = synthetic.skin_image(*resolution, seed=config.seed)
+        tag = synthetic.label(resolution)
+        scenarios.append(Scenario(f"classify@{tag}", lambda image=image: analyzer.classify(image, top_k=5)))
+        scenarios.append(Scenario(f"analyze@{tag}", lambda image=image: analyzer.analyze(image, top_k=5)))
+
+    # Mid resolution for the multi-image paths
+    resolution = config.resolutions[len(config.resolutions) // 2]
+    tag = synthetic.label(resolution)
+    images = [synthetic.skin_image(*resolution, seed=config.seed + i) for i in range(config.batch_size)]
+    scenarios.append(
+        Scenario(
+            f"batch_analyze@{tag}x{config.batch_size}",
+            lambda: analyzer.batch_analyze(images, batch_size=config.batch_size),
+            items=config.batch_size,
+        )
+    )
+    scenarios.append(Scenario(f"classify_tta@{tag}", lambda: analyzer.classify(images[0], top_k=5, tta="always")))
+    return scenarios
+
+
+def _logic_scenarios() -> List[Scenario]:
+    from ai_app.logic.rules import adjust_scores, apply_duration_adjustment, decide_risk
+    from ai_app.logic.symptom_validator import validate_and_extract_symptoms
+
+    cases = synthetic.RULE_CASES
+    decided = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for scores, symptoms, duration in cases:
+            decided.append((*decide_risk(scores, symptoms, duration), symptoms, duration))
+
+    def run_adjust():
+        for scores, symptoms, _ in cases:
+            adjust_scores(scores, symptoms)
+
+    def run_decide():
+        for scores, symptoms, duration in cases:
+            decide_risk(scores, symptoms, duration)
+
+    def run_duration():
+        for risk, reason, symptoms, duration in decided:
+            apply_duration_adjustment(risk, reason, symptoms, duration)
+
+    def run_validate():
+        for text in synthetic.SYMPTOM_DESCRIPTIONS:
+            validate_and_extract_symptoms(text)
+
+    return [
+        Scenario("rules.adjust_scores", run_adjust, items=len(cases)),
+        Scenario("rules.decide_risk", run_decide, items=len(cases)),
+        Scenario("rules.apply_duration_adjustment", run_duration, items=len(decided)),
+        Scenario("symptoms.validate_and_extract", run_validate, items=len(synthetic.SYMPTOM_DESCRIPTIONS)),
+    ]
+
+
+def _capture_scenarios(config: SuiteConfig) -> Tuple[List[Scenario], Dict[str, str]]:
+    from ai_app.capture import CaptureService
+
+    service = CaptureService()
+    if not service.is_available():
+        # Without OpenCV the service returns canned scores: nothing worth timing
+        return [], {"capture.*": "smart_derma_capture unavailable (opencv-python not installed)"}
+
+    scenarios = []
+    for resolution in config.resolutions:
+        data = synthetic.jpeg_bytes(synthetic.skin_image(*resolution, seed=config.seed))
+        tag = synthetic.label(resolution)
+        scenarios.append(Scenario(f"capture.check_quality@{tag}", lambda data=data: service.check_quality(data)))
+        scenarios.append(Scenario(f"capture.process@{tag}", lambda data=data: service.process(data)))
+    return scenarios, {}
+
+
+def _versions() -> Dict[str, Optional[str]]:
+    versions = {}
+    for name in ("numpy", "PIL", "torch", "open_clip", "onnxruntime", "cv2"):
+        try:
+            versions[name] = getattr(__import__(name), "__version__", "unknown")
+        except ImportError:
+            versions[name] = None
+    return versions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5, cwd=Path(__file__).resolve().parent,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment() -> Dict[str, Any]:
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": _git_commit(),
+        "versions": _versions(),
+        "threads": {name: os.getenv(name) for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS") if os.getenv(name)},
+    }
+    if env["versions"]["torch"]:
+        import torch
+
+        env["threads"]["torch"] = torch.get_num_threads()
+    return env
+
+
+def run_suite(config: SuiteConfig, log: Callable[[str], None] = lambda line: None) -> Dict[str, Any]:
+    """Build the analyzer and inputs, time every selected scenario, return the report"""
+    engine = resolve_engine(config.engine, config.weights)
+    started = time.perf_counter()
+    analyzer = make_analyzer(engine, config.weights, seed=config.seed)
+    init_seconds = time.perf_counter() - started
+    log(f"engine {engine} ({analyzer.model_id}) ready in {init_seconds:.2f}s")
+
+    scenarios = _analyzer_scenarios(analyzer, config) + _logic_scenarios()
+    capture, skipped = _capture_scenarios(config)
+    scenarios += capture
+    if config.only:
+        scenarios = [s for s in scenarios if any(fnmatch(s.name, pattern) for pattern in config.only)]
+
+    report: Dict[str, Any] = {
+        "schema": REPORT_SCHEMA,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "engine": engine,
+            "weights": config.weights,
+            "model_id": analyzer.model_id,
+            "precision": getattr(analyzer, "precision", None),
+            "resolutions": [synthetic.label(r) for r in config.resolutions],
+            "iterations": config.iterations,
+            "warmup": config.warmup,
+            "batch_size": config.batch_size,
+            "seed": config.seed,
+        },
+        "environment": environment(),
+        "engine_init_seconds": round(init_seconds, 3),
+        "inputs_rss_mb": peak_rss_mb(),
+        "scenarios": {},
+        "skipped": skipped,
+    }
+    for scenario in scenarios:
+        stats = measure(scenario, config.iterations, config.warmup)
+        report["scenarios"][scenario.name] = stats
+        log(f"{scenario.name:<40} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  {stats['throughput']:>9.1f}/s")
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
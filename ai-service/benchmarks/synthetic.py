@@ -0,0 +1,85 @@
+"""
+Deterministic synthetic inputs: skin-like images, rule-engine cases, symptom descriptions
+"""
+import io
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+# (width, height): thumbnail, VGA, HD, 12 MP phone photo
+RESOLUTIONS: Tuple[Tuple[int, int], ...] = ((320, 240), (640, 480), (1280, 960), (4032, 3024))
+QUICK_RESOLUTIONS: Tuple[Tuple[int, int], ...] = ((640, 480), (1280, 960))
+
+SKIN_TONES = ((233, 196, 170), (214, 168, 135), (176, 126, 94), (120, 82, 60))
+LESION_TONES = ((92, 58, 44), (150, 70, 70), (60, 40, 36), (190, 110, 100))
+
+
+def parse_resolutions(text: str) -> Tuple[Tuple[int, int], ...]:
+    """"640x480,1280x960" -> ((640, 480), (1280, 960))"""
+    resolutions = []
+    for part in text.split(","):
+        if part.strip():
+            width, _, height = part.strip().lower().partition("x")
+            resolutions.append((int(width), int(height)))
+    if not resolutions:
+        raise ValueError("no resolution given")
+    return tuple(resolutions)
+
+
+def label(resolution: Tuple[int, int]) -> str:
+    return f"{resolution[0]}x{resolution[1]}"
+
+
+def skin_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """
+    RGB image of a lesion on skin: soft ellipse over a skin tone, low-frequency
+    shading and per-pixel grain (so JPEG size and sharpness resemble a photo)
+    """
+    rng = np.random.default_rng(seed)
+    small_w, small_h = max(8, width // 8), max(8, height // 8)
+    yy, xx = np.mgrid[0:small_h, 0:small_w].astype(np.float32)
+    cx, cy = rng.uniform(0.35, 0.65) * small_w, rng.uniform(0.35, 0.65) * small_h
+    rx, ry = rng.uniform(0.08, 0.2) * small_w, rng.uniform(0.08, 0.2) * small_h
+    mask = np.clip(1.5 - ((xx - cx) / rx) ** 2 - ((yy - cy) / ry) ** 2, 0.0, 1.0)[..., None]
+    skin = np.asarray(SKIN_TONES[rng.integers(len(SKIN_TONES))], dtype=np.float32)
+    lesion = np.asarray(LESION_TONES[rng.integers(len(LESION_TONES))], dtype=np.float32)
+    shading = 1.0 - 0.15 * (yy / small_h)[..., None]
+    base = (skin * (1.0 - mask) + lesion * mask) * shading + rng.normal(0.0, 6.0, (small_h, small_w, 3))
+    image = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).resize((width, height), Image.BICUBIC)
+
+    # Grain stays in uint8: clip to [6, 249], shift down, add 0..12
+    pixels = np.clip(np.asarray(image), 6, 249) - np.uint8(6)
+    pixels += rng.integers(0, 13, size=pixels.shape, dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+def jpeg_bytes(image: Image.Image, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# (cv_scores, selected symptoms, duration): one case per rule branch family
+RULE_CASES: List[Tuple[Dict[str, float], List[str], str]] = [
+    ({"melanoma": 0.62, "nevus": 0.21, "seborrheic keratosis": 0.09, "basal cell carcinoma": 0.05}, ["thay đổi", "chảy máu"], "1-3 tháng"),
+    ({"nevus": 0.71, "melanoma": 0.12, "seborrheic keratosis": 0.1, "dermatofibroma": 0.04}, [], "từ khi sinh ra"),
+    ({"eczema": 0.48, "dermatitis": 0.22, "psoriasis": 0.14, "tinea": 0.09}, ["ngứa", "đỏ", "vảy"], "1-4 tuần"),
+    ({"acne": 0.55, "folliculitis": 0.25, "rosacea": 0.12, "impetigo": 0.05}, ["mụn", "mủ", "đau"], "dưới 1 tuần"),
+    ({"cellulitis": 0.41, "urticaria": 0.27, "contact dermatitis": 0.2, "insect bite": 0.08}, ["sưng", "sốt", "lan nhanh"], "dưới 1 tuần"),
+    ({"psoriasis": 0.37, "seborrheic dermatitis": 0.33, "tinea": 0.18, "eczema": 0.09}, ["vảy", "ngứa"], "trên 3 tháng"),
+    ({"basal cell carcinoma": 0.44, "actinic keratosis": 0.31, "squamous cell carcinoma": 0.15, "nevus": 0.06}, ["loét"], "trên 3 tháng"),
+    ({"vitiligo": 0.66, "tinea versicolor": 0.2, "eczema": 0.08, "psoriasis": 0.03}, ["trắng bệch"], "1-3 tháng"),
+]
+
+SYMPTOM_DESCRIPTIONS: List[str] = [
+    "Da tôi bị ngứa và đỏ ở cánh tay, có vảy trắng bong tróc",
+    "Nốt ruồi ở lưng mới xuất hiện, màu đen sẫm và đôi khi chảy máu",
+    "Mụn trứng cá nổi nhiều trên mặt, có mủ vàng và đau khi chạm vào",
+    "Vùng da bị sưng, nóng rát, lan rộng nhanh kèm theo sốt và mệt mỏi",
+    "itchy red patch on my leg with dry flaky skin, spreading slowly",
+    "Tôi có bị ung thư không? Bệnh này là gì?",
+    "con mèo nhà tôi rất đẹp",
+    "da khô ráp, châm chích, tê ở đầu ngón tay",
+]
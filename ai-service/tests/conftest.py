@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+AI_SERVICE_DIR = Path(__file__).resolve().parent.parent
+WORKSPACE_ROOT = AI_SERVICE_DIR.parent
+
+# ai_app, benchmarks and the shared dermatology_module package at the repo root
+for path in (str(WORKSPACE_ROOT), str(AI_SERVICE_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    """create_app() with fake model loads and a temporary job store (tests/fake_service.py)"""
+    from fake_service import install
+
+    return install(monkeypatch, tmp_path)
@@ -0,0 +1,87 @@
+"""create_app() driven by a fake analyzer: no torch, no model download"""
+import asyncio
+import functools
+import io
+import threading
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from ai_app import main
+from ai_app.jobs import JobStore
+from benchmarks.engines import StubAnalyzer
+
+TIMEOUT = 10.0
+
+
+class FakeAnalyzer(StubAnalyzer):
+    """Stub engine whose forward can be held, to keep a request in flight"""
+
+    def __init__(self, seed: int):
+        super().__init__(seed=seed)
+        self.hold = threading.Event()
+        self.hold.set()
+        self.entered = threading.Event()
+
+    def _encode(self, image_batch):
+        self.entered.set()
+        assert self.hold.wait(TIMEOUT), "forward held for too long"
+        return super()._encode(image_batch)
+
+    def block(self) -> None:
+        self.entered.clear()
+        self.hold.clear()
+
+
+class Service:
+    """create_app() whose model loads are fakes; loading waits for `release_load`"""
+
+    def __init__(self):
+        self.loads = []
+        self.release_load = threading.Event()
+        self.release_load.set()
+
+    def create_analyzer(self, key: str = main.DEFAULT_MODEL) -> FakeAnalyzer:
+        assert self.release_load.wait(TIMEOUT), "model load never released"
+        analyzer = FakeAnalyzer(seed=len(self.loads))
+        self.loads.append(analyzer)
+        return analyzer
+
+    def client(self) -> TestClient:
+        return TestClient(main.create_app())
+
+
+def install(monkeypatch, tmp_path) -> Service:
+    """Route model loads and the job store through fakes (see the `service` fixture)"""
+    service = Service()
+    monkeypatch.setattr(main, "_create_analyzer", service.create_analyzer)
+    monkeypatch.setattr(main, "JobStore", functools.partial(JobStore, str(tmp_path / "jobs")))
+    # A closed registry is rebuilt by the lifespan, with the fake loader
+    asyncio.run(main.REGISTRY.close())
+    return service
+
+
+def image_bytes() -> bytes:
+    rng = np.random.default_rng(0)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8), "RGB").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def analyze(client: TestClient):
+    return client.post("/analyze", files={"image": ("skin.png", image_bytes(), "image/png")})
+
+
+def wait_until(predicate, what: str):
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.02)
+    raise AssertionError(f"timed out waiting for {what}")
+
+
+def wait_ready(client: TestClient) -> None:
+    wait_until(lambda: client.get("/ready").status_code == 200, "/ready")
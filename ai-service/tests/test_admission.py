@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_app import admission
+from ai_app.admission import GATED_PATHS, Gate, Overloaded
+from fake_service import TIMEOUT, analyze, wait_ready
+
+
+def test_slot_handed_over_at_timeout_is_kept(monkeypatch):
+    async def scenario():
+        gate = Gate("t", max_in_flight=1, max_queue=1, queue_timeout=5)
+        await gate.acquire()
+
+        async def handoff_then_timeout(waiter, timeout):
+            # release() wins the race against the timeout
+            gate.release()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission.asyncio, "wait_for", handoff_then_timeout)
+        await gate.acquire()
+        assert gate.in_flight == 1
+        gate.release()
+        assert gate.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_rejects_and_frees_the_queue():
+    async def scenario():
+        gate = Gate("t", max_in_flight=1, max_queue=1, queue_timeout=0.01)
+        await gate.acquire()
+        try:
+            await gate.acquire()
+        except Overloaded as e:
+            assert e.reason == "queue_timeout"
+        else:
+            raise AssertionError("expected Overloaded")
+        assert gate.in_flight == 1 and gate.stats()["waiting"] == 0
+        gate.release()
+        assert gate.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_bulk_has_its_own_gate():
+    assert GATED_PATHS["/analyze/bulk"] is not GATED_PATHS["/analyze"]
+
+
+def test_gate_sheds_excess_with_429_and_retry_after(service, monkeypatch):
+    monkeypatch.setitem(admission.GATED_PATHS, "/analyze", Gate("analyze", max_in_flight=1, max_queue=0))
+    with service.client() as client, ThreadPoolExecutor(max_workers=1) as pool:
+        wait_ready(client)
+        analyzer = service.loads[0]
+        analyzer.block()
+        first = pool.submit(analyze, client)
+        assert analyzer.entered.wait(TIMEOUT)
+
+        shed = analyze(client)
+        assert shed.status_code == 429
+        assert int(shed.headers["Retry-After"]) >= 1
+        assert shed.json()["reason"]
+
+        analyzer.hold.set()
+        assert first.result(TIMEOUT).status_code == 200
+        assert analyze(client).status_code == 200
@@ -0,0 +1,97 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from ai_app.batching import MicroBatcher
+
+
+class FakeAnalyzer:
+    """Images are ints: features are filled with the value, negatives fail to load"""
+
+    def __init__(self):
+        self.embed_calls = []
+        self.score_calls = []
+
+    def embed_batch(self, images):
+        self.embed_calls.append(list(images))
+        return [ValueError(f"bad image {i}") if i < 0 else np.full(4, i, dtype=np.float32) for i in images]
+
+    def analyze_features(self, features, top_k=5):
+        self.score_calls.append((len(features), top_k))
+        return [{"value": int(row[0]), "top_k": top_k} for row in features]
+
+
+def _run(batcher, *submissions):
+    """Submit (image, top_k) pairs concurrently; exceptions are returned, not raised"""
+    async def scenario():
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(batcher.submit(image, top_k=k) for image, k in submissions), return_exceptions=True),
+                timeout=5,
+            )
+        finally:
+            await batcher.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_concurrent_submits_share_one_forward():
+    analyzer = FakeAnalyzer()
+    # A full batch flushes at once, long before the window closes
+    batcher = MicroBatcher(analyzer, max_batch_size=4, max_wait_ms=60_000)
+    outputs = _run(batcher, *[(i, 5) for i in range(4)])
+
+    assert analyzer.embed_calls == [[0, 1, 2, 3]]
+    assert analyzer.score_calls == [(4, 5)]
+    for i, (result, features) in enumerate(outputs):
+        assert result["value"] == i
+        np.testing.assert_array_equal(features, np.full(4, i))
+
+    stats = batcher.stats()
+    assert stats["requests"] == 4 and stats["batches"] == 1
+    assert stats["batch_size_histogram"] == {4: 1} and stats["mean_batch_size"] == 4.0
+
+
+def test_a_bad_image_fails_alone():
+    analyzer = FakeAnalyzer()
+    batcher = MicroBatcher(analyzer, max_batch_size=3, max_wait_ms=60_000)
+    good, bad, other = _run(batcher, (1, 5), (-1, 5), (2, 5))
+
+    assert analyzer.embed_calls == [[1, -1, 2]]
+    assert isinstance(bad, ValueError)
+    assert good[0]["value"] == 1 and other[0]["value"] == 2
+    assert batcher.stats()["errors"] == 1
+
+
+def test_window_flushes_a_partial_batch():
+    analyzer = FakeAnalyzer()
+    batcher = MicroBatcher(analyzer, max_batch_size=8, max_wait_ms=20)
+
+    async def scenario():
+        try:
+            first = await asyncio.wait_for(asyncio.gather(batcher.submit(1), batcher.submit(2)), timeout=5)
+            second = await asyncio.wait_for(batcher.submit(3), timeout=5)
+            return first, second
+        finally:
+            await batcher.stop()
+
+    first, second = asyncio.run(scenario())
+    assert [result["value"] for result, _ in first] == [1, 2]
+    assert second[0]["value"] == 3
+    assert analyzer.embed_calls == [[1, 2], [3]]
+
+    stats = batcher.stats()
+    assert stats["batch_size_histogram"] == {1: 1, 2: 1}
+    assert stats["mean_batch_size"] == pytest.approx(1.5)
+    assert sum(stats["queue_wait_histogram"].values()) == 3
+
+
+def test_mixed_top_k_share_the_forward_and_score_per_group():
+    analyzer = FakeAnalyzer()
+    batcher = MicroBatcher(analyzer, max_batch_size=3, max_wait_ms=60_000)
+    outputs = _run(batcher, (1, 3), (2, 7), (3, 3))
+
+    assert analyzer.embed_calls == [[1, 2, 3]]
+    assert sorted(analyzer.score_calls) == [(1, 7), (2, 3)]
+    assert [(result["value"], result["top_k"]) for result, _ in outputs] == [(1, 3), (2, 7), (3, 3)]
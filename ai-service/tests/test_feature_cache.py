@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from ai_app.feature_cache import ImageFeatureCache, ImageKey, content_hash, perceptual_hash
+
+
+def _photo() -> Image.Image:
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:256, 0:256]
+    base = np.stack([x, y, (x + y) // 2], axis=-1) + rng.normal(0, 6, (256, 256, 3))
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+
+
+def _key(image: Image.Image, quality: int) -> ImageKey:
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=quality)
+    decoded = Image.open(io.BytesIO(buf.getvalue()))
+    return ImageKey(namespace="m|raw", sha256=content_hash(buf.getvalue()), phash=perceptual_hash(decoded))
+
+
+def test_near_duplicates_do_not_hit_by_default():
+    cache = ImageFeatureCache(disk_dir=None)
+    photo = _photo()
+    original, recompressed = _key(photo, 95), _key(photo, 70)
+    features = np.ones(4, dtype=np.float32)
+    cache.put(original, features)
+
+    assert not cache.perceptual
+    assert cache.get(recompressed) is None
+    np.testing.assert_array_equal(cache.get(original), features)
+    assert cache.stats()["hits_perceptual"] == 0
+
+
+def test_perceptual_tier_is_opt_in():
+    cache = ImageFeatureCache(phash_max_distance=4, disk_dir=None)
+    photo = _photo()
+    cache.put(_key(photo, 95), np.ones(4, dtype=np.float32))
+
+    assert cache.get(_key(photo, 70)) is not None
+    assert cache.get(_key(photo.transpose(Image.FLIP_LEFT_RIGHT), 95)) is None
+    stats = cache.stats()
+    assert stats["perceptual"] and stats["hits_perceptual"] == 1
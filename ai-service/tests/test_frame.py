@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from ai_app import frame as frame_module
+from ai_app.capture import CaptureService
+from ai_app.frame import ImageFrame
+
+
+def _encode(width: int, height: int, fmt: str = "JPEG") -> bytes:
+    rng = np.random.default_rng(0)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8)).save(buf, fmt)
+    return buf.getvalue()
+
+
+class _RecordingCapture:
+    """SmartCapture stand-in: records what the quality check was given"""
+
+    def __init__(self):
+        self.calls = []
+
+    def check_quality(self, image, scale=1.0):
+        self.calls.append((image.shape[:2], scale))
+        return {"is_acceptable": True, "score": 100, "issues": []}
+
+
+def _service(monkeypatch) -> tuple:
+    capture = _RecordingCapture()
+    service = CaptureService()
+    service.capture = capture
+    monkeypatch.setattr(service, "is_available", lambda: True)
+    return service, capture
+
+
+def test_quality_reuses_the_downscaled_decode(monkeypatch):
+    service, capture = _service(monkeypatch)
+    frame = ImageFrame(_encode(3200, 2400), min_side=512)
+    service.check_quality(frame)
+    assert capture.calls == [((600, 800), 0.25)]
+    assert frame.decode_info["decodes"] == 1
+
+
+def test_quality_only_caller_decodes_once_at_full_size(monkeypatch):
+    service, capture = _service(monkeypatch)
+    opened = []
+    real_open = frame_module.Image.open
+    monkeypatch.setattr(frame_module.Image, "open", lambda fp: opened.append(fp) or real_open(fp))
+    service.check_quality(_encode(3200, 2400))
+    assert capture.calls == [((2400, 3200), 1.0)]
+    assert len(opened) == 1
+
+
+def test_array_frame_has_unit_scale():
+    frame = ImageFrame.from_bgr(np.zeros((10, 10, 3), dtype=np.uint8))
+    assert frame.scale == 1.0 and frame.decode_info is None
+
+
+def test_bgr_is_one_contiguous_read_only_copy():
+    frame = ImageFrame(_encode(64, 48))
+    bgr = frame.bgr
+    assert bgr is frame.bgr
+    assert bgr.flags.c_contiguous and not bgr.flags.writeable
+    np.testing.assert_array_equal(bgr, frame.rgb[..., ::-1])
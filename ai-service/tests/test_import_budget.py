@@ -0,0 +1,67 @@
+"""Lightweight modules must import without the model engines and within their budget"""
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.imports import BUDGETS, HEAVY_MODULES
+
+from conftest import AI_SERVICE_DIR, WORKSPACE_ROOT
+
+_MARKER = "--import-under-test--"
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    prelude = f"import sys; sys.path[:0] = {[str(WORKSPACE_ROOT), str(AI_SERVICE_DIR)]!r}\n"
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", prelude + code], capture_output=True, text=True)
+
+
+def _import_seconds(stderr: str) -> float:
+    """Sum of the top-level cumulative times that -X importtime printed after the marker"""
+    total_us = 0
+    for line in stderr.split(_MARKER, 1)[1].splitlines():
+        # "import time:  self | cumulative | name", nested imports are indented by two more spaces
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name.startswith("   "):
+            total_us += int(cumulative)
+    return total_us / 1e6
+
+
+@pytest.mark.parametrize("budget", BUDGETS, ids=lambda b: b.module)
+def test_import_budget(budget):
+    out = _run(
+        f"sys.stderr.write({_MARKER!r} + '\\n')\n"
+        f"import {budget.module}\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    assert out.returncode == 0, out.stderr[-2000:]
+    assert out.stdout.strip() == "", f"{budget.module} imports {out.stdout.strip()}"
+    seconds = _import_seconds(out.stderr)
+    assert seconds <= budget.seconds, f"{budget.module}: {seconds * 1000:.0f} ms > {budget.seconds * 1000:.0f} ms"
+
+
+def test_analyzer_without_torch_raises_a_clear_import_error():
+    # None in sys.modules makes "import torch" fail as if it were not installed
+    out = _run(
+        "sys.modules['torch'] = None\n"
+        "import dermatology_module\n"
+        "try:\n"
+        "    dermatology_module.DermatologyAnalyzer\n"
+        "except ImportError as e:\n"
+        "    print(e.name, '|', e)\n"
+    )
+    assert out.returncode == 0, out.stderr[-2000:]
+    name, message = out.stdout.strip().split(" | ", 1)
+    assert name == "torch" and "pip install torch" in message
+
+
+def test_broken_lazy_import_is_not_hidden():
+    out = _run(
+        "import dermatology_module\n"
+        "dermatology_module._LAZY_ATTRS['Broken'] = '.does_not_exist'\n"
+        "dermatology_module.Broken\n"
+    )
+    assert out.returncode != 0
+    assert "ModuleNotFoundError" in out.stderr
@@ -0,0 +1,26 @@
+from fake_service import TIMEOUT, image_bytes, wait_ready, wait_until
+
+
+def test_job_lifecycle(service):
+    with service.client() as client:
+        wait_ready(client)
+        analyzer = service.loads[0]
+        analyzer.block()
+
+        submitted = client.post("/jobs", files={"image": ("skin.png", image_bytes(), "image/png")})
+        assert submitted.status_code == 202
+        job_id = submitted.json()["id"]
+        assert submitted.headers["Location"] == f"/jobs/{job_id}"
+
+        assert analyzer.entered.wait(TIMEOUT)
+        pending = client.get(f"/jobs/{job_id}/result")
+        assert pending.status_code == 202 and "Retry-After" in pending.headers
+        assert client.get(f"/jobs/{job_id}").json()["status"] == "running"
+
+        analyzer.hold.set()
+        wait_until(lambda: client.get(f"/jobs/{job_id}").json()["status"] == "succeeded", "job to finish")
+        result = client.get(f"/jobs/{job_id}/result")
+        assert result.status_code == 200 and result.json()["model_tier"] == "dermlip"
+
+        assert client.delete(f"/jobs/{job_id}").status_code == 200
+        assert client.get(f"/jobs/{job_id}").status_code == 404
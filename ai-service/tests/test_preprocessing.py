@@ -0,0 +1,97 @@
+"""The numpy fast path must produce the tensor open_clip's transform would"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from dermatology_module.preprocessing import (
+    BatchBuffer,
+    PreprocessConfig,
+    preprocess_image,
+    resize_crop,
+)
+
+# Portrait, landscape, square, already at size and smaller than the crop
+SIZES = [(300, 500), (640, 360), (256, 256), (224, 224), (120, 90)]
+
+# The fused box resize may round a few pixels one 8-bit level away from
+# resize-then-crop: 1 / (255 * min(std)) ~= 0.015 after normalization
+MAX_ABS_DIFF = 0.02
+MEAN_ABS_DIFF = 1e-4
+
+
+def _image(width: int, height: int) -> Image.Image:
+    """Smooth gradients plus a little noise, deterministic per size"""
+    rng = np.random.default_rng(width * 1000 + height)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width, y / height, (x + y) / (width + height)], axis=-1) * 255
+    noise = rng.normal(0, 8, size=base.shape)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def _reference(image: Image.Image, config: PreprocessConfig) -> np.ndarray:
+    """Resize the shortest side (floored) -> CenterCrop -> /255 -> Normalize, step by step"""
+    out_h, out_w = config.size
+    w, h = image.size
+    requested = min(out_h, out_w)
+    if w <= h:
+        new_w, new_h = requested, int(requested * h / w)
+    else:
+        new_w, new_h = int(requested * w / h), requested
+    resized = image.resize((new_w, new_h), Image.BICUBIC)
+    top = int(round((new_h - out_h) / 2.0))
+    left = int(round((new_w - out_w) / 2.0))
+    cropped = np.asarray(resized.crop((left, top, left + out_w, top + out_h)), dtype=np.float32) / 255.0
+    mean = np.asarray(config.mean, dtype=np.float32)
+    std = np.asarray(config.std, dtype=np.float32)
+    return ((cropped - mean) / std).transpose(2, 0, 1)
+
+
+def _assert_close(actual: np.ndarray, expected: np.ndarray):
+    assert actual.shape == expected.shape
+    diff = np.abs(actual - expected)
+    assert diff.max() <= MAX_ABS_DIFF, f"max abs diff {diff.max():.4f}"
+    assert diff.mean() <= MEAN_ABS_DIFF, f"mean abs diff {diff.mean():.5f}"
+
+
+@pytest.mark.parametrize("size", SIZES, ids=lambda s: f"{s[0]}x{s[1]}")
+def test_resize_crop_matches_reference(size):
+    config = PreprocessConfig()
+    image = _image(*size)
+    array = resize_crop(image, config)
+    assert array.shape == (*config.size, 3) and array.dtype == np.uint8
+    _assert_close(preprocess_image(image, config), _reference(image, config))
+
+
+def test_batch_buffer_matches_preprocess_image():
+    config = PreprocessConfig()
+    images = [_image(*size) for size in SIZES]
+    batch = BatchBuffer(config).fill([resize_crop(image, config) for image in images])
+    expected = np.stack([preprocess_image(image, config) for image in images])
+    assert batch.shape == (len(images), 3, *config.size)
+    np.testing.assert_allclose(batch, expected, rtol=0, atol=1e-6)
+
+
+def test_squash_mode_ignores_aspect_ratio():
+    config = PreprocessConfig(resize_mode="squash")
+    image = _image(640, 360)
+    expected = np.asarray(image.resize((224, 224), Image.BICUBIC))
+    np.testing.assert_array_equal(resize_crop(image, config), expected)
+
+
+def test_batch_buffer_matches_open_clip_transform():
+    pytest.importorskip("torch")
+    open_clip_transform = pytest.importorskip("open_clip.transform")
+
+    config = PreprocessConfig()
+    transform = open_clip_transform.image_transform(
+        config.size,
+        is_train=False,
+        mean=config.mean,
+        std=config.std,
+        resize_mode=config.resize_mode,
+        interpolation=config.interpolation,
+    )
+    images = [_image(*size) for size in SIZES]
+    expected = np.stack([transform(image).numpy() for image in images])
+    fast = BatchBuffer(config).fill([resize_crop(image, config) for image in images])
+    _assert_close(fast, expected)
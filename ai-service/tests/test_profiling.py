@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+from dermasafe_common.cputime import CpuAccount, Metered
+from dermasafe_common.profiling import Capture, Profiler, profiler_from_env, region
+
+
+def _spin(seconds: float) -> None:
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        pass
+
+
+def test_metered_charges_only_the_coroutine_own_steps():
+    async def request():
+        _spin(0.02)
+        await asyncio.sleep(0.05)
+
+    async def other():
+        await asyncio.sleep(0.01)
+        _spin(0.1)
+
+    async def scenario():
+        account = CpuAccount()
+        await asyncio.gather(Metered(request(), account), other())
+        return account.seconds
+
+    charged = asyncio.run(scenario())
+    assert 0.015 < charged < 0.08
+
+
+def test_capture_writes_region_frames(tmp_path):
+    profiler = Profiler(token="t", directory=str(tmp_path), interval_ms=1)
+    capture = Capture("test")
+    profiler.start(capture)
+    with region("work"):
+        _spin(0.05)
+    capture.close()
+    deadline = time.monotonic() + 5
+    while not profiler.recent and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    entry = profiler.recent[-1]
+    folded = next(path for path in entry["paths"] if path.endswith(".folded"))
+    with open(folded, encoding="utf-8") as f:
+        assert "[work]" in f.read()
+
+
+def test_profiler_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("X_PROFILE_TOKEN", "secret")
+    monkeypatch.setenv("X_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("X_PROFILE_FORMATS", "collapsed")
+    profiler = profiler_from_env("X_", "unused")
+    assert profiler.authorized("secret") and not profiler.authorized("nope")
+    assert profiler.directory == str(tmp_path) and profiler.formats == ("collapsed",)
+    assert not profiler_from_env("UNSET_", "unused").enabled
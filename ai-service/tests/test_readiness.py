@@ -0,0 +1,16 @@
+from fake_service import analyze, wait_ready
+
+
+def test_ready_turns_200_once_the_model_is_warm(service):
+    service.release_load.clear()
+    with service.client() as client:
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "loading"
+        assert client.get("/health").status_code == 200
+
+        service.release_load.set()
+        wait_ready(client)
+        body = client.get("/ready").json()
+        assert body["ready"] is True and body["warmup_runs"] > 0
+        assert analyze(client).json()["model_tier"] == "dermlip"
@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_app import main
+from fake_service import TIMEOUT, analyze, wait_ready, wait_until
+
+
+def test_hot_swap_keeps_the_request_in_flight_on_the_old_model(service):
+    with service.client() as client, ThreadPoolExecutor(max_workers=1) as pool:
+        wait_ready(client)
+        key = main.DEFAULT_MODEL
+        old = service.loads[0]
+        old_version = client.get("/models").json()["loaded"][key]["version"]
+        old.block()
+        in_flight = pool.submit(analyze, client)
+        assert old.entered.wait(TIMEOUT)
+
+        swapped = client.post(f"/models/{key}/reload")
+        assert swapped.status_code == 200
+        assert swapped.json()["version"] != old_version
+        models = client.get("/models").json()
+        assert models["swaps"] == 1 and models["retired_in_flight"] == 1
+
+        old.hold.set()
+        response = in_flight.result(TIMEOUT)
+        assert response.status_code == 200 and response.json()["model"] == key
+        wait_until(lambda: client.get("/models").json()["retired_in_flight"] == 0, "old model to unload")
+
+        new = service.loads[1]
+        new.entered.clear()
+        assert analyze(client).status_code == 200
+        assert new.entered.is_set()
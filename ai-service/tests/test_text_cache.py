@@ -0,0 +1,19 @@
+import numpy as np
+
+from dermatology_module import text_cache
+from dermatology_module.text_cache import load_text_features, save_text_features
+
+
+def test_save_then_load_roundtrip(tmp_path):
+    features = np.eye(3, 4, dtype=np.float32)
+    assert save_text_features(tmp_path, "k" * 64, features, {"model_name": "m"}) is not None
+    np.testing.assert_array_equal(load_text_features(tmp_path, "k" * 64), features)
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(text_cache.os, "replace", failing_replace)
+    assert save_text_features(tmp_path, "k" * 64, np.zeros((2, 4), dtype=np.float32), {}) is None
+    assert list(tmp_path.iterdir()) == []
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
@@ -6,10 +6,13 @@ import httpx
 import os
 import json
 import logging
+from typing import Optional
 
 from .database import get_db
 from .models import AnalysisRecord
 from .schemas import AnalyzeResult
+from .metrics import MetricsMiddleware, metrics_response, upstream_client
+from .profiling import PROFILER, ProfilingMiddleware
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -17,6 +20,8 @@ logger = logging.getLogger(__name__)
 AI_SERVICE_URL = os.getenv("AI_SERVICE_URL", "http://localhost:8001")
 CHATBOT_SERVICE_URL = os.getenv("CHATBOT_SERVICE_URL", "http://localhost:8002")
 ALLOW_ORIGINS = os.getenv("ALLOW_ORIGINS", "*")
+# Uploading a large bulk archive to /jobs may take longer than the 30 s used elsewhere
+JOB_UPLOAD_TIMEOUT = float(os.getenv("JOB_UPLOAD_TIMEOUT", "300"))
 
 app = FastAPI(title="DermaSafe-Backend API", version="0.2.0")
 
@@ -29,12 +34,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# On-demand sampling profiler (PROFILE_TOKEN), see /admin/profile
+app.add_middleware(ProfilingMiddleware, profiler=PROFILER)
+
+# Latency, in-flight and CPU time per route, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
 
 @app.get("/health", tags=["health"]) 
 async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", tags=["health"])
+async def metrics():
+    """Prometheus metrics: request latency / CPU per route, upstream call latency, in-flight"""
+    return metrics_response()
+
+
+def _check_profile_token(request: Request) -> None:
+    if not PROFILER.enabled:
+        raise HTTPException(status_code=404, detail="Profiler disabled (PROFILE_TOKEN is not set)")
+    if not PROFILER.authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Missing or wrong X-Profile-Token")
+
+
+@app.get("/admin/profile", tags=["health"])
+async def profile_status(request: Request):
+    """Sampling profiler: running captures, armed request budget, recently written files"""
+    _check_profile_token(request)
+    return PROFILER.stats()
+
+
+@app.post("/admin/profile", tags=["health"])
+async def profile_arm(
+    request: Request,
+    requests: Optional[int] = None,
+    seconds: Optional[float] = None,
+    path: Optional[str] = None,
+):
+    """Profile the next N requests (optionally under a path prefix) or everything for T seconds"""
+    _check_profile_token(request)
+    try:
+        return PROFILER.arm(requests=requests, seconds=seconds, path=path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.post("/api/v1/analyze", response_model=AnalyzeResult, tags=["analyze"]) 
 async def analyze(
     image: UploadFile = File(...),
@@ -47,7 +93,7 @@ async def analyze(
     # Proxy the request to AI service
     # Proxy the request to AI service with robust error handling
     try:
-        async with httpx.AsyncClient(base_url=AI_SERVICE_URL, timeout=30.0) as client:
+        async with upstream_client("ai-service", "/analyze", base_url=AI_SERVICE_URL, timeout=30.0) as client:
             files = {"image": (image.filename, await image.read(), image.content_type or "application/octet-stream")}
             data = {"enhance": str(enhance).lower()}
             if symptoms_json is not None:
@@ -68,7 +114,7 @@ async def analyze(
         logger.error(f"AI service returned HTTP error {e.response.status_code}: {detail}")
         # If upstream 5xx, return 502 Bad Gateway; else return upstream status
         status_code = 502 if 500 <= e.response.status_code < 600 else e.response.status_code
-        raise HTTPException(status_code=status_code, detail={"ai_service_error": detail})
+        raise HTTPException(status_code=status_code, detail={"ai_service_error": detail}, headers=_retry_after(e.response))
     except httpx.RequestError as e:
         logger.error(f"Error connecting to AI service: {e}")
         raise HTTPException(status_code=502, detail="Failed to connect to AI service")
@@ -101,12 +147,90 @@ async def analyze(
     return JSONResponse(result)
 
 
+def _retry_after(response: httpx.Response) -> dict | None:
+    """Retry-After of an upstream 429/503, to pass on to the client"""
+    value = response.headers.get("retry-after")
+    return {"Retry-After": value} if value else None
+
+
+def _job_links(job: dict) -> dict:
+    """Point the status/result links of an AI service job at this API"""
+    if "id" in job and "kind" in job:
+        job["status_url"] = f"/api/v1/jobs/{job['id']}"
+        job["result_url"] = f"/api/v1/jobs/{job['id']}/result"
+    return job
+
+
+async def _forward_job_call(method: str, path: str, endpoint: str, timeout: httpx.Timeout, **kwargs) -> JSONResponse:
+    """Call an AI service /jobs endpoint and pass its status code, body and Retry-After through"""
+    try:
+        async with upstream_client("ai-service", endpoint, base_url=AI_SERVICE_URL, timeout=timeout) as client:
+            r = await client.request(method, path, **kwargs)
+    except httpx.RequestError as e:
+        logger.error(f"Error connecting to AI service: {e}")
+        raise HTTPException(status_code=502, detail="Failed to connect to AI service")
+    try:
+        content = r.json()
+    except ValueError:
+        content = {"detail": r.text}
+    if r.status_code >= 500 and r.status_code != 503 and not (isinstance(content, dict) and "status" in content):
+        # Upstream crashed (not a failed job or a full queue) -> 502 like /api/v1/analyze
+        logger.error(f"AI service returned HTTP error {r.status_code}: {content}")
+        raise HTTPException(status_code=502, detail={"ai_service_error": content})
+    headers = _retry_after(r) or {}
+    if isinstance(content, dict):
+        content = _job_links(content)
+        if "location" in r.headers and "id" in content:
+            headers["Location"] = content["status_url"]
+    return JSONResponse(status_code=r.status_code, content=content, headers=headers)
+
+
+@app.post("/api/v1/jobs", tags=["jobs"])
+async def submit_job(request: Request):
+    """
+    Queue an analysis on the AI service and return its job id right away
+
+    Same multipart fields as /api/v1/analyze (single image) or the AI service's
+    /analyze/bulk (archive / images + manifest). The body is streamed through
+    unchanged; poll /api/v1/jobs/{id} and fetch /api/v1/jobs/{id}/result.
+    """
+    return await _forward_job_call(
+        "POST",
+        "/jobs",
+        "/jobs",
+        httpx.Timeout(30.0, write=JOB_UPLOAD_TIMEOUT),
+        content=request.stream(),
+        headers={"content-type": request.headers.get("content-type", "")},
+    )
+
+
+@app.get("/api/v1/jobs/{job_id}", tags=["jobs"])
+async def job_status(job_id: str):
+    """Job status and progress (queued / running / succeeded / failed / cancelled)"""
+    return await _forward_job_call("GET", f"/jobs/{job_id}", "/jobs/{job_id}", httpx.Timeout(10.0))
+
+
+@app.get("/api/v1/jobs/{job_id}/result", tags=["jobs"])
+async def job_result(job_id: str):
+    """Job result (200), or 202 + Retry-After while it is still queued or running"""
+    return await _forward_job_call("GET", f"/jobs/{job_id}/result", "/jobs/{job_id}/result", httpx.Timeout(30.0))
+
+
+@app.delete("/api/v1/jobs/{job_id}", tags=["jobs"])
+async def cancel_job(job_id: str):
+    """Cancel a pending job or delete a finished one"""
+    return await _forward_job_call("DELETE", f"/jobs/{job_id}", "/jobs/{job_id}", httpx.Timeout(10.0))
+
+
 @app.post("/api/v1/capture/check-quality", tags=["capture"])
 async def check_quality(image: UploadFile = File(...)):
     """Proxy quality check to AI service"""
-    async with httpx.AsyncClient(base_url=AI_SERVICE_URL, timeout=10.0) as client:
+    async with upstream_client("ai-service", "/capture/check-quality", base_url=AI_SERVICE_URL, timeout=10.0) as client:
         files = {"image": (image.filename, await image.read(), image.content_type or "application/octet-stream")}
         r = await client.post("/capture/check-quality", files=files)
+        if r.status_code == 429:
+            # Preview traffic shed by the AI service: the client should just skip this frame
+            raise HTTPException(status_code=429, detail=r.json().get("detail"), headers=_retry_after(r))
         r.raise_for_status()
         return r.json()
 
@@ -114,7 +238,7 @@ async def check_quality(image: UploadFile = File(...)):
 @app.get("/api/v1/capture/tips", tags=["capture"])
 async def get_tips():
     """Proxy capture tips to AI service"""
-    async with httpx.AsyncClient(base_url=AI_SERVICE_URL, timeout=5.0) as client:
+    async with upstream_client("ai-service", "/capture/tips", base_url=AI_SERVICE_URL, timeout=5.0) as client:
         r = await client.get("/capture/tips")
         r.raise_for_status()
         return r.json()
@@ -152,7 +276,7 @@ async def chat(request: dict):
     
     chatbot_url = CHATBOT_SERVICE_URL + "/chat"
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with upstream_client("chatbot", "/chat", timeout=30.0) as client:
         try:
             logger.info(f"Sending to chatbot: {chatbot_url}")
             r = await client.post(chatbot_url, json=chatbot_request)
@@ -172,7 +296,7 @@ async def chat(request: dict):
 @app.get("/api/v1/chat/history/{session_id}", tags=["chatbot"])
 async def get_chat_history(session_id: str):
     """Get chat history for a session"""
-    async with httpx.AsyncClient(base_url=CHATBOT_SERVICE_URL, timeout=10.0) as client:
+    async with upstream_client("chatbot", "/chat/history/{session_id}", base_url=CHATBOT_SERVICE_URL, timeout=10.0) as client:
         r = await client.get(f"/chat/history/{session_id}")
         r.raise_for_status()
         return r.json()
@@ -181,7 +305,7 @@ async def get_chat_history(session_id: str):
 @app.delete("/api/v1/chat/history/{session_id}", tags=["chatbot"])
 async def clear_chat_history(session_id: str):
     """Clear chat history for a session"""
-    async with httpx.AsyncClient(base_url=CHATBOT_SERVICE_URL, timeout=10.0) as client:
+    async with upstream_client("chatbot", "/chat/history/{session_id}", base_url=CHATBOT_SERVICE_URL, timeout=10.0) as client:
         r = await client.delete(f"/chat/history/{session_id}")
         r.raise_for_status()
         return r.json()
@@ -231,7 +355,7 @@ If not symptoms (spam, unrelated), return JSON with funny response:
         "analysis_context": None
     }
     
-    async with httpx.AsyncClient(base_url=CHATBOT_SERVICE_URL, timeout=30.0) as client:
+    async with upstream_client("chatbot", "/chat", base_url=CHATBOT_SERVICE_URL, timeout=30.0) as client:
         r = await client.post("/chat", json=chat_request)
         r.raise_for_status()
         response_data = r.json()
@@ -0,0 +1,119 @@
+"""
+Prometheus metrics for the backend API (GET /metrics)
+
+- backend_request_seconds / backend_requests_in_flight: per route (path template)
+- backend_request_cpu_seconds: CPU time of the request's own steps on the event loop
+- backend_upstream_seconds: calls to the AI and chatbot services, until the
+  response headers arrive (status "error" when the call fails outright)
+"""
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+from starlette.routing import Match
+
+from dermasafe_common.cputime import CpuAccount, Metered
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CPU_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+REQUEST_SECONDS = Histogram(
+    "backend_request_seconds", "Request latency", ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUEST_CPU_SECONDS = Histogram(
+    "backend_request_cpu_seconds", "CPU time of one request on the event loop", ["route"], buckets=CPU_BUCKETS
+)
+IN_FLIGHT = Gauge("backend_requests_in_flight", "Requests being handled", ["route"])
+UPSTREAM_SECONDS = Histogram(
+    "backend_upstream_seconds",
+    "Latency of calls to the AI / chatbot services",
+    ["service", "method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+# service -> factory of the transport its calls go through (default: HTTP)
+_transports: Dict[str, Callable[[], httpx.AsyncBaseTransport]] = {}
+
+
+def set_upstream_transport(service: str, factory: Optional[Callable[[], httpx.AsyncBaseTransport]]) -> None:
+    """Send a service's calls through another transport (e.g. in-process stand-ins); None restores HTTP"""
+    if factory is None:
+        _transports.pop(service, None)
+    else:
+        _transports[service] = factory
+
+
+class _TimedTransport(httpx.AsyncBaseTransport):
+    """Observe every upstream call under a fixed (service, endpoint) label pair"""
+
+    def __init__(self, service: str, endpoint: str, inner: httpx.AsyncBaseTransport):
+        self.service = service
+        self.endpoint = endpoint
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.inner.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            UPSTREAM_SECONDS.labels(self.service, request.method, self.endpoint, status).observe(
+                time.perf_counter() - started
+            )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def upstream_client(service: str, endpoint: str, **kwargs) -> httpx.AsyncClient:
+    """httpx.AsyncClient whose calls are timed; endpoint is the path template (e.g. /jobs/{job_id})"""
+    inner = _transports.get(service, httpx.AsyncHTTPTransport)()
+    return httpx.AsyncClient(transport=_TimedTransport(service, endpoint, inner), **kwargs)
+
+
+def _route(scope) -> str:
+    for route in getattr(scope.get("app"), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: latency, in-flight and CPU time per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = _route(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        account = CpuAccount()
+        gauge = IN_FLIGHT.labels(route=route)
+        gauge.inc()
+        started = time.perf_counter()
+        try:
+            await Metered(self.app(scope, receive, send_wrapper), account)
+        finally:
+            gauge.dec()
+            REQUEST_SECONDS.labels(scope["method"], route, str(status["code"])).observe(time.perf_counter() - started)
+            REQUEST_CPU_SECONDS.labels(route=route).observe(account.seconds)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,13 @@
+"""
+On-demand sampling profiler for the backend API (dermasafe_common.profiling)
+
+Off unless PROFILE_TOKEN is set; output goes to PROFILE_DIR (default
+<tmp>/dermasafe-backend-profiles), see PROFILE_INTERVAL_MS / PROFILE_FORMATS.
+POST /admin/profile?requests=N&path=/api/v1/analyze profiles the next N
+analyses.
+"""
+from dermasafe_common.profiling import ProfilingMiddleware, profiler_from_env
+
+__all__ = ["PROFILER", "ProfilingMiddleware"]
+
+PROFILER = profiler_from_env("", "dermasafe-backend-profiles")
@@ -0,0 +1,82 @@
+"""
+python -m loadtest [--rps N] [--duration S] [--mix analyze=6,chat=2] [--ai-latency SPEC] [--out report.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from pathlib import Path
+
+from .harness import DEFAULT_MIX, HarnessConfig, run_harness
+from .stubs import Profile
+
+
+def _print_table(report: dict) -> None:
+    header = f"{'scenario':<16} {'count':>7} {'rps':>8} {'err%':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+    print(header, file=sys.stderr)
+    rows = list(report["scenarios"].items()) + [("TOTAL", report["total"])]
+    for name, s in rows:
+        print(
+            f"{name:<16} {s['count']:>7} {s['rps']:>8.1f} {s['error_rate'] * 100:>6.2f}%"
+            f" {s.get('p50_ms', 0):>7.1f}ms {s.get('p95_ms', 0):>7.1f}ms {s.get('p99_ms', 0):>7.1f}ms {s.get('max_ms', 0):>7.1f}ms",
+            file=sys.stderr,
+        )
+    errors = {k: v for k, v in report["total"]["outcomes"].items() if not k.startswith("2")}
+    if errors:
+        print(f"errors: {errors}", file=sys.stderr)
+    if report["total"]["dropped"]:
+        print(f"dropped (max in flight reached): {report['total']['dropped']}", file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description="In-process load test of the backend API")
+    parser.add_argument("--rps", type=float, default=50.0, help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the measurement")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="arrivals beyond this are dropped")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="scenario weights: analyze, check_quality, chat, chat_history, tips")
+    parser.add_argument("--ai-latency", default="lognormal:150:600",
+                        help="AI service latency (ms): const:X, uniform:LO:HI, exp:MEAN, lognormal:MEDIAN:P99")
+    parser.add_argument("--ai-errors", help='AI service errors, e.g. "0.01:503,0.005:429,0.001:conn,0.001:timeout"')
+    parser.add_argument("--chat-latency", default="lognormal:800:3000", help="chatbot latency (ms)")
+    parser.add_argument("--chat-errors", help="chatbot errors")
+    parser.add_argument("--database-url", help="default: a fresh SQLite file (or DATABASE_URL if set)")
+    parser.add_argument("--image-kb", type=int, default=200, help="size of the /analyze upload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--verbose", action="store_true", help="keep the backend's error logs")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # Injected upstream errors would otherwise log one line each
+        logging.getLogger("backend_app").setLevel(logging.CRITICAL)
+
+    config = HarnessConfig(
+        rps=args.rps,
+        duration=args.duration,
+        warmup=args.warmup,
+        max_in_flight=args.max_in_flight,
+        arrival=args.arrival,
+        mix=args.mix,
+        ai=Profile(args.ai_latency, args.ai_errors, seed=args.seed),
+        chatbot=Profile(args.chat_latency, args.chat_errors, seed=args.seed + 1),
+        database_url=args.database_url,
+        image_kb=args.image_kb,
+        seed=args.seed,
+    )
+    report = asyncio.run(run_harness(config, progress=lambda line: print(line, file=sys.stderr)))
+    _print_table(report)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
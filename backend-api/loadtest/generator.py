@@ -0,0 +1,161 @@
+"""
+Open-loop asyncio load generator
+
+Requests are started on a fixed schedule (constant or Poisson arrivals at the
+target RPS) whether or not earlier ones have finished, and latency is
+measured from the scheduled start, so a slow server shows up as latency
+instead of silently lowering the offered load. A cap on requests in flight
+protects the harness itself; arrivals over the cap are counted as dropped.
+"""
+import asyncio
+import random
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import httpx
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+@dataclass
+class Scenario:
+    name: str
+    weight: float
+    # (client, sequence number) -> response
+    send: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100.0
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+class Recorder:
+    """Latency samples and outcomes per scenario"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.outcomes: Dict[str, Counter] = {}
+        self.dropped: Counter = Counter()
+        self.start_lag: List[float] = []
+
+    def record(self, name: str, latency: float, outcome: str) -> None:
+        self.latencies.setdefault(name, []).append(latency)
+        self.outcomes.setdefault(name, Counter())[outcome] += 1
+
+    @staticmethod
+    def _summary(latencies: List[float], outcomes: Counter, dropped: int, seconds: float) -> Dict[str, Any]:
+        count = sum(outcomes.values())
+        ok = sum(n for outcome, n in outcomes.items() if outcome.startswith("2"))
+        ms = sorted(value * 1000.0 for value in latencies)
+        summary: Dict[str, Any] = {
+            "count": count,
+            "ok": ok,
+            "errors": count - ok,
+            "error_rate": round((count - ok) / count, 4) if count else 0.0,
+            "dropped": dropped,
+            "rps": round(count / seconds, 2) if seconds else 0.0,
+            "outcomes": dict(sorted(outcomes.items())),
+        }
+        if ms:
+            summary["mean_ms"] = round(sum(ms) / len(ms), 2)
+            for q in PERCENTILES:
+                summary[f"p{q}_ms"] = round(percentile(ms, q), 2)
+            summary["max_ms"] = round(ms[-1], 2)
+        return summary
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        names = sorted(set(self.latencies) | set(self.dropped))
+        total_outcomes: Counter = Counter()
+        for name in names:
+            total_outcomes.update(self.outcomes.get(name, Counter()))
+        lag = sorted(value * 1000.0 for value in self.start_lag)
+        return {
+            "total": self._summary(
+                [value for name in names for value in self.latencies.get(name, [])],
+                total_outcomes, sum(self.dropped.values()), seconds,
+            ),
+            "scenarios": {
+                name: self._summary(self.latencies.get(name, []), self.outcomes.get(name, Counter()), self.dropped[name], seconds)
+                for name in names
+            },
+            # How late the generator started requests: large values mean the harness itself is saturated
+            "start_lag_ms": {f"p{q}": round(percentile(lag, q), 2) for q in (50, 99)} if lag else {},
+        }
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    scenarios: Sequence[Scenario],
+    rps: float,
+    duration: float,
+    warmup: float = 0.0,
+    max_in_flight: int = 1000,
+    arrival: str = "constant",
+    seed: int = 0,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Offer `rps` requests per second for warmup + duration seconds
+
+    Only requests scheduled after the warmup are recorded. Outcomes are the
+    HTTP status ("200", "502", ...) or the client exception name.
+    """
+    if rps <= 0:
+        raise ValueError("rps must be positive")
+    if arrival not in ("constant", "poisson"):
+        raise ValueError("arrival must be 'constant' or 'poisson'")
+    rng = random.Random(seed)
+    weights = [s.weight for s in scenarios]
+    recorder = Recorder()
+    loop = asyncio.get_running_loop()
+    in_flight: set = set()
+
+    async def one(scenario: Scenario, sequence: int, scheduled: float, measured: bool) -> None:
+        if measured:
+            recorder.start_lag.append(loop.time() - scheduled)
+        try:
+            response = await scenario.send(client, sequence)
+            outcome = str(response.status_code)
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        if measured:
+            recorder.record(scenario.name, loop.time() - scheduled, outcome)
+
+    started = loop.time()
+    measure_from = started + warmup
+    end = measure_from + duration
+    next_report = measure_from
+    scheduled = started
+    sequence = 0
+    while True:
+        scheduled += rng.expovariate(rps) if arrival == "poisson" else 1.0 / rps
+        if scheduled >= end:
+            break
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        scenario = rng.choices(scenarios, weights)[0]
+        measured = scheduled >= measure_from
+        if len(in_flight) >= max_in_flight:
+            if measured:
+                recorder.dropped[scenario.name] += 1
+            continue
+        task = asyncio.ensure_future(one(scenario, sequence, scheduled, measured))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        sequence += 1
+        if progress and measured and loop.time() >= next_report:
+            progress(f"t={loop.time() - measure_from:5.1f}s in_flight={len(in_flight)}")
+            next_report += 5.0
+
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return recorder.report(duration)
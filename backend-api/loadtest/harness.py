@@ -0,0 +1,164 @@
+"""
+Wire backend_app.main:app to the stand-ins and a database, then offer load
+
+The backend runs unmodified in this process: its upstream clients are routed
+to the stand-ins with metrics.set_upstream_transport, AnalysisRecord rows go
+to the configured database (a fresh SQLite file by default), and the load
+generator talks to it through httpx.ASGITransport. Client, backend and
+stand-ins share one event loop, so the numbers include the generator's own
+CPU; compare runs against each other, not against production.
+"""
+import os
+import platform
+import random
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from .generator import Scenario, run_load
+from .stubs import Profile, StubTransport, ai_service_app, chatbot_app
+
+
+DEFAULT_MIX = "analyze=6,check_quality=2,chat=1.5,chat_history=0.5"
+
+
+def _analyze(image: bytes) -> Callable:
+    def send(client: httpx.AsyncClient, n: int):
+        return client.post(
+            "/api/v1/analyze",
+            files={"image": ("lesion.jpg", image, "image/jpeg")},
+            data={"symptoms_selected": "ngứa,đỏ", "duration": "1-4 tuần"},
+        )
+    return send
+
+
+def _check_quality(image: bytes) -> Callable:
+    def send(client: httpx.AsyncClient, n: int):
+        return client.post("/api/v1/capture/check-quality", files={"image": ("frame.jpg", image, "image/jpeg")})
+    return send
+
+
+def _chat(sessions: int) -> Callable:
+    def send(client: httpx.AsyncClient, n: int):
+        return client.post("/api/v1/chat", json={"session_id": f"load-{n % sessions}", "message": "Da tôi bị ngứa và đỏ, có sao không?"})
+    return send
+
+
+def _chat_history(sessions: int) -> Callable:
+    def send(client: httpx.AsyncClient, n: int):
+        return client.get(f"/api/v1/chat/history/load-{n % sessions}")
+    return send
+
+
+def _tips(client: httpx.AsyncClient, n: int):
+    return client.get("/api/v1/capture/tips")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """"analyze=6,chat=2" -> {"analyze": 6.0, "chat": 2.0}"""
+    mix = {}
+    for part in text.split(","):
+        if part.strip():
+            name, _, weight = part.strip().partition("=")
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+@dataclass
+class HarnessConfig:
+    rps: float = 50.0
+    duration: float = 30.0
+    warmup: float = 5.0
+    max_in_flight: int = 1000
+    arrival: str = "constant"
+    mix: str = DEFAULT_MIX
+    ai: Profile = field(default_factory=lambda: Profile("lognormal:150:600"))
+    chatbot: Profile = field(default_factory=lambda: Profile("lognormal:800:3000", seed=1))
+    database_url: Optional[str] = None
+    image_kb: int = 200
+    frame_kb: int = 40
+    sessions: int = 100
+    seed: int = 0
+
+
+def build_scenarios(config: HarnessConfig) -> List[Scenario]:
+    # Random bytes: the backend and the stand-ins never decode the image
+    rng = random.Random(config.seed)
+    image, frame = rng.randbytes(config.image_kb * 1024), rng.randbytes(config.frame_kb * 1024)
+    available = {
+        "analyze": _analyze(image),
+        "check_quality": _check_quality(frame),
+        "chat": _chat(config.sessions),
+        "chat_history": _chat_history(config.sessions),
+        "tips": _tips,
+    }
+    scenarios = []
+    for name, weight in parse_mix(config.mix).items():
+        if name not in available:
+            raise ValueError(f"unknown scenario {name!r} (one of {sorted(available)})")
+        if weight > 0:
+            scenarios.append(Scenario(name, weight, available[name]))
+    if not scenarios:
+        raise ValueError("the mix selects no scenario")
+    return scenarios
+
+
+async def run_harness(config: HarnessConfig, progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Run one load test and return its report"""
+    tmpdir = None
+    if config.database_url:
+        os.environ["DATABASE_URL"] = config.database_url
+    elif "DATABASE_URL" not in os.environ:
+        tmpdir = tempfile.TemporaryDirectory(prefix="dermasafe-load-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir.name}/load.db"
+
+    # Imported after DATABASE_URL is set: database.py creates its engine on import
+    from backend_app.database import SessionLocal, engine
+    from backend_app.main import app
+    from backend_app.metrics import set_upstream_transport
+    from backend_app.models import AnalysisRecord, Base
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        records_before = db.query(AnalysisRecord).count()
+
+    scenarios = build_scenarios(config)
+    ai_app, chat_app = ai_service_app(config.ai), chatbot_app(config.chatbot)
+    set_upstream_transport("ai-service", lambda: StubTransport(ai_app, config.ai))
+    set_upstream_transport("chatbot", lambda: StubTransport(chat_app, config.chatbot))
+    try:
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+            report = await run_load(
+                client, scenarios, config.rps, config.duration,
+                warmup=config.warmup, max_in_flight=config.max_in_flight,
+                arrival=config.arrival, seed=config.seed, progress=progress,
+            )
+        with SessionLocal() as db:
+            records = db.query(AnalysisRecord).count() - records_before
+    finally:
+        set_upstream_transport("ai-service", None)
+        set_upstream_transport("chatbot", None)
+        engine.dispose()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    report["config"] = {
+        "rps": config.rps,
+        "duration": config.duration,
+        "warmup": config.warmup,
+        "arrival": config.arrival,
+        "max_in_flight": config.max_in_flight,
+        "mix": parse_mix(config.mix),
+        "ai_service": {"latency": config.ai.latency, "errors": config.ai.errors},
+        "chatbot": {"latency": config.chatbot.latency, "errors": config.chatbot.errors},
+        "database": engine.url.render_as_string(hide_password=True),
+        "image_kb": config.image_kb,
+        "seed": config.seed,
+    }
+    report["environment"] = {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()}
+    # Includes records from the warmup; compare with the analyze count to spot failed DB writes
+    report["db_records_written"] = records
+    return report
@@ -0,0 +1,216 @@
+"""
+In-process stand-ins for the AI service and the chatbot
+
+Each stand-in is a small Starlette app answering the endpoints the backend
+calls, after a latency drawn from a distribution and with a configurable
+error mix. They are reached through StubTransport (httpx.ASGITransport), so
+no socket, model or LLM key is involved.
+
+Latency specs (milliseconds):
+    const:20                 fixed
+    uniform:10:50            uniform between two bounds
+    exp:25                   exponential with this mean
+    lognormal:150:600        log-normal with this median and p99
+
+Error specs: comma separated rate:status pairs, e.g. "0.01:503,0.005:429";
+status "timeout" makes the call exceed the client's read timeout and "conn"
+fails it with a connection error before it reaches the app.
+"""
+import asyncio
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple, Union
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+# z-score of the 99th percentile of a standard normal
+_Z99 = 2.326
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """Latency spec -> sampler returning seconds"""
+    kind, *params = spec.split(":")
+    values = [float(p) / 1000.0 for p in params]
+    if kind == "const" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "exp" and len(values) == 1:
+        return lambda: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal" and len(values) == 2:
+        median, p99 = values
+        mu = math.log(median)
+        sigma = max(0.0, math.log(p99 / median) / _Z99)
+        return lambda: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"bad latency spec {spec!r} (const:MS, uniform:LO:HI, exp:MEAN, lognormal:MEDIAN:P99)")
+
+
+def parse_errors(spec: Optional[str]) -> List[Tuple[float, Union[int, str]]]:
+    """"0.01:503,0.002:conn" -> [(0.01, 503), (0.002, "conn")]"""
+    errors: List[Tuple[float, Union[int, str]]] = []
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        rate, _, status = part.strip().partition(":")
+        errors.append((float(rate), status if status in {"conn", "timeout"} else int(status)))
+    if sum(rate for rate, _ in errors) > 1.0:
+        raise ValueError(f"error rates in {spec!r} add up to more than 1")
+    return errors
+
+
+@dataclass
+class Profile:
+    """Latency and error behaviour of one stand-in"""
+    latency: str = "const:0"
+    errors: Optional[str] = None
+    seed: int = 0
+    _rng: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self.sample_latency = parse_latency(self.latency, self._rng)
+        self.error_mix = parse_errors(self.errors)
+
+    def draw_error(self) -> Optional[Union[int, str]]:
+        """Error of this call (status, "conn", "timeout") or None"""
+        roll = self._rng.random()
+        for rate, status in self.error_mix:
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+
+# Error decided by the transport, read by the app (same request, same task)
+_ERROR_HEADER = "x-stub-error"
+
+
+class StubTransport(httpx.ASGITransport):
+    """ASGITransport that applies the profile's connection errors and the client's read timeout"""
+
+    def __init__(self, app, profile: Profile):
+        # App exceptions become 500 responses, as behind a real server
+        super().__init__(app=app, raise_app_exceptions=False)
+        self.profile = profile
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        error = self.profile.draw_error()
+        if error == "conn":
+            raise httpx.ConnectError("stub: connection refused", request=request)
+        if error is not None:
+            request.headers[_ERROR_HEADER] = str(error)
+        timeout = request.extensions.get("timeout", {}).get("read")
+        if error == "timeout" and timeout is None:
+            raise httpx.ReadTimeout("stub: read timed out", request=request)
+        try:
+            return await asyncio.wait_for(super().handle_async_request(request), timeout)
+        except asyncio.TimeoutError:
+            raise httpx.ReadTimeout("stub: read timed out", request=request)
+
+
+async def _respond(request: Request, profile: Profile, body: Callable[[Request], dict]) -> JSONResponse:
+    # Drain the upload like the real service (no multipart parsing: that is the real service's cost)
+    await request.body()
+    error = request.headers.get(_ERROR_HEADER)
+    if error == "timeout":
+        await asyncio.Event().wait()  # cancelled by the transport's read timeout
+    await asyncio.sleep(profile.sample_latency())
+    if error is not None:
+        status = int(error)
+        headers = {"Retry-After": "1"} if status in (429, 503) else None
+        return JSONResponse({"detail": f"stub error {status}"}, status_code=status, headers=headers)
+    return JSONResponse(body(request))
+
+
+# ----------------------------------------------------------------------
+# AI service
+# ----------------------------------------------------------------------
+def _analyze_result(request: Request) -> dict:
+    disease = {
+        "name": "eczema",
+        "vietnamese_name": "Chàm (Eczema)",
+        "confidence": 0.62,
+        "severity": "mild",
+        "description": "Tình trạng viêm da mạn tính gây ngứa, khô và đỏ da.",
+        "recommendations": ["Giữ ẩm da thường xuyên", "Tránh các chất gây kích ứng"],
+    }
+    return {
+        "risk": "TRUNG BÌNH 🟡",
+        "reason": "Hình ảnh phù hợp với chàm (62.0%). Nên theo dõi và đi khám nếu không cải thiện.",
+        "cv_scores": {"eczema": 0.62, "dermatitis": 0.18, "psoriasis": 0.11, "tinea": 0.05, "urticaria": 0.04},
+        "primary_disease": disease,
+        "alternative_diseases": [dict(disease, name="dermatitis", vietnamese_name="Viêm da", confidence=0.18)],
+        "clinical_concepts": ["erythema", "scale", "pruritus"],
+        "description": "Phát hiện vùng da đỏ có vảy.",
+        "overall_severity": "mild",
+        "recommendations": ["Giữ ẩm da thường xuyên", "Đi khám nếu lan rộng"],
+        "detection_status": "detected",
+        "detection_message": None,
+    }
+
+
+def _quality_result(request: Request) -> dict:
+    return {
+        "is_acceptable": True,
+        "brightness_score": 0.85,
+        "sharpness_score": 0.78,
+        "color_quality_score": 0.92,
+        "overall_score": 0.85,
+        "issues": [],
+        "suggestions": [],
+    }
+
+
+def _tips(request: Request) -> dict:
+    return {"tips": ["Chụp dưới ánh sáng tự nhiên", "Giữ máy cách da 10-15 cm", "Lấy nét vào vùng tổn thương"]}
+
+
+def ai_service_app(profile: Profile) -> Starlette:
+    async def analyze(request: Request):
+        return await _respond(request, profile, _analyze_result)
+
+    async def check_quality(request: Request):
+        return await _respond(request, profile, _quality_result)
+
+    async def tips(request: Request):
+        return await _respond(request, profile, _tips)
+
+    return Starlette(routes=[
+        Route("/analyze", analyze, methods=["POST"]),
+        Route("/capture/check-quality", check_quality, methods=["POST"]),
+        Route("/capture/tips", tips, methods=["GET"]),
+    ])
+
+
+# ----------------------------------------------------------------------
+# Chatbot
+# ----------------------------------------------------------------------
+def chatbot_app(profile: Profile) -> Starlette:
+    async def chat(request: Request):
+        payload = await request.json()
+
+        def reply(_: Request) -> dict:
+            return {
+                "session_id": payload.get("session_id"),
+                "message": "Dựa trên mô tả, bạn nên giữ ẩm da và theo dõi thêm. Nếu lan rộng hãy đi khám bác sĩ da liễu.",
+                "suggestions": [],
+                "timestamp": "2026-01-01T00:00:00",
+            }
+        return await _respond(request, profile, reply)
+
+    async def history(request: Request):
+        session_id = request.path_params["session_id"]
+        if request.method == "DELETE":
+            return await _respond(request, profile, lambda _: {"status": "success", "session_id": session_id})
+        return await _respond(request, profile, lambda _: {"session_id": session_id, "messages": [], "total": 0})
+
+    return Starlette(routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/history/{session_id}", history, methods=["GET", "DELETE"]),
+    ])
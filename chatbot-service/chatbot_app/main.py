@@ -2,9 +2,9 @@
 DermaSafe-AI Chatbot Service
 Powered by Google Gemini
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
 import os
 import logging
 from dotenv import load_dotenv
@@ -18,6 +18,8 @@ from .schemas import (
 from .conversation import ConversationManager
 from .gemini_client import GeminiClient
 from .prompts.system_prompt import generate_suggestions
+from .metrics import ACTIVE_SESSIONS, LLM_SECONDS, MetricsMiddleware, metrics_response
+from .profiling import PROFILER, ProfilingMiddleware
 
 # Load environment variables
 load_dotenv()
@@ -46,8 +48,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# On-demand sampling profiler (PROFILE_TOKEN), see /admin/profile
+app.add_middleware(ProfilingMiddleware, profiler=PROFILER)
+
+# Latency, in-flight and CPU time per route, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Initialize services
 conversation_manager = ConversationManager(max_history_length=30)
+ACTIVE_SESSIONS.set_function(conversation_manager.get_session_count)
 
 # Initialize Gemini client
 try:
@@ -155,10 +164,11 @@ async def chat(request: ChatRequest):
     try:
         logger.info(f"🤖 Calling Gemini API for session {request.session_id}...")
         
-        assistant_reply = await gemini_client.chat(
-            messages=llm_messages,
-            temperature=0.7
-        )
+        with LLM_SECONDS.time():
+            assistant_reply = await gemini_client.chat(
+                messages=llm_messages,
+                temperature=0.7
+            )
         
         logger.info(f"✅ Received Gemini response ({len(assistant_reply)} chars)")
         
@@ -232,6 +242,41 @@ async def clear_history(session_id: str):
         )
 
 
+@app.get("/metrics", tags=["monitoring"])
+async def metrics():
+    """Prometheus metrics: request latency / CPU per route, Gemini latency, in-flight, sessions"""
+    return metrics_response()
+
+
+def _check_profile_token(request: Request) -> None:
+    if not PROFILER.enabled:
+        raise HTTPException(status_code=404, detail="Profiler disabled (PROFILE_TOKEN is not set)")
+    if not PROFILER.authorized(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Missing or wrong X-Profile-Token")
+
+
+@app.get("/admin/profile", tags=["monitoring"])
+async def profile_status(request: Request):
+    """Sampling profiler: running captures, armed request budget, recently written files"""
+    _check_profile_token(request)
+    return PROFILER.stats()
+
+
+@app.post("/admin/profile", tags=["monitoring"])
+async def profile_arm(
+    request: Request,
+    requests: Optional[int] = None,
+    seconds: Optional[float] = None,
+    path: Optional[str] = None,
+):
+    """Profile the next N requests (optionally under a path prefix) or everything for T seconds"""
+    _check_profile_token(request)
+    try:
+        return PROFILER.arm(requests=requests, seconds=seconds, path=path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/stats", tags=["monitoring"])
 async def get_stats():
     """
@@ -0,0 +1,71 @@
+"""
+Prometheus metrics for the chatbot service (GET /metrics)
+
+- chatbot_request_seconds / chatbot_requests_in_flight: per route (path template)
+- chatbot_request_cpu_seconds: CPU time of the request's own steps on the event loop
+- chatbot_llm_seconds: Gemini calls
+- chatbot_active_sessions: conversations held in memory
+"""
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+from starlette.routing import Match
+
+from dermasafe_common.cputime import CpuAccount, Metered
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CPU_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds", "Request latency", ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUEST_CPU_SECONDS = Histogram(
+    "chatbot_request_cpu_seconds", "CPU time of one request on the event loop", ["route"], buckets=CPU_BUCKETS
+)
+IN_FLIGHT = Gauge("chatbot_requests_in_flight", "Requests being handled", ["route"])
+LLM_SECONDS = Histogram("chatbot_llm_seconds", "Latency of one Gemini call", buckets=LATENCY_BUCKETS)
+ACTIVE_SESSIONS = Gauge("chatbot_active_sessions", "Conversations held in memory")
+
+
+def _route(scope) -> str:
+    for route in getattr(scope.get("app"), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: latency, in-flight and CPU time per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = _route(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        account = CpuAccount()
+        gauge = IN_FLIGHT.labels(route=route)
+        gauge.inc()
+        started = time.perf_counter()
+        try:
+            await Metered(self.app(scope, receive, send_wrapper), account)
+        finally:
+            gauge.dec()
+            REQUEST_SECONDS.labels(scope["method"], route, str(status["code"])).observe(time.perf_counter() - started)
+            REQUEST_CPU_SECONDS.labels(route=route).observe(account.seconds)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
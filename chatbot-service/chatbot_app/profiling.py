@@ -0,0 +1,12 @@
+"""
+On-demand sampling profiler for the chatbot service (dermasafe_common.profiling)
+
+Off unless PROFILE_TOKEN is set; output goes to PROFILE_DIR (default
+<tmp>/dermasafe-chatbot-profiles), see PROFILE_INTERVAL_MS / PROFILE_FORMATS.
+POST /admin/profile?requests=N&path=/chat profiles the next N chat turns.
+"""
+from dermasafe_common.profiling import ProfilingMiddleware, profiler_from_env
+
+__all__ = ["PROFILER", "ProfilingMiddleware"]
+
+PROFILER = profiler_from_env("", "dermasafe-chatbot-profiles")
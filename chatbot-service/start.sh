@@ -39,5 +39,6 @@ echo ""
 echo "Press Ctrl+C to stop"
 echo ""
 
-# Run the service
+# Run the service (repo root on PYTHONPATH for dermasafe_common)
+export PYTHONPATH="$(cd .. && pwd)${PYTHONPATH:+:$PYTHONPATH}"
 uvicorn chatbot_app.main:app --host 0.0.0.0 --port 8002 --reload
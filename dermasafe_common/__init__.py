@@ -0,0 +1,9 @@
+"""
+Helpers shared by the ai-service, backend-api and chatbot-service
+
+Standard library only. Each service puts the repository root on sys.path in
+its package __init__ (in Docker the package is mounted next to the app).
+
+- profiling: on-demand sampling profiler and its ASGI middleware
+- cputime: per-request CPU time of an ASGI app (CpuAccount, Metered)
+"""
@@ -0,0 +1,44 @@
+"""
+Per-request CPU time for asyncio services
+
+Metered drives a request's coroutine step by step and charges the thread CPU
+time of each step to a CpuAccount, so time spent on other requests between
+the steps is not counted.
+"""
+import time
+
+
+class CpuAccount:
+    """CPU seconds charged to one request (added from the event loop and executor threads)"""
+
+    __slots__ = ("seconds",)
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def add(self, seconds: float) -> None:
+        # float += is atomic enough under the GIL for an estimate
+        self.seconds += seconds
+
+
+class Metered:
+    """Drive a coroutine step by step, charging the CPU time of each step to an account"""
+
+    def __init__(self, coro, account: CpuAccount):
+        self.coro = coro
+        self.account = account
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.thread_time()
+            try:
+                yielded = self.coro.throw(error) if error is not None else self.coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.account.add(time.thread_time() - started)
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
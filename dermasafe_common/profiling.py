@@ -0,0 +1,375 @@
+"""
+On-demand sampling profiler shared by the ai-service, backend-api and chatbot-service
+
+Off unless the service's profile token is set, and free while no capture
+runs: no thread is started and the hooks only test a module flag. With a
+token:
+
+- header "X-Profile: <token>" on a request profiles that request
+  (the response carries X-Profile-Id)
+- POST /admin/profile?requests=N[&path=...] (header X-Profile-Token)
+  profiles the next N matching requests, one output each
+- POST /admin/profile?seconds=T profiles everything the process does for T seconds
+
+While a capture runs, a background thread samples the Python stack of every
+thread every interval_ms; threads waiting for work (queue, select, condition
+wait) are left out. Output goes to the profile directory as
+<time>-<pid>-<label>-<id>.speedscope.json (https://www.speedscope.app) and
+.folded (collapsed stacks for flamegraph.pl), one tree per thread.
+
+region(name) marks a block so its samples carry a "[name]" frame, and
+in_region(fn) carries the caller's region over to an executor thread (the
+ai-service uses both for its pipeline stages).
+
+A request capture samples every thread while that request is in flight, so
+under concurrency it also sees other requests' work. Captures are per process.
+"""
+import contextlib
+import contextvars
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMATS = ("speedscope", "collapsed")
+MAX_SECONDS = 300.0
+MAX_REQUESTS = 1000
+
+# (file name, function) of the innermost frame of a thread waiting for work
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("runners.py", "run"),
+}
+
+# (name, file, first line); regions are ("[stage]", "", 0)
+Frame = Tuple[str, str, int]
+
+# True while at least one capture runs; the only thing the hooks check when off
+_active = False
+# thread id -> {region id: (name, frame that entered it)}
+_regions: Dict[int, Dict[int, Tuple[str, Any]]] = {}
+_current_region: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("profile_region", default=None)
+
+
+class _Region:
+    """Marks the frame that entered it: samples get "[name]" right below that frame"""
+
+    __slots__ = ("name", "skip", "tid", "token")
+
+    def __init__(self, name: str, skip: int = 0):
+        self.name = name
+        self.skip = skip
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        _regions.setdefault(self.tid, {})[id(self)] = (self.name, sys._getframe(1 + self.skip))
+        self.token = _current_region.set(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        _current_region.reset(self.token)
+        markers = _regions.get(self.tid)
+        if markers is not None:
+            markers.pop(id(self), None)
+            if not markers:
+                _regions.pop(self.tid, None)
+        return False
+
+
+def region(name: str, skip: int = 0):
+    """Show the enclosed code under "[name]" in profiles (no-op unless a capture runs)
+
+    skip: extra frames between the caller and __enter__ (e.g. a wrapping context manager)
+    """
+    return _Region(name, skip) if _active else contextlib.nullcontext()
+
+
+def in_region(fn: Callable) -> Callable:
+    """Carry the caller's region over to the executor thread that will run fn"""
+    name = _current_region.get() if _active else None
+    if name is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with _Region(name):
+            return fn(*args, **kwargs)
+    return run
+
+
+def _sample(frame, markers: Optional[Dict[int, Tuple[str, Any]]]) -> Optional[Tuple[Frame, ...]]:
+    """Root-first stack of one thread with its region frames, None if the thread is idle"""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+        return None
+    below: Dict[int, List[str]] = {}
+    for name, entered in list(markers.values()) if markers else ():
+        below.setdefault(id(entered), []).append(f"[{name}]")
+    stack: List[Frame] = []
+    while frame is not None:
+        for name in below.get(id(frame), ()):
+            stack.append((name, "", 0))
+        code = frame.f_code
+        stack.append((getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class Capture:
+    """Samples collected for one profiled request or time window"""
+
+    def __init__(self, label: str, seconds: Optional[float] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started = time.time()
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.stacks: Counter = Counter()  # (thread name, stack) -> samples
+        self.ticks = 0
+        self.ended: Optional[float] = None
+        self.closed = False
+
+    def close(self) -> None:
+        self.ended = time.time()
+        self.closed = True
+
+
+def _frame_name(frame: Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})" if filename else name
+
+
+def write_capture(capture: Capture, directory: str, interval_ms: float, formats: Sequence[str] = DEFAULT_FORMATS) -> List[str]:
+    """Write the capture as speedscope JSON and/or collapsed stacks, return the paths"""
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", capture.label).strip("_")[:40] or "capture"
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(capture.started))
+    base = os.path.join(directory, f"{stamp}-{os.getpid()}-{slug}-{capture.id}")
+    paths = []
+
+    if "collapsed" in formats:
+        path = base + ".folded"
+        with open(path, "w", encoding="utf-8") as f:
+            for (thread, stack), count in sorted(capture.stacks.items()):
+                f.write(";".join([thread] + [_frame_name(frame) for frame in stack]) + f" {count}\n")
+        paths.append(path)
+
+    if "speedscope" in formats:
+        frames: Dict[Frame, int] = {}
+        profiles: Dict[str, Dict[str, list]] = {}
+        for (thread, stack), count in capture.stacks.items():
+            profile = profiles.setdefault(thread, {"samples": [], "weights": []})
+            profile["samples"].append([frames.setdefault(frame, len(frames)) for frame in stack])
+            profile["weights"].append(count * interval_ms)
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{capture.label} ({capture.id})",
+            "exporter": "dermasafe-profiler",
+            "shared": {
+                "frames": [
+                    {"name": name, "file": filename, "line": line} if filename else {"name": name}
+                    for name, filename, line in frames
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(profile["weights"]),
+                    **profile,
+                }
+                for thread, profile in sorted(profiles.items())
+            ],
+        }
+        path = base + ".speedscope.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+        paths.append(path)
+    return paths
+
+
+class Profiler:
+    """Triggers (header, armed request budget, time window) and the sampling thread"""
+
+    def __init__(
+        self,
+        token: Optional[str],
+        directory: str,
+        interval_ms: float = 5.0,
+        formats: Sequence[str] = DEFAULT_FORMATS,
+    ):
+        self.token = token
+        self.directory = directory
+        self.interval_ms = max(0.5, interval_ms)
+        self.formats = tuple(formats)
+        self._lock = threading.Lock()
+        self._captures: List[Capture] = []
+        self._thread: Optional[threading.Thread] = None
+        self._armed = 0
+        self._armed_path: Optional[str] = None
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+    @property
+    def enabled(self) -> bool:
+        return self.token is not None
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return self.enabled and token is not None and hmac.compare_digest(token, self.token)
+
+    # ------------------------------------------------------------------
+    # Triggers
+    # ------------------------------------------------------------------
+    def arm(self, requests: Optional[int] = None, seconds: Optional[float] = None, path: Optional[str] = None) -> Dict[str, Any]:
+        """Profile the next `requests` requests (optionally under `path`) or a `seconds` window"""
+        if (requests is None) == (seconds is None):
+            raise ValueError("give exactly one of 'requests' or 'seconds'")
+        if seconds is not None:
+            if not 0 < seconds <= MAX_SECONDS:
+                raise ValueError(f"seconds must be in (0, {MAX_SECONDS:g}]")
+            capture = Capture("window", seconds=seconds)
+            self.start(capture)
+            return {"id": capture.id, "seconds": seconds}
+        if not 0 < requests <= MAX_REQUESTS:
+            raise ValueError(f"requests must be in [1, {MAX_REQUESTS}]")
+        with self._lock:
+            self._armed, self._armed_path = requests, path
+        return {"requests": requests, "path": path}
+
+    def take(self, path: str, headers) -> bool:
+        """Should this request be profiled (header token or armed budget)?"""
+        for name, value in headers:
+            if name == b"x-profile":
+                return self.authorized(value.decode("latin-1"))
+        if self._armed <= 0 or path.startswith("/admin/profile"):
+            return False
+        with self._lock:
+            if self._armed > 0 and (self._armed_path is None or path.startswith(self._armed_path)):
+                self._armed -= 1
+                return True
+        return False
+
+    # ------------------------------------------------------------------
+    # Sampling
+    # ------------------------------------------------------------------
+    def start(self, capture: Capture) -> None:
+        global _active
+        with self._lock:
+            self._captures.append(capture)
+            _active = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def _loop(self) -> None:
+        global _active
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                finished = [c for c in self._captures if c.closed or (c.deadline is not None and now >= c.deadline)]
+                running = self._captures = [c for c in self._captures if c not in finished]
+                if not running:
+                    _active = False
+                    self._thread = None
+            for capture in finished:
+                self._write(capture)
+            if not running:
+                return
+
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = _sample(frame, _regions.get(tid))
+                if stack is not None:
+                    key = (names.get(tid, str(tid)), stack)
+                    for capture in running:
+                        capture.stacks[key] += 1
+            for capture in running:
+                capture.ticks += 1
+            time.sleep(self.interval_ms / 1000.0)
+
+    def _write(self, capture: Capture) -> None:
+        entry = {
+            "id": capture.id,
+            "label": capture.label,
+            "started": capture.started,
+            "seconds": round((capture.ended or time.time()) - capture.started, 3),
+            "samples": capture.ticks,
+        }
+        try:
+            entry["paths"] = write_capture(capture, self.directory, self.interval_ms, self.formats)
+        except OSError as e:
+            entry["error"] = str(e)
+            logger.warning("Could not write profile %s: %s", capture.id, e)
+        self.recent.append(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = [{"id": c.id, "label": c.label, "samples": c.ticks} for c in self._captures]
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "interval_ms": self.interval_ms,
+            "armed": {"requests": self._armed, "path": self._armed_path},
+            "active": active,
+            "recent": list(self.recent),
+        }
+
+
+def profiler_from_env(prefix: str, default_dir: str) -> Profiler:
+    """
+    Profiler configured from <prefix>PROFILE_TOKEN, _DIR, _INTERVAL_MS and _FORMATS
+
+    default_dir is a directory name under the system temp dir.
+    """
+    formats = os.getenv(f"{prefix}PROFILE_FORMATS", ",".join(DEFAULT_FORMATS))
+    return Profiler(
+        token=os.getenv(f"{prefix}PROFILE_TOKEN") or None,
+        directory=os.getenv(f"{prefix}PROFILE_DIR", os.path.join(tempfile.gettempdir(), default_dir)),
+        interval_ms=float(os.getenv(f"{prefix}PROFILE_INTERVAL_MS", "5")),
+        formats=[f.strip() for f in formats.split(",") if f.strip()],
+    )
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: profile the requests selected by the profiler (passthrough when disabled)"""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.enabled or scope["type"] != "http" or not self.profiler.take(scope["path"], scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        capture = Capture(f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", capture.id.encode())]
+            await send(message)
+
+        self.profiler.start(capture)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Written by the sampler thread on its next tick
+            capture.close()
@@ -15,10 +15,48 @@ Example:
     >>> analyzer = DermatologyAnalyzer()
     >>> result = analyzer.analyze("path/to/skin_image.jpg")
     >>> print(result.disease, result.severity)
+
+Import package không kéo theo torch/open_clip: DermatologyAnalyzer chỉ được
+import ở lần truy cập đầu tiên (PEP 562), nên disease_database, models.Severity
+hay các bảng luật dùng được mà không tốn vài giây + hàng trăm MB.
 """
 
-from .analyzer import DermatologyAnalyzer
+import importlib
+
 from .models import AnalysisResult, DiseaseInfo
 
+# Tên -> module con nặng, chỉ import khi được truy cập
+_LAZY_ATTRS = {
+    "DermatologyAnalyzer": ".analyzer",
+}
+# Gói pip của các dependency của engine torch (tên module -> tên gói)
+_OPTIONAL_DEPS = {"torch": "torch", "open_clip": "open_clip_torch"}
+
 __version__ = "1.0.0"
 __all__ = ["DermatologyAnalyzer", "AnalysisResult", "DiseaseInfo"]
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    try:
+        value = getattr(importlib.import_module(module, __name__), name)
+    except ImportError as e:
+        # Thiếu torch/open_clip: báo rõ gói cần cài (engine ONNX vẫn dùng được); lỗi khác giữ nguyên.
+        # Không lưu lại: cài gói rồi truy cập lại là import được ngay
+        missing = (e.name or "").split(".")[0]
+        if missing not in _OPTIONAL_DEPS:
+            raise
+        raise ImportError(
+            f"{__name__}.{name} cần {missing!r} (pip install {_OPTIONAL_DEPS[missing]}); "
+            f"không có torch thì dùng engine ONNX (onnx_analyzer.OnnxDermatologyAnalyzer)",
+            name=missing,
+        ) from e
+    # Lần sau lấy thẳng từ globals, không qua __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -6,24 +6,39 @@ import open_clip
 from PIL import Image
 from pathlib import Path
 from typing import Union, List, Optional
+from collections import OrderedDict
 import logging
 
-from .models import AnalysisResult, DiseaseInfo, Severity
-from .disease_database import (
-    get_disease_info, 
-    get_severity_from_disease,
-    COMMON_DISEASES,
-    PAD_DISEASES,
-    EXTENDED_DISEASES,
+from .base import BaseDermatologyAnalyzer
+from .precision import resolve_precision, quantize_image_tower, bf16_supported
+from .compiled import compile_image_encoder, resolve_compile_mode
+from .preprocessing import BatchBuffer, PreprocessConfig, fast_preprocess_enabled, resize_crop
+from .weights import load_open_clip, read_fingerprints, weights_dir_from_env
+from .tta import resolve_tta_mode
+from .text_cache import (
+    default_cache_dir,
+    text_cache_enabled,
+    text_cache_key,
+    text_weights_fingerprint,
+    weights_fingerprint,
+    load_text_features,
+    save_text_features,
 )
+from .disease_database import EXTENDED_DISEASES
 
 
 logger = logging.getLogger(__name__)
 
+# Prompt dùng để sinh text features cho từng bệnh
+PROMPT_TEMPLATE = 'This is a skin image of {}'
 
-class DermatologyAnalyzer:
+# Số câu truy vấn search_by_text giữ embedding trong bộ nhớ
+QUERY_CACHE_SIZE = 256
+
+
+class DermatologyAnalyzer(BaseDermatologyAnalyzer):
     """
-    Lớp phân tích ảnh da liễu sử dụng DermLIP
+    Lớp phân tích ảnh da liễu sử dụng DermLIP (engine PyTorch/open_clip)
     
     Example:
         >>> analyzer = DermatologyAnalyzer()
@@ -31,11 +46,20 @@ class DermatologyAnalyzer:
         >>> print(result)
     """
     
+    backend = "torch"
+    
     def __init__(
         self,
         model_name: str = "hf-hub:redlessone/DermLIP_ViT-B-16",
         device: Optional[str] = None,
-        disease_list: Optional[List[str]] = None
+        disease_list: Optional[List[str]] = None,
+        precision: Optional[str] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+        use_text_cache: Optional[bool] = None,
+        fast_preprocess: Optional[bool] = None,
+        weights_dir: Optional[Union[str, Path]] = None,
+        compile_mode: Optional[str] = None,
+        tta: Optional[str] = None
     ):
         """
         Khởi tạo analyzer
@@ -45,6 +69,22 @@ class DermatologyAnalyzer:
                        Có thể dùng: "hf-hub:redlessone/DermLIP_PanDerm-base-w-PubMed-256"
             device: Thiết bị để chạy ("cuda", "cpu", hoặc None để tự động)
             disease_list: Danh sách bệnh cần phân loại (mặc định: PAD_DISEASES)
+            precision: Độ chính xác của image tower: "fp32", "bf16" (autocast)
+                       hoặc "int8" (dynamic quantization các lớp Linear, chỉ CPU).
+                       None: đọc biến môi trường DERM_PRECISION (mặc định fp32)
+            cache_dir: Thư mục cache text features (mặc định: DERM_CACHE_DIR
+                       hoặc ~/.cache/dermatology_module)
+            use_text_cache: Dùng cache text features trên đĩa (None: DERM_TEXT_CACHE, mặc định bật)
+            fast_preprocess: Tiền xử lý bằng numpy ghi thẳng vào buffer batch thay cho
+                       transform open_clip (None: DERM_FAST_PREPROCESS, mặc định bật)
+            weights_dir: Artifact safetensors (weights.py export) tải bằng memory-map thay
+                       cho checkpoint của open_clip; tên mô hình lấy từ artifact
+                       (None: DERM_WEIGHTS_DIR, không đặt thì tải như cũ; "" để bỏ qua biến môi trường)
+            compile_mode: "off", "trace" (TorchScript) hoặc "aot" (AOTInductor): biên dịch
+                       image tower một lần, artifact lưu trong cache_dir; lỗi thì chạy eager
+                       (None: DERM_COMPILE, mặc định off)
+            tta: Test-time augmentation cho classify/analyze: "off", "auto" (chỉ khi
+                       margin top-1/top-2 nhỏ) hoặc "always" (None: DERM_TTA, mặc định off)
         """
         # Xác định thiết bị
         if device is None:
@@ -52,30 +92,102 @@ class DermatologyAnalyzer:
         else:
             self.device = device
         
-        logger.info(f"Đang tải mô hình {model_name} trên {self.device}...")
-        
-        # Tải mô hình
-        self.model, _, self.preprocess = open_clip.create_model_and_transforms(
-            model_name
-        )
+        if weights_dir is None:
+            weights_dir = weights_dir_from_env()
+        if weights_dir:
+            # Trọng số memory-map từ safetensors: không khởi tạo ngẫu nhiên, không sao chép
+            logger.info(f"Đang memory-map trọng số từ {weights_dir} trên {self.device}...")
+            self.model, self.preprocess, model_name = load_open_clip(weights_dir)
+            tokenizer_name = f"local-dir:{Path(weights_dir).resolve()}"
+        else:
+            logger.info(f"Đang tải mô hình {model_name} trên {self.device}...")
+            self.model, _, self.preprocess = open_clip.create_model_and_transforms(
+                model_name
+            )
+            tokenizer_name = model_name
+        self.model_name = model_name
+        self.weights_dir = str(weights_dir) if weights_dir else None
+        # Fingerprint trọng số đọc từ metadata artifact (không page-in trọng số), thiếu thì tính khi cần
+        self._fingerprints = read_fingerprints(weights_dir) if weights_dir else {}
         self.model.eval()
         self.model.to(self.device)
         
+        # Fast path tiền xử lý: cùng cấu hình với transform open_clip, buffer NCHW dùng lại
+        self.fast_preprocess = fast_preprocess_enabled() if fast_preprocess is None else fast_preprocess
+        self.preprocess_config = PreprocessConfig.from_visual(self.model.visual)
+        self._batch_buffer = BatchBuffer(self.preprocess_config)
+        
         # Tải tokenizer
-        self.tokenizer = open_clip.get_tokenizer(model_name)
+        self.tokenizer = open_clip.get_tokenizer(tokenizer_name)
+
+        self.tta = resolve_tta_mode(tta)
 
         # Danh sách bệnh: mặc định dùng mở rộng để tăng độ phủ
         self.disease_list = disease_list or EXTENDED_DISEASES
 
+        # Cache text features trên đĩa và cache embedding câu truy vấn trong bộ nhớ
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.use_text_cache = text_cache_enabled() if use_text_cache is None else use_text_cache
+        self.text_cache_hit = False
+        self._query_cache: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+
         # Chuẩn bị text features cho các bệnh
         self._prepare_text_features()
 
+        # Phiên bản + kích thước trọng số, tính trên mô hình fp32 (trước khi lượng tử hóa)
+        self.weights_version = self._weights_fingerprint("visual")[:12]
+        self._memory_bytes = sum(t.numel() * t.element_size() for t in self.model.state_dict().values())
+
+        # Chế độ độ chính xác cho image tower (sau khi text features đã tính ở fp32)
+        self.precision = "fp32"
+        self._apply_precision(resolve_precision(precision))
+
+        # Image tower biên dịch sẵn (tùy chọn), chỉ cho fp32 trên CPU
+        self.compile_mode = resolve_compile_mode(compile_mode)
+        if self.compile_mode != "off":
+            if self.device != "cpu" or self.precision != "fp32":
+                logger.warning(f"compile_mode={self.compile_mode} chỉ hỗ trợ fp32 trên CPU, dùng eager")
+            else:
+                self._compiled = compile_image_encoder(
+                    self.model, self.model_name, self.compile_mode,
+                    self.preprocess_config.size, self.cache_dir,
+                    weights_hash=self._weights_fingerprint("visual"),
+                )
+
         logger.info("Khởi tạo thành công!")
     
+    def _weights_fingerprint(self, part: str) -> str:
+        """Fingerprint trọng số image tower ("visual") hoặc text tower ("text"), tính một lần"""
+        if part not in self._fingerprints:
+            if part == "visual":
+                self._fingerprints[part] = weights_fingerprint(self.model, lambda name: name.startswith("visual."))
+            else:
+                self._fingerprints[part] = text_weights_fingerprint(self.model)
+        return self._fingerprints[part]
+    
     def _prepare_text_features(self):
-        """Chuẩn bị các text features cho danh sách bệnh"""
-        template = lambda c: f'This is a skin image of {c}'
-        texts = [template(disease) for disease in self.disease_list]
+        """
+        Chuẩn bị các text features cho danh sách bệnh
+        
+        Nếu cache trên đĩa khớp (mô hình, trọng số text tower, prompt, danh sách bệnh)
+        thì memory-map file cache và bỏ qua text encoder.
+        """
+        cache_key = None
+        if self.use_text_cache:
+            cache_key = text_cache_key(
+                self.model_name,
+                self._weights_fingerprint("text"),
+                PROMPT_TEMPLATE,
+                self.disease_list,
+            )
+            cached = load_text_features(self.cache_dir, cache_key)
+            if cached is not None and cached.shape[0] == len(self.disease_list):
+                self.text_features = torch.from_numpy(cached).to(self.device)
+                self.text_cache_hit = True
+                logger.info("Đã nạp text features từ cache")
+                return
+        
+        texts = [PROMPT_TEMPLATE.format(disease) for disease in self.disease_list]
         
         text_tokens = self.tokenizer(texts).to(self.device)
         
@@ -84,8 +196,49 @@ class DermatologyAnalyzer:
             text_features /= text_features.norm(dim=-1, keepdim=True)
         
         self.text_features = text_features
+        
+        if cache_key is not None:
+            save_text_features(
+                self.cache_dir,
+                cache_key,
+                text_features.float().cpu().numpy(),
+                {"model_name": self.model_name, "prompt_template": PROMPT_TEMPLATE, "disease_list": list(self.disease_list)},
+            )
+    
+    def _encode_query(self, text_query: str) -> torch.Tensor:
+        """Encode câu truy vấn (có LRU cache trong bộ nhớ để không tokenize/encode lại)"""
+        cached = self._query_cache.get(text_query)
+        if cached is not None:
+            self._query_cache.move_to_end(text_query)
+            return cached
+        
+        text_tokens = self.tokenizer([text_query]).to(self.device)
+        with torch.no_grad():
+            query_features = self.model.encode_text(text_tokens)
+            query_features /= query_features.norm(dim=-1, keepdim=True)
+        
+        self._query_cache[text_query] = query_features
+        if len(self._query_cache) > QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return query_features
+    
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+    
+    def _apply_precision(self, precision: str):
+        """Chuyển image tower sang chế độ độ chính xác đã chọn"""
+        # Artifact biên dịch là của image tower fp32
+        self._compiled = None
+        if precision == "int8":
+            if self.device != "cpu":
+                raise ValueError("precision='int8' (dynamic quantization) chỉ hỗ trợ CPU")
+            self.model.visual = quantize_image_tower(self.model.visual)
+        elif precision == "bf16" and self.device == "cpu" and not bf16_supported():
+            logger.warning("CPU không hỗ trợ bf16 hiệu quả, vẫn bật autocast bf16 theo yêu cầu")
+        self.precision = precision
+        logger.info(f"Image tower chạy ở chế độ {precision}")
     
-    def _load_image(self, image_input: Union[str, Path, Image.Image]) -> torch.Tensor:
+    def _load_image(self, image_input: Union[str, Path, Image.Image]):
         """
         Tải và tiền xử lý ảnh
         
@@ -93,264 +246,68 @@ class DermatologyAnalyzer:
             image_input: Đường dẫn ảnh, Path object, hoặc PIL Image
             
         Returns:
-            Tensor ảnh đã được tiền xử lý
+            Fast path: mảng uint8 (H, W, 3) đã resize + crop (chuẩn hóa trong _stack);
+            ngược lại: tensor (1, C, H, W) từ transform open_clip
         """
-        if isinstance(image_input, (str, Path)):
-            image = Image.open(image_input).convert('RGB')
-        elif isinstance(image_input, Image.Image):
-            image = image_input.convert('RGB')
-        else:
-            raise ValueError("image_input phải là đường dẫn hoặc PIL Image")
+        image = self._open_image(image_input)
         
+        if self.fast_preprocess:
+            return resize_crop(image, self.preprocess_config)
         return self.preprocess(image).unsqueeze(0).to(self.device)
     
-    def classify(
-        self, 
-        image_input: Union[str, Path, Image.Image],
-        top_k: int = 5
-    ) -> List[tuple]:
+    def _stack(self, arrays: List) -> torch.Tensor:
+        if self.fast_preprocess:
+            # Chuẩn hóa gộp, ghi thẳng vào buffer batch của thread hiện tại
+            return torch.from_numpy(self._batch_buffer.fill(arrays)).to(self.device)
+        return torch.cat(arrays)
+    
+    def _encode(self, image_tensor: torch.Tensor) -> torch.Tensor:
         """
-        Phân loại bệnh từ ảnh
-        
-        Args:
-            image_input: Ảnh đầu vào
-            top_k: Số lượng kết quả hàng đầu trả về
-            
-        Returns:
-            List các tuple (tên_bệnh, xác_suất)
+        Encode một batch tensor ảnh (N, C, H, W) thành image features đã chuẩn hóa
         """
-        # Tải ảnh
-        image_tensor = self._load_image(image_input)
+        if self._compiled is not None and self._compiled.supports(image_tensor.shape[0]):
+            try:
+                return self._compiled(image_tensor)
+            except Exception as e:
+                logger.warning(f"Image tower biên dịch lỗi, chuyển về eager: {e}")
+                self._compiled = None
         
-        # Encode ảnh
         with torch.no_grad():
-            if self.device == "cuda":
+            if self.precision == "bf16":
+                with torch.autocast(self.device, dtype=torch.bfloat16):
+                    image_features = self.model.encode_image(image_tensor)
+                image_features = image_features.float()
+            elif self.device == "cuda":
                 with torch.autocast("cuda"):
                     image_features = self.model.encode_image(image_tensor)
+                image_features = image_features.float()
             else:
                 image_features = self.model.encode_image(image_tensor)
             
             image_features /= image_features.norm(dim=-1, keepdim=True)
-            
-            # Tính xác suất
-            logits = 100.0 * image_features @ self.text_features.T
-            probs = logits.softmax(dim=-1)[0]
-        
-        # Lấy top-k kết quả
-        top_probs, top_indices = torch.topk(probs, min(top_k, len(self.disease_list)))
-        
-        results = [
-            (self.disease_list[idx], prob.item())
-            for idx, prob in zip(top_indices, top_probs)
-        ]
-        
-        return results
-    
-    def analyze(
-        self, 
-        image_input: Union[str, Path, Image.Image],
-        top_k: int = 5,
-        include_concepts: bool = True
-    ) -> AnalysisResult:
-        """
-        Phân tích toàn diện ảnh da liễu
-        
-        Args:
-            image_input: Ảnh đầu vào
-            top_k: Số lượng chẩn đoán thay thế
-            include_concepts: Có trích xuất khái niệm lâm sàng không
-            
-        Returns:
-            AnalysisResult object với đầy đủ thông tin
-        """
-        # Phân loại bệnh
-        classifications = self.classify(image_input, top_k=top_k)
-        
-        # Lấy chẩn đoán chính
-        primary_name, primary_conf = classifications[0]
-        primary_info = get_disease_info(primary_name)
-        
-        primary_disease = DiseaseInfo(
-            name=primary_name,
-            vietnamese_name=primary_info["vietnamese"],
-            confidence=primary_conf,
-            severity=primary_info["severity"],
-            description=primary_info["description"],
-            recommendations=primary_info["recommendations"]
-        )
-        
-        # Các chẩn đoán thay thế
-        alternative_diseases = []
-        for disease_name, confidence in classifications[1:]:
-            info = get_disease_info(disease_name)
-            alternative_diseases.append(DiseaseInfo(
-                name=disease_name,
-                vietnamese_name=info["vietnamese"],
-                confidence=confidence,
-                severity=info["severity"],
-                description=info["description"],
-                recommendations=info["recommendations"]
-            ))
-        
-        # Xác định mức độ nghiêm trọng tổng thể
-        overall_severity = primary_disease.severity
         
-        # Tạo mô tả tổng quan
-        description = self._generate_description(primary_disease, classifications)
-        
-        # Trích xuất khái niệm lâm sàng (đơn giản hóa)
-        clinical_concepts = []
-        if include_concepts:
-            clinical_concepts = self._extract_concepts(primary_disease)
-        
-        # Tạo khuyến nghị tổng thể
-        recommendations = self._generate_recommendations(primary_disease)
-        
-        # Metadata
-        metadata = {
-            "model": "DermLIP",
-            "device": self.device,
-            "top_k": top_k
-        }
-        
-        return AnalysisResult(
-            primary_disease=primary_disease,
-            alternative_diseases=alternative_diseases,
-            clinical_concepts=clinical_concepts,
-            description=description,
-            overall_severity=overall_severity,
-            recommendations=recommendations,
-            metadata=metadata
-        )
+        return image_features
     
-    def _generate_description(self, primary: DiseaseInfo, classifications: List[tuple]) -> str:
-        """Tạo mô tả tổng quan"""
-        if primary.confidence > 0.7:
-            confidence_text = "rất cao"
-        elif primary.confidence > 0.5:
-            confidence_text = "khá cao"
-        elif primary.confidence > 0.3:
-            confidence_text = "trung bình"
-        else:
-            confidence_text = "thấp"
-        
-        description = (
-            f"Dựa trên phân tích ảnh, tổn thương này có khả năng {confidence_text} "
-            f"({primary.confidence:.1%}) là {primary.vietnamese_name}. "
-        )
-        
-        if primary.severity in [Severity.SEVERE, Severity.CRITICAL]:
-            description += "Đây là tình trạng cần được chú ý và khám chuyên khoa càng sớm càng tốt. "
-        elif primary.severity == Severity.MODERATE:
-            description += "Nên đặt lịch khám với bác sĩ da liễu để đánh giá chính xác. "
-        else:
-            description += "Tuy nhiên, vẫn nên theo dõi và khám định kỳ. "
-        
-        return description
+    def _probabilities(self, image_features: torch.Tensor) -> torch.Tensor:
+        """Tính xác suất (N, số bệnh) bằng một phép nhân ma trận với text features"""
+        with torch.no_grad():
+            logits = 100.0 * image_features @ self.text_features.T
+            return logits.softmax(dim=-1)
     
-    def _extract_concepts(self, disease: DiseaseInfo) -> List[str]:
-        """Trích xuất khái niệm lâm sàng (đơn giản hóa)"""
-        concepts = []
-        
-        # Dựa vào tên bệnh để gán khái niệm
-        if "carcinoma" in disease.name.lower() or "melanoma" in disease.name.lower():
-            concepts.extend(["ung thư", "cần sinh thiết", "theo dõi"])
-        elif "keratosis" in disease.name.lower():
-            concepts.extend(["dày sừng", "do ánh nắng", "tiền ung thư"])
-        elif "nevus" in disease.name.lower():
-            concepts.extend(["nốt ruồi", "lành tính", "theo dõi"])
-        elif any(term in disease.name.lower() for term in ["eczema", "dermatitis", "psoriasis"]):
-            concepts.extend(["viêm da", "ngứa", "mãn tính"])
-        
-        return concepts
+    def _to_numpy(self, image_features: torch.Tensor):
+        return image_features.float().cpu().numpy()
     
-    def _generate_recommendations(self, disease: DiseaseInfo) -> List[str]:
-        """Tạo khuyến nghị tổng thể"""
-        recommendations = disease.recommendations.copy()
-
-        # Phân nhóm đơn giản theo loại bệnh để tùy biến
-        name = disease.name.lower()
-        is_cancer_like = ("carcinoma" in name) or ("melanoma" in name) or ("keratosis" in name)
-        is_infectious_like = any(k in name for k in ["impetigo", "cellulitis", "folliculitis", "tinea"])
-        is_benign_mass = any(k in name for k in ["nevus", "dermatofibroma", "lipoma", "skin tag", "milia", "seborrheic keratosis", "cherry angioma"]) and not is_cancer_like
-
-        # Khuyến nghị theo mức độ nghiêm trọng
-        if disease.severity in [Severity.SEVERE, Severity.CRITICAL]:
-            recommendations.extend([
-                "⏱️ Khi nào cần đi khám NGAY: đau tăng nhanh, chảy máu, loét, sốt, sưng hạch, tổn thương lan rộng",
-                "📞 Nếu không liên hệ được bác sĩ, cân nhắc đến cơ sở y tế gần nhất",
-            ])
-        elif disease.severity == Severity.MODERATE:
-            recommendations.extend([
-                "📅 Nên đặt lịch khám chuyên khoa trong 1–2 tuần để đánh giá chính xác",
-            ])
-        else:
-            recommendations.extend([
-                "👀 Theo dõi định kỳ (mỗi 2–4 tuần) và chụp ảnh cùng góc/ánh sáng để so sánh",
-            ])
-
-        # Khuyến nghị theo nhóm đối tượng (dưới dạng dòng đơn để giữ tương thích)
-        audience_recs = [
-            "👤 Người lớn: ưu tiên sản phẩm dịu nhẹ, tránh tự ý dùng steroid mạnh/kháng sinh đường uống nếu chưa có chỉ định",
-            "🧒 Trẻ em: tránh sản phẩm chứa salicylic/retinoid liều cao; hỏi ý kiến bác sĩ nhi/da liễu trước khi bôi thuốc",
-            "🤰 Phụ nữ mang thai/cho con bú: tránh retinoid (tretinoin, isotretinoin) và tetracycline; dùng kem chống nắng khoáng (zinc/titanium)",
-            "❤️ Người có bệnh nền/ức chế miễn dịch: đi khám sớm hơn; không tự nặn/đốt/laser tại nhà",
-        ]
-        recommendations.extend(audience_recs)
-
-        # Chăm sóc tại nhà an toàn (generic)
-        home_care = [
-            "🧴 Chăm sóc tại nhà: vệ sinh nhẹ nhàng, giữ ẩm (không mùi), tránh cào gãi và nắng gắt; dùng SPF 50+ khi ra ngoài",
-        ]
-        recommendations.extend(home_care)
-
-        # Lưu ý theo nhóm bệnh
-        if is_infectious_like:
-            recommendations.extend([
-                "🧼 Bệnh có khả năng lây: không dùng chung khăn/dao cạo; giặt riêng đồ tiếp xúc; vệ sinh tay thường xuyên",
-            ])
-        if is_cancer_like:
-            recommendations.extend([
-                "🧪 Chuẩn bị cho khám: ghi thời điểm bắt đầu, tốc độ thay đổi, yếu tố làm nặng/giảm; mang danh sách thuốc đang dùng",
-            ])
-        if is_benign_mass:
-            recommendations.extend([
-                "💬 Thẩm mỹ: có thể cân nhắc điều trị/loại bỏ tại cơ sở y tế; không tự can thiệp tại nhà",
-            ])
-
-        # Khuyến nghị chung và miễn trừ trách nhiệm
-        general_recs = [
-            "ℹ️ Đây là hệ thống sàng lọc rủi ro, không phải chẩn đoán y khoa",
-            "🩺 Quyết định điều trị cần dựa trên tư vấn trực tiếp của bác sĩ da liễu",
-        ]
-        recommendations.extend(general_recs)
-        return recommendations
+    def _from_numpy(self, image_features) -> torch.Tensor:
+        return torch.from_numpy(image_features).to(self.device, dtype=self.text_features.dtype)
     
-    def batch_analyze(
-        self,
-        image_inputs: List[Union[str, Path, Image.Image]],
-        **kwargs
-    ) -> List[AnalysisResult]:
-        """
-        Phân tích nhiều ảnh cùng lúc
-        
-        Args:
-            image_inputs: Danh sách ảnh đầu vào
-            **kwargs: Tham số cho analyze()
-            
-        Returns:
-            List các AnalysisResult
-        """
-        results = []
-        for image_input in image_inputs:
-            try:
-                result = self.analyze(image_input, **kwargs)
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Lỗi khi phân tích {image_input}: {e}")
-                results.append(None)
+    def _top_k(self, probs: torch.Tensor, top_k: int) -> List[tuple]:
+        """Lấy top-k (tên_bệnh, xác_suất) từ vector xác suất của một ảnh"""
+        top_probs, top_indices = torch.topk(probs, min(top_k, len(self.disease_list)))
         
-        return results
+        return [
+            (self.disease_list[idx], prob.item())
+            for idx, prob in zip(top_indices, top_probs)
+        ]
     
     def get_image_embedding(self, image_input: Union[str, Path, Image.Image]) -> torch.Tensor:
         """
@@ -362,13 +319,9 @@ class DermatologyAnalyzer:
         Returns:
             Tensor embedding đã chuẩn hóa
         """
-        image_tensor = self._load_image(image_input)
+        image_tensor = self._stack([self._load_image(image_input)])
         
-        with torch.no_grad():
-            image_features = self.model.encode_image(image_tensor)
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-        
-        return image_features
+        return self._encode(image_tensor)
     
     def search_by_text(self, text_query: str, top_k: int = 5) -> List[tuple]:
         """
@@ -382,12 +335,9 @@ class DermatologyAnalyzer:
             List các tuple (tên_bệnh, độ_tương_đồng)
         """
         # Encode văn bản
-        text_tokens = self.tokenizer([text_query]).to(self.device)
+        query_features = self._encode_query(text_query)
         
         with torch.no_grad():
-            query_features = self.model.encode_text(text_tokens)
-            query_features /= query_features.norm(dim=-1, keepdim=True)
-            
             # Tính độ tương đồng
             similarities = (100.0 * query_features @ self.text_features.T)[0]
         
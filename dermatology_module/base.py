@@ -0,0 +1,600 @@
+"""
+Phần dùng chung (không phụ thuộc torch) cho các engine phân tích ảnh da liễu
+
+Engine cụ thể (PyTorch/open_clip, ONNX Runtime, ...) chỉ cần cài đặt các hook
+tiền xử lý, encode ảnh và tính xác suất; phần dựng kết quả, mô tả và khuyến
+nghị nằm ở đây.
+"""
+from PIL import Image
+from pathlib import Path
+from typing import Any, Dict, Tuple, Union, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+
+import numpy as np
+
+from .models import AnalysisResult, DiseaseInfo, Severity
+from .disease_database import get_disease_info
+from .tta import (
+    make_views,
+    reduce_views,
+    resolve_tta_mode,
+    top2_margin,
+    top_k_from_probs,
+    tta_margin,
+    tta_reduction,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseDermatologyAnalyzer:
+    """
+    Lớp cơ sở cho các engine phân tích ảnh da liễu
+    
+    Lớp con phải khởi tạo self.disease_list, self.device và cài đặt:
+        - _load_image: ảnh -> mảng (1, C, H, W) đã tiền xử lý
+        - _stack: ghép nhiều mảng (1, C, H, W) thành một batch
+        - _encode: batch -> image features đã chuẩn hóa
+        - _probabilities: image features -> xác suất (N, số bệnh)
+        - _top_k: vector xác suất của một ảnh -> List (tên_bệnh, xác_suất)
+    """
+    
+    backend = "base"
+    precision = "fp32"
+    # Fingerprint ngắn của trọng số image tower ("" nếu engine không tính)
+    weights_version = ""
+    # Chế độ TTA mặc định: off | auto | always (None: DERM_TTA)
+    tta: Optional[str] = None
+    disease_list: List[str]
+    device: str
+    
+    def _open_image(self, image_input: Union[str, Path, Image.Image, np.ndarray]) -> Image.Image:
+        """Mở ảnh từ đường dẫn, PIL Image hoặc mảng RGB uint8 (H, W, 3), chuyển sang RGB"""
+        if isinstance(image_input, (str, Path)):
+            return Image.open(image_input).convert('RGB')
+        elif isinstance(image_input, Image.Image):
+            # Ảnh đã là RGB thì dùng luôn (convert sẽ sao chép cả ảnh)
+            return image_input if image_input.mode == 'RGB' else image_input.convert('RGB')
+        elif isinstance(image_input, np.ndarray):
+            # Ví dụ ảnh đã enhance: đi thẳng vào tiền xử lý, không encode/decode lại
+            return Image.fromarray(np.ascontiguousarray(image_input), 'RGB')
+        raise ValueError("image_input phải là đường dẫn, PIL Image hoặc mảng numpy RGB")
+    
+    def _load_image(self, image_input: Union[str, Path, Image.Image]) -> Any:
+        raise NotImplementedError
+    
+    def _stack(self, arrays: List[Any]) -> Any:
+        raise NotImplementedError
+    
+    def _encode(self, image_batch: Any) -> Any:
+        raise NotImplementedError
+    
+    def _probabilities(self, image_features: Any) -> Any:
+        raise NotImplementedError
+    
+    def _top_k(self, probs: Any, top_k: int) -> List[tuple]:
+        raise NotImplementedError
+    
+    def _to_numpy(self, image_features: Any) -> np.ndarray:
+        """Image features dạng của engine -> numpy float32"""
+        return np.asarray(image_features, dtype=np.float32)
+    
+    def _from_numpy(self, image_features: np.ndarray) -> Any:
+        """numpy float32 -> image features dạng của engine"""
+        return image_features
+    
+    @property
+    def model_id(self) -> str:
+        """Định danh phiên bản mô hình (dùng làm namespace cho cache image features)
+
+        Gồm cả fingerprint trọng số: thay checkpoint mà giữ tên mô hình vẫn đổi namespace.
+        """
+        model_id = f"{self.backend}:{getattr(self, 'model_name', 'unknown')}:{self.precision}"
+        return f"{model_id}:{self.weights_version}" if self.weights_version else model_id
+
+    def memory_bytes(self) -> int:
+        """Ước lượng bộ nhớ của mô hình (byte), dùng cho ngân sách bộ nhớ của registry"""
+        return 0
+
+    def classify(
+        self, 
+        image_input: Union[str, Path, Image.Image],
+        top_k: int = 5,
+        tta: Optional[str] = None
+    ) -> List[tuple]:
+        """
+        Phân loại bệnh từ ảnh
+        
+        Args:
+            image_input: Ảnh đầu vào
+            top_k: Số lượng kết quả hàng đầu trả về
+            tta: Chế độ test-time augmentation "off" / "auto" / "always"
+                 (None: chế độ của analyzer, mặc định DERM_TTA)
+            
+        Returns:
+            List các tuple (tên_bệnh, xác_suất)
+        """
+        if resolve_tta_mode(tta or self.tta) != "off":
+            return self.classify_with_uncertainty(image_input, top_k=top_k, tta=tta)[0]
+        
+        # Tải ảnh
+        image_tensor = self._stack([self._load_image(image_input)])
+        
+        # Encode ảnh và tính xác suất
+        image_features = self._encode(image_tensor)
+        probs = self._probabilities(image_features)[0]
+        
+        return self._top_k(probs, top_k)
+    
+    def needs_tta(self, single_view_margin: float, tta: Optional[str] = None) -> bool:
+        """Có chạy TTA cho ảnh có khoảng cách top-1/top-2 (view gốc) này không"""
+        mode = resolve_tta_mode(tta or self.tta)
+        return mode == "always" or (mode == "auto" and single_view_margin < tta_margin())
+    
+    def classify_with_uncertainty(
+        self,
+        image_input: Union[str, Path, Image.Image],
+        top_k: int = 5,
+        tta: Optional[str] = None,
+        image_features: Optional[np.ndarray] = None
+    ) -> Tuple[List[tuple], Optional[Dict]]:
+        """
+        Phân loại kèm test-time augmentation và tín hiệu bất định
+        
+        Các view (lật, xoay nhẹ, crop đa tỉ lệ) được ghép thành một batch và encode
+        trong một lần forward; với "auto" chỉ chạy khi margin của view gốc nhỏ.
+        
+        Args:
+            image_input: Ảnh đầu vào
+            top_k: Số lượng kết quả hàng đầu trả về
+            tta: "off" / "auto" / "always" (None: chế độ của analyzer)
+            image_features: Image features (D,) của view gốc nếu đã có (ví dụ từ cache),
+                            khi đó chỉ còn encode các view augment
+            
+        Returns:
+            (List (tên_bệnh, xác_suất), thông tin TTA hoặc None khi tắt)
+        """
+        mode = resolve_tta_mode(tta or self.tta)
+        image = self._open_image(image_input)
+        
+        if image_features is None and mode == "always":
+            # View gốc chung batch với các view augment: đúng một lần forward
+            batch = [image] + make_views(image)
+            view_features = self._to_numpy(self._encode(self._stack([self._load_image(v) for v in batch])))
+        else:
+            if image_features is None:
+                image_features = self._to_numpy(self._encode(self._stack([self._load_image(image)])))[0]
+            single = np.asarray(image_features, dtype=np.float32).reshape(1, -1)
+            single_probs = self._score_features(single)[0]
+            if not self.needs_tta(top2_margin(single_probs), mode):
+                info = None if mode == "off" else {"applied": False, "single_view_margin": top2_margin(single_probs)}
+                return top_k_from_probs(single_probs, self.disease_list, top_k), info
+            views = make_views(image)
+            augmented = self._to_numpy(self._encode(self._stack([self._load_image(v) for v in views])))
+            view_features = np.concatenate([single, augmented])
+        
+        view_probs = self._score_features(view_features)
+        probs, info = reduce_views(view_probs, view_features, self._score_features, tta_reduction())
+        return top_k_from_probs(probs, self.disease_list, top_k), info
+    
+    def _score_features(self, image_features: np.ndarray) -> np.ndarray:
+        """Image features numpy (N, D) -> xác suất numpy (N, số bệnh)"""
+        return self._to_numpy(self._probabilities(self._from_numpy(np.ascontiguousarray(image_features, dtype=np.float32))))
+    
+    def analyze_with_tta(
+        self,
+        image_input: Union[str, Path, Image.Image],
+        top_k: int = 5,
+        include_concepts: bool = True,
+        tta: Optional[str] = None,
+        image_features: Optional[np.ndarray] = None
+    ) -> AnalysisResult:
+        """Như analyze nhưng qua classify_with_uncertainty; thông tin TTA nằm ở metadata["tta"]"""
+        classifications, info = self.classify_with_uncertainty(
+            image_input, top_k=top_k, tta=tta, image_features=image_features
+        )
+        result = self.build_result(classifications, top_k=top_k, include_concepts=include_concepts)
+        if info is not None:
+            result.metadata["tta"] = info
+        return result
+    
+    def analyze(
+        self, 
+        image_input: Union[str, Path, Image.Image],
+        top_k: int = 5,
+        include_concepts: bool = True,
+        tta: Optional[str] = None
+    ) -> AnalysisResult:
+        """
+        Phân tích toàn diện ảnh da liễu
+        
+        Args:
+            image_input: Ảnh đầu vào
+            top_k: Số lượng chẩn đoán thay thế
+            include_concepts: Có trích xuất khái niệm lâm sàng không
+            tta: Chế độ test-time augmentation (None: chế độ của analyzer, mặc định DERM_TTA)
+            
+        Returns:
+            AnalysisResult object với đầy đủ thông tin
+        """
+        if resolve_tta_mode(tta or self.tta) != "off":
+            return self.analyze_with_tta(image_input, top_k=top_k, include_concepts=include_concepts, tta=tta)
+        
+        # Phân loại bệnh
+        classifications = self.classify(image_input, top_k=top_k)
+        
+        return self.build_result(classifications, top_k=top_k, include_concepts=include_concepts)
+    
+    def analyze_batch(
+        self,
+        image_inputs: List[Union[str, Path, Image.Image]],
+        top_k: int = 5,
+        include_concepts: bool = True
+    ) -> List[Union[AnalysisResult, Exception]]:
+        """
+        Phân tích một batch ảnh với một lần encode_image và một phép nhân ma trận
+        
+        Ảnh nào lỗi khi tải/tiền xử lý sẽ nhận Exception tại đúng vị trí của nó,
+        các ảnh còn lại vẫn được phân tích bình thường.
+        
+        Args:
+            image_inputs: Danh sách ảnh đầu vào
+            top_k: Số lượng chẩn đoán thay thế
+            include_concepts: Có trích xuất khái niệm lâm sàng không
+            
+        Returns:
+            List cùng độ dài với image_inputs, mỗi phần tử là AnalysisResult hoặc Exception
+        """
+        loaded = [self._try_load_image(image_input) for image_input in image_inputs]
+        return self._analyze_loaded(loaded, top_k=top_k, include_concepts=include_concepts)
+    
+    def _try_load_image(self, image_input) -> Union[Any, Exception]:
+        """Như _load_image nhưng trả về Exception thay vì raise (dùng cho batch)"""
+        try:
+            return self._load_image(image_input)
+        except Exception as e:
+            return e
+    
+    def _analyze_loaded(
+        self,
+        loaded: List[Union[Any, Exception]],
+        top_k: int = 5,
+        include_concepts: bool = True
+    ) -> List[Union[AnalysisResult, Exception]]:
+        """
+        Encode các tensor đã tiền xử lý trong một lần forward rồi dựng kết quả
+        
+        Nếu forward cả batch lỗi, chạy lại từng ảnh để chỉ ảnh lỗi nhận Exception.
+        """
+        outputs: List[Union[AnalysisResult, Exception]] = [None] * len(loaded)
+        tensors, positions = [], []
+        for i, item in enumerate(loaded):
+            if isinstance(item, Exception):
+                outputs[i] = item
+            else:
+                tensors.append(item)
+                positions.append(i)
+        
+        if not tensors:
+            return outputs
+        
+        try:
+            probs = self._probabilities(self._encode(self._stack(tensors)))
+        except Exception as e:
+            if len(tensors) == 1:
+                outputs[positions[0]] = e
+                return outputs
+            for tensor, i in zip(tensors, positions):
+                outputs[i] = self._analyze_loaded([tensor], top_k=top_k, include_concepts=include_concepts)[0]
+            return outputs
+        
+        for row, i in enumerate(positions):
+            try:
+                classifications = self._top_k(probs[row], top_k)
+                outputs[i] = self.build_result(classifications, top_k=top_k, include_concepts=include_concepts)
+            except Exception as e:
+                outputs[i] = e
+        
+        return outputs
+    
+    def embed_batch(
+        self,
+        image_inputs: List[Union[str, Path, Image.Image]]
+    ) -> List[Union[np.ndarray, Exception]]:
+        """
+        Encode một batch ảnh thành image features đã chuẩn hóa trong một lần forward
+        
+        Args:
+            image_inputs: Danh sách ảnh đầu vào
+            
+        Returns:
+            List cùng độ dài với image_inputs, mỗi phần tử là vector numpy float32 (D,)
+            hoặc Exception nếu ảnh đó lỗi
+        """
+        loaded = [self._try_load_image(image_input) for image_input in image_inputs]
+        return self._embed_loaded(loaded)
+    
+    def _embed_loaded(self, loaded: List[Union[Any, Exception]]) -> List[Union[np.ndarray, Exception]]:
+        outputs: List[Union[np.ndarray, Exception]] = [None] * len(loaded)
+        tensors, positions = [], []
+        for i, item in enumerate(loaded):
+            if isinstance(item, Exception):
+                outputs[i] = item
+            else:
+                tensors.append(item)
+                positions.append(i)
+        
+        if not tensors:
+            return outputs
+        
+        try:
+            features = self._to_numpy(self._encode(self._stack(tensors)))
+        except Exception as e:
+            if len(tensors) == 1:
+                outputs[positions[0]] = e
+                return outputs
+            for tensor, i in zip(tensors, positions):
+                outputs[i] = self._embed_loaded([tensor])[0]
+            return outputs
+        
+        for row, i in enumerate(positions):
+            outputs[i] = features[row]
+        return outputs
+    
+    def analyze_features(
+        self,
+        image_features: np.ndarray,
+        top_k: int = 5,
+        include_concepts: bool = True
+    ) -> List[AnalysisResult]:
+        """
+        Phân tích từ image features đã có sẵn (ví dụ lấy từ cache), không chạy image encoder
+        
+        Args:
+            image_features: Mảng (N, D) image features đã chuẩn hóa
+            top_k: Số lượng chẩn đoán thay thế
+            include_concepts: Có trích xuất khái niệm lâm sàng không
+            
+        Returns:
+            List N AnalysisResult
+        """
+        features = np.asarray(image_features, dtype=np.float32)
+        if features.ndim == 1:
+            features = features[None]
+        probs = self._probabilities(self._from_numpy(features))
+        return [
+            self.build_result(self._top_k(probs[row], top_k), top_k=top_k, include_concepts=include_concepts)
+            for row in range(features.shape[0])
+        ]
+    
+    def build_result(
+        self,
+        classifications: List[tuple],
+        top_k: int = 5,
+        include_concepts: bool = True
+    ) -> AnalysisResult:
+        """
+        Dựng AnalysisResult từ kết quả phân loại top-k
+        
+        Args:
+            classifications: List các tuple (tên_bệnh, xác_suất), sắp xếp giảm dần
+            top_k: Số lượng chẩn đoán thay thế (ghi vào metadata)
+            include_concepts: Có trích xuất khái niệm lâm sàng không
+            
+        Returns:
+            AnalysisResult object với đầy đủ thông tin
+        """
+        # Lấy chẩn đoán chính
+        primary_name, primary_conf = classifications[0]
+        primary_info = get_disease_info(primary_name)
+        
+        primary_disease = DiseaseInfo(
+            name=primary_name,
+            vietnamese_name=primary_info["vietnamese"],
+            confidence=primary_conf,
+            severity=primary_info["severity"],
+            description=primary_info["description"],
+            recommendations=primary_info["recommendations"]
+        )
+        
+        # Các chẩn đoán thay thế
+        alternative_diseases = []
+        for disease_name, confidence in classifications[1:]:
+            info = get_disease_info(disease_name)
+            alternative_diseases.append(DiseaseInfo(
+                name=disease_name,
+                vietnamese_name=info["vietnamese"],
+                confidence=confidence,
+                severity=info["severity"],
+                description=info["description"],
+                recommendations=info["recommendations"]
+            ))
+        
+        # Xác định mức độ nghiêm trọng tổng thể
+        overall_severity = primary_disease.severity
+        
+        # Tạo mô tả tổng quan
+        description = self._generate_description(primary_disease, classifications)
+        
+        # Trích xuất khái niệm lâm sàng (đơn giản hóa)
+        clinical_concepts = []
+        if include_concepts:
+            clinical_concepts = self._extract_concepts(primary_disease)
+        
+        # Tạo khuyến nghị tổng thể
+        recommendations = self._generate_recommendations(primary_disease)
+        
+        # Metadata
+        metadata = {
+            "model": "DermLIP",
+            "backend": self.backend,
+            "precision": self.precision,
+            "device": self.device,
+            "top_k": top_k
+        }
+        
+        return AnalysisResult(
+            primary_disease=primary_disease,
+            alternative_diseases=alternative_diseases,
+            clinical_concepts=clinical_concepts,
+            description=description,
+            overall_severity=overall_severity,
+            recommendations=recommendations,
+            metadata=metadata
+        )
+    
+    def _generate_description(self, primary: DiseaseInfo, classifications: List[tuple]) -> str:
+        """Tạo mô tả tổng quan"""
+        if primary.confidence > 0.7:
+            confidence_text = "rất cao"
+        elif primary.confidence > 0.5:
+            confidence_text = "khá cao"
+        elif primary.confidence > 0.3:
+            confidence_text = "trung bình"
+        else:
+            confidence_text = "thấp"
+        
+        description = (
+            f"Dựa trên phân tích ảnh, tổn thương này có khả năng {confidence_text} "
+            f"({primary.confidence:.1%}) là {primary.vietnamese_name}. "
+        )
+        
+        if primary.severity in [Severity.SEVERE, Severity.CRITICAL]:
+            description += "Đây là tình trạng cần được chú ý và khám chuyên khoa càng sớm càng tốt. "
+        elif primary.severity == Severity.MODERATE:
+            description += "Nên đặt lịch khám với bác sĩ da liễu để đánh giá chính xác. "
+        else:
+            description += "Tuy nhiên, vẫn nên theo dõi và khám định kỳ. "
+        
+        return description
+    
+    def _extract_concepts(self, disease: DiseaseInfo) -> List[str]:
+        """Trích xuất khái niệm lâm sàng (đơn giản hóa)"""
+        concepts = []
+        
+        # Dựa vào tên bệnh để gán khái niệm
+        if "carcinoma" in disease.name.lower() or "melanoma" in disease.name.lower():
+            concepts.extend(["ung thư", "cần sinh thiết", "theo dõi"])
+        elif "keratosis" in disease.name.lower():
+            concepts.extend(["dày sừng", "do ánh nắng", "tiền ung thư"])
+        elif "nevus" in disease.name.lower():
+            concepts.extend(["nốt ruồi", "lành tính", "theo dõi"])
+        elif any(term in disease.name.lower() for term in ["eczema", "dermatitis", "psoriasis"]):
+            concepts.extend(["viêm da", "ngứa", "mãn tính"])
+        
+        return concepts
+    
+    def _generate_recommendations(self, disease: DiseaseInfo) -> List[str]:
+        """Tạo khuyến nghị tổng thể"""
+        recommendations = disease.recommendations.copy()
+
+        # Phân nhóm đơn giản theo loại bệnh để tùy biến
+        name = disease.name.lower()
+        is_cancer_like = ("carcinoma" in name) or ("melanoma" in name) or ("keratosis" in name)
+        is_infectious_like = any(k in name for k in ["impetigo", "cellulitis", "folliculitis", "tinea"])
+        is_benign_mass = any(k in name for k in ["nevus", "dermatofibroma", "lipoma", "skin tag", "milia", "seborrheic keratosis", "cherry angioma"]) and not is_cancer_like
+
+        # Khuyến nghị theo mức độ nghiêm trọng
+        if disease.severity in [Severity.SEVERE, Severity.CRITICAL]:
+            recommendations.extend([
+                "⏱️ Khi nào cần đi khám NGAY: đau tăng nhanh, chảy máu, loét, sốt, sưng hạch, tổn thương lan rộng",
+                "📞 Nếu không liên hệ được bác sĩ, cân nhắc đến cơ sở y tế gần nhất",
+            ])
+        elif disease.severity == Severity.MODERATE:
+            recommendations.extend([
+                "📅 Nên đặt lịch khám chuyên khoa trong 1–2 tuần để đánh giá chính xác",
+            ])
+        else:
+            recommendations.extend([
+                "👀 Theo dõi định kỳ (mỗi 2–4 tuần) và chụp ảnh cùng góc/ánh sáng để so sánh",
+            ])
+
+        # Khuyến nghị theo nhóm đối tượng (dưới dạng dòng đơn để giữ tương thích)
+        audience_recs = [
+            "👤 Người lớn: ưu tiên sản phẩm dịu nhẹ, tránh tự ý dùng steroid mạnh/kháng sinh đường uống nếu chưa có chỉ định",
+            "🧒 Trẻ em: tránh sản phẩm chứa salicylic/retinoid liều cao; hỏi ý kiến bác sĩ nhi/da liễu trước khi bôi thuốc",
+            "🤰 Phụ nữ mang thai/cho con bú: tránh retinoid (tretinoin, isotretinoin) và tetracycline; dùng kem chống nắng khoáng (zinc/titanium)",
+            "❤️ Người có bệnh nền/ức chế miễn dịch: đi khám sớm hơn; không tự nặn/đốt/laser tại nhà",
+        ]
+        recommendations.extend(audience_recs)
+
+        # Chăm sóc tại nhà an toàn (generic)
+        home_care = [
+            "🧴 Chăm sóc tại nhà: vệ sinh nhẹ nhàng, giữ ẩm (không mùi), tránh cào gãi và nắng gắt; dùng SPF 50+ khi ra ngoài",
+        ]
+        recommendations.extend(home_care)
+
+        # Lưu ý theo nhóm bệnh
+        if is_infectious_like:
+            recommendations.extend([
+                "🧼 Bệnh có khả năng lây: không dùng chung khăn/dao cạo; giặt riêng đồ tiếp xúc; vệ sinh tay thường xuyên",
+            ])
+        if is_cancer_like:
+            recommendations.extend([
+                "🧪 Chuẩn bị cho khám: ghi thời điểm bắt đầu, tốc độ thay đổi, yếu tố làm nặng/giảm; mang danh sách thuốc đang dùng",
+            ])
+        if is_benign_mass:
+            recommendations.extend([
+                "💬 Thẩm mỹ: có thể cân nhắc điều trị/loại bỏ tại cơ sở y tế; không tự can thiệp tại nhà",
+            ])
+
+        # Khuyến nghị chung và miễn trừ trách nhiệm
+        general_recs = [
+            "ℹ️ Đây là hệ thống sàng lọc rủi ro, không phải chẩn đoán y khoa",
+            "🩺 Quyết định điều trị cần dựa trên tư vấn trực tiếp của bác sĩ da liễu",
+        ]
+        recommendations.extend(general_recs)
+        return recommendations
+    
+    def batch_analyze(
+        self,
+        image_inputs: List[Union[str, Path, Image.Image]],
+        top_k: int = 5,
+        include_concepts: bool = True,
+        batch_size: int = 16,
+        num_workers: Optional[int] = None
+    ) -> List[Optional[AnalysisResult]]:
+        """
+        Phân tích nhiều ảnh cùng lúc
+        
+        Ảnh được tiền xử lý song song trong thread pool, ghép thành các chunk
+        tensor kích thước batch_size; mỗi chunk chạy một lần encode_image và một
+        phép nhân ma trận với text features. Trong lúc chunk hiện tại đang encode,
+        chunk kế tiếp đã được tiền xử lý.
+        
+        Args:
+            image_inputs: Danh sách ảnh đầu vào
+            top_k: Số lượng chẩn đoán thay thế
+            include_concepts: Có trích xuất khái niệm lâm sàng không
+            batch_size: Số ảnh mỗi lần forward
+            num_workers: Số thread tiền xử lý (mặc định: min(4, số CPU))
+            
+        Returns:
+            List các AnalysisResult (None cho ảnh bị lỗi)
+        """
+        batch_size = max(1, int(batch_size))
+        if num_workers is None:
+            num_workers = min(4, os.cpu_count() or 1)
+        chunks = [image_inputs[i:i + batch_size] for i in range(0, len(image_inputs), batch_size)]
+        
+        results: List[Optional[AnalysisResult]] = []
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as pool:
+            pending = [pool.submit(self._try_load_image, x) for x in chunks[0]] if chunks else []
+            for index, chunk in enumerate(chunks):
+                loaded = [f.result() for f in pending]
+                # Tiền xử lý chunk kế tiếp trong lúc chunk hiện tại đang encode
+                if index + 1 < len(chunks):
+                    pending = [pool.submit(self._try_load_image, x) for x in chunks[index + 1]]
+                
+                outputs = self._analyze_loaded(loaded, top_k=top_k, include_concepts=include_concepts)
+                for image_input, output in zip(chunk, outputs):
+                    if isinstance(output, Exception):
+                        logger.error(f"Lỗi khi phân tích {image_input}: {output}")
+                        results.append(None)
+                    else:
+                        results.append(output)
+        
+        return results
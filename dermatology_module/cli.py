@@ -26,8 +26,8 @@ Ví dụ:
   # Phân tích và lưu kết quả ra JSON
   dermatology-analyze image.jpg --output result.json
   
-  # Phân tích nhiều ảnh
-  dermatology-analyze img1.jpg img2.jpg img3.jpg
+  # Phân tích nhiều ảnh (theo batch)
+  dermatology-analyze img1.jpg img2.jpg img3.jpg --batch-size 8
   
   # Sử dụng mô hình PanDerm
   dermatology-analyze image.jpg --model panderm
@@ -70,6 +70,20 @@ Ví dụ:
         help='Số lượng chẩn đoán thay thế (mặc định: 5)'
     )
     
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=16,
+        help='Số ảnh mỗi lần chạy mô hình khi phân tích nhiều ảnh (mặc định: 16)'
+    )
+    
+    parser.add_argument(
+        '--tta',
+        choices=['off', 'auto', 'always'],
+        default=None,
+        help='Test-time augmentation khi --classify-only (auto: chỉ ca khó phân định; mặc định: DERM_TTA)'
+    )
+    
     parser.add_argument(
         '--output',
         '-o',
@@ -108,7 +122,8 @@ Ví dụ:
     try:
         analyzer = DermatologyAnalyzer(
             model_name=model_name,
-            device=device
+            device=device,
+            tta=args.tta
         )
     except Exception as e:
         print(f"Lỗi khi tải mô hình: {e}", file=sys.stderr)
@@ -116,18 +131,31 @@ Ví dụ:
     
     # Phân tích từng ảnh
     results = []
+    image_paths = []
     for image_path in args.images:
         if not Path(image_path).exists():
             print(f"Cảnh báo: Không tìm thấy file {image_path}", file=sys.stderr)
             continue
-        
+        image_paths.append(image_path)
+    
+    # Phân tích đầy đủ: chạy theo batch (một lần forward cho mỗi batch ảnh)
+    batch_results = {}
+    if not args.classify_only and image_paths:
+        if not args.quiet:
+            print(f"Đang phân tích {len(image_paths)} ảnh (batch size {args.batch_size})...")
+        batch_results = dict(zip(
+            image_paths,
+            analyzer.batch_analyze(image_paths, top_k=args.top_k, batch_size=args.batch_size)
+        ))
+    
+    for image_path in image_paths:
         if not args.quiet:
             print(f"\nĐang phân tích: {image_path}")
         
         try:
             if args.classify_only:
                 # Chỉ phân loại
-                classifications = analyzer.classify(image_path, top_k=args.top_k)
+                classifications, tta_info = analyzer.classify_with_uncertainty(image_path, top_k=args.top_k)
                 
                 if args.json:
                     result_data = {
@@ -135,16 +163,22 @@ Ví dụ:
                         "classifications": [
                             {"disease": d, "confidence": float(c)}
                             for d, c in classifications
-                        ]
+                        ],
+                        "tta": tta_info
                     }
                     results.append(result_data)
                 else:
                     print(f"\nKết quả cho {image_path}:")
                     for i, (disease, conf) in enumerate(classifications, 1):
                         print(f"  {i}. {disease}: {conf:.1%}")
+                    if tta_info and tta_info.get("applied"):
+                        print(f"  TTA: {tta_info['views']} view, đồng thuận {tta_info['agreement']:.0%}, "
+                              f"độ lệch top-1 ±{tta_info['top1_std']:.1%}")
             else:
-                # Phân tích đầy đủ
-                result = analyzer.analyze(image_path, top_k=args.top_k)
+                # Phân tích đầy đủ (đã chạy theo batch ở trên)
+                result = batch_results.get(image_path)
+                if result is None:
+                    raise RuntimeError("phân tích thất bại")
                 
                 if args.json:
                     result_data = result.to_dict()
@@ -0,0 +1,303 @@
+"""
+Image tower biên dịch sẵn (TorchScript / AOTInductor) với cache trên đĩa
+
+Mặc định _encode chạy đồ thị eager của model.encode_image. Chế độ tùy chọn
+DERM_COMPILE biên dịch một lần image tower (kèm chuẩn hóa L2) rồi lưu artifact
+vào thư mục cache, các lần khởi động sau chỉ cần nạp lại:
+
+    - trace: torch.jit.trace + freeze cho từng batch size cố định
+      (DERM_COMPILE_BATCH_SIZES, mặc định 1 và DERM_BATCH_MAX_SIZE); batch size
+      khác chạy eager (ghi log một lần cho mỗi batch size).
+      Không cần trình biên dịch C++.
+    - aot: torch.export + AOTInductor, một artifact .pt2 cho mọi batch size
+      từ 1 tới batch size lớn nhất đã cấu hình (cần trình biên dịch C++ lúc build).
+
+Biên dịch hoặc nạp lỗi thì analyzer giữ nguyên đường eager. Chỉ áp dụng cho
+image tower fp32 trên CPU.
+
+Đo eager và compiled:
+    python -m dermatology_module.compiled --mode aot --batch-sizes 1,8
+"""
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import torch
+
+from .text_cache import weights_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+COMPILE_MODES = ("off", "trace", "aot")
+
+# Tăng khi cách build artifact thay đổi
+COMPILE_CACHE_VERSION = 1
+
+
+def resolve_compile_mode(mode: Optional[str] = None) -> str:
+    """Chuẩn hóa chế độ biên dịch; None -> biến môi trường DERM_COMPILE (mặc định off)"""
+    value = (mode or os.getenv("DERM_COMPILE") or "off").strip().lower()
+    if value in {"0", "false", "no", "eager"}:
+        value = "off"
+    if value not in COMPILE_MODES:
+        raise ValueError(f"compile phải là một trong {COMPILE_MODES}, nhận được: {value!r}")
+    return value
+
+
+def compile_batch_sizes() -> List[int]:
+    """
+    Batch size cần biên dịch: DERM_COMPILE_BATCH_SIZES
+
+    Mặc định 1 và batch lớn nhất của micro-batcher (DERM_BATCH_MAX_SIZE, mặc định 8),
+    để batch đầy của service luôn có artifact.
+    """
+    raw = os.getenv("DERM_COMPILE_BATCH_SIZES") or f"1,{os.getenv('DERM_BATCH_MAX_SIZE', '8')}"
+    return sorted({int(x) for x in raw.split(",") if x.strip() and int(x) > 0}) or [1]
+
+
+class NormalizedImageEncoder(torch.nn.Module):
+    """encode_image + chuẩn hóa L2, để phía sau chỉ còn một phép nhân ma trận"""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        features = self.model.encode_image(pixel_values)
+        return features / features.norm(dim=-1, keepdim=True)
+
+
+class CompiledImageEncoder:
+    """
+    Image encoder đã biên dịch: (N, C, H, W) -> image features đã chuẩn hóa
+
+    supports(n) cho biết batch size n có artifact hay không (không thì caller chạy eager).
+    """
+
+    def __init__(self, mode: str, runners: Dict[int, Callable], max_batch: int, dynamic: bool):
+        self.mode = mode
+        self.runners = runners
+        self.max_batch = max_batch
+        self.dynamic = dynamic
+        self._missed = set()
+
+    def __deepcopy__(self, memo):
+        # Artifact chỉ đọc: các bản copy của analyzer (precision.py) dùng chung
+        return self
+
+    def supports(self, batch_size: int) -> bool:
+        if self.dynamic:
+            supported = 1 <= batch_size <= self.max_batch
+        else:
+            supported = batch_size in self.runners
+        if not supported and batch_size not in self._missed:
+            self._missed.add(batch_size)
+            logger.info(f"Batch size {batch_size} không có artifact {self.mode}, chạy eager (DERM_COMPILE_BATCH_SIZES)")
+        return supported
+
+    def __call__(self, image_batch: torch.Tensor) -> torch.Tensor:
+        runner = self.runners[0] if self.dynamic else self.runners[image_batch.shape[0]]
+        with torch.inference_mode():
+            return runner(image_batch)
+
+
+def compile_cache_key(
+    model: torch.nn.Module,
+    model_name: str,
+    mode: str,
+    image_size: Sequence[int],
+    batch_sizes: Sequence[int],
+    weights_hash: Optional[str] = None,
+) -> str:
+    if weights_hash is None:
+        weights_hash = weights_fingerprint(model, lambda name: name.startswith("visual."))
+    payload = json.dumps(
+        {
+            "version": COMPILE_CACHE_VERSION,
+            "mode": mode,
+            "torch": torch.__version__,
+            "model_name": model_name,
+            "weights_hash": weights_hash,
+            "image_size": list(image_size),
+            "batch_sizes": list(batch_sizes),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _artifact_path(cache_dir: Path, key: str, mode: str, batch_size: Optional[int]) -> Path:
+    suffix = f"b{batch_size}.pt" if mode == "trace" else "dynamic.pt2"
+    return cache_dir / "compiled" / f"image_encoder-v{COMPILE_CACHE_VERSION}-{mode}-{key[:32]}-{suffix}"
+
+
+def _compact(encoder: torch.nn.Module) -> torch.nn.Module:
+    """
+    Bản sao mỗi tensor một storage riêng
+
+    Artifact ghi nguyên storage của từng trọng số; trọng số memory-map (weights.py)
+    là view của một storage bằng cả file checkpoint.
+    """
+    compact = copy.deepcopy(encoder)
+    compact.load_state_dict({k: v.clone() for k, v in encoder.state_dict().items()}, assign=True)
+    return compact
+
+
+def _build_trace(encoder: torch.nn.Module, example: torch.Tensor, path: Path) -> None:
+    with torch.no_grad():
+        traced = torch.jit.trace(_compact(encoder), example, check_trace=False)
+        traced = torch.jit.freeze(traced.eval())
+    torch.jit.save(traced, str(path))
+
+
+def _build_aot(encoder: torch.nn.Module, example: torch.Tensor, max_batch: int, path: Path) -> None:
+    # Ví dụ có batch 2 (batch 1 sẽ bị torch.export chuyên biệt hóa thành hằng số)
+    batch = torch.export.Dim("batch", min=1, max=max(2, max_batch))
+    with torch.no_grad():
+        program = torch.export.export(_compact(encoder), (example,), dynamic_shapes=({0: batch},))
+        torch._inductor.aoti_compile_and_package(program, package_path=str(path))
+
+
+def _load(mode: str, path: Path) -> Callable:
+    if mode == "trace":
+        return torch.jit.load(str(path), map_location="cpu")
+    return torch._inductor.aoti_load_package(str(path))
+
+
+def _atomic_build(build: Callable[[Path], None], path: Path) -> None:
+    """Build vào file tạm rồi os.replace, để các process song song không nạp file dở"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Giữ phần mở rộng (.pt/.pt2): aoti_compile_and_package kiểm tra đuôi file
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
+    os.close(fd)
+    try:
+        build(Path(tmp_name))
+        os.replace(tmp_name, path)
+    finally:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+
+
+def compile_image_encoder(
+    model: torch.nn.Module,
+    model_name: str,
+    mode: str,
+    image_size: Tuple[int, int],
+    cache_dir: Union[str, Path],
+    batch_sizes: Optional[Sequence[int]] = None,
+    weights_hash: Optional[str] = None,
+) -> Optional[CompiledImageEncoder]:
+    """
+    Nạp image encoder đã biên dịch từ cache, build (một lần) nếu chưa có
+
+    weights_hash: fingerprint image tower đã biết (analyzer), None thì tính từ model
+
+    Returns:
+        CompiledImageEncoder, hoặc None nếu mode là "off" hay biên dịch/nạp thất bại
+    """
+    if mode == "off":
+        return None
+    batch_sizes = sorted(set(batch_sizes or compile_batch_sizes()))
+    cache_dir = Path(cache_dir)
+    started = time.perf_counter()
+    try:
+        key = compile_cache_key(model, model_name, mode, image_size, batch_sizes, weights_hash)
+        encoder = NormalizedImageEncoder(model).eval()
+        runners: Dict[int, Callable] = {}
+        built = False
+        if mode == "trace":
+            for batch_size in batch_sizes:
+                path = _artifact_path(cache_dir, key, mode, batch_size)
+                if not path.exists():
+                    example = torch.randn(batch_size, 3, *image_size)
+                    _atomic_build(lambda tmp: _build_trace(encoder, example, tmp), path)
+                    built = True
+                runners[batch_size] = _load(mode, path)
+        else:
+            path = _artifact_path(cache_dir, key, mode, None)
+            if not path.exists():
+                example = torch.randn(2, 3, *image_size)
+                _atomic_build(lambda tmp: _build_aot(encoder, example, max(batch_sizes), tmp), path)
+                built = True
+            runners[0] = _load(mode, path)
+    except Exception as e:
+        logger.warning(f"Không biên dịch được image tower ({mode}), dùng eager: {e}")
+        return None
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Image tower {mode} {'đã biên dịch' if built else 'nạp từ cache'} trong {elapsed:.1f}s")
+    return CompiledImageEncoder(mode, runners, max(batch_sizes), dynamic=(mode == "aot"))
+
+
+def benchmark(analyzer, batch_sizes: Sequence[int], runs: int = 5) -> Dict:
+    """
+    Độ trễ encode (ms mỗi batch) của eager và compiled trên cùng analyzer
+
+    Returns:
+        Dict theo batch size, kèm sai khác lớn nhất giữa hai đường
+    """
+    compiled = analyzer._compiled
+    if compiled is None:
+        raise RuntimeError("Analyzer chưa có image tower biên dịch (compile='off' hoặc biên dịch lỗi)")
+
+    def timed(fn, batch):
+        fn(batch)  # warmup
+        start = time.perf_counter()
+        for _ in range(runs):
+            out = fn(batch)
+        return (time.perf_counter() - start) * 1000.0 / runs, out
+
+    report = {}
+    for batch_size in batch_sizes:
+        batch = torch.randn(batch_size, 3, *analyzer.preprocess_config.size)
+        analyzer._compiled = None
+        eager_ms, eager_out = timed(analyzer._encode, batch)
+        analyzer._compiled = compiled
+        if not compiled.supports(batch_size):
+            report[str(batch_size)] = {"eager_ms": round(eager_ms, 1), "compiled_ms": None}
+            continue
+        compiled_ms, compiled_out = timed(analyzer._encode, batch)
+        report[str(batch_size)] = {
+            "eager_ms": round(eager_ms, 1),
+            "compiled_ms": round(compiled_ms, 1),
+            "speedup": round(eager_ms / compiled_ms, 3),
+            "max_abs_diff": float((eager_out - compiled_out).abs().max()),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh độ trễ image tower eager và đã biên dịch")
+    parser.add_argument("--mode", choices=["trace", "aot"], required=True)
+    parser.add_argument("--model", default="hf-hub:redlessone/DermLIP_ViT-B-16", help="Tên mô hình open_clip")
+    parser.add_argument("--batch-sizes", default=None, help="Batch size cần biên dịch và đo (mặc định như DERM_COMPILE_BATCH_SIZES)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    from .analyzer import DermatologyAnalyzer
+
+    if args.batch_sizes:
+        batch_sizes = sorted({int(x) for x in args.batch_sizes.split(",") if x.strip()})
+    else:
+        batch_sizes = compile_batch_sizes()
+    os.environ["DERM_COMPILE_BATCH_SIZES"] = ",".join(map(str, batch_sizes))
+    started = time.perf_counter()
+    analyzer = DermatologyAnalyzer(model_name=args.model, device="cpu", precision="fp32", compile_mode=args.mode)
+    report = {
+        "mode": args.mode,
+        "init_seconds": round(time.perf_counter() - started, 2),
+        "batches": benchmark(analyzer, batch_sizes, runs=args.runs),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
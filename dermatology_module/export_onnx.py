@@ -0,0 +1,117 @@
+"""
+Export image tower của DermLIP sang ONNX cùng ma trận text features
+
+Artifact sinh ra dùng cho OnnxDermatologyAnalyzer (phục vụ không cần torch):
+    <out_dir>/image_encoder.onnx
+    <out_dir>/text_features.npy
+    <out_dir>/manifest.json
+
+Example:
+    python -m dermatology_module.export_onnx --out models/dermlip-onnx
+"""
+import argparse
+import hashlib
+import inspect
+import json
+from pathlib import Path
+from typing import Dict, Union
+
+import numpy as np
+import torch
+
+from .analyzer import DermatologyAnalyzer, PROMPT_TEMPLATE
+from .compiled import NormalizedImageEncoder
+from .onnx_analyzer import ONNX_FILENAME, TEXT_FEATURES_FILENAME, MANIFEST_FILENAME
+from .preprocessing import PreprocessConfig
+from .text_cache import weights_fingerprint
+
+
+def preprocess_config_of(analyzer: DermatologyAnalyzer) -> PreprocessConfig:
+    """Lấy cấu hình tiền xử lý từ image tower của open_clip"""
+    return PreprocessConfig.from_visual(analyzer.model.visual)
+
+
+def export_onnx(
+    analyzer: DermatologyAnalyzer,
+    out_dir: Union[str, Path],
+    opset: int = 17
+) -> Dict:
+    """
+    Export image encoder + text features của một analyzer đã khởi tạo
+
+    Returns:
+        Nội dung manifest.json đã ghi
+    """
+    if analyzer.precision != "fp32":
+        # int8/bf16 chỉ là chế độ chạy của engine torch, artifact ONNX luôn là fp32
+        raise ValueError(f"Cần analyzer fp32 để export ONNX, nhận được: {analyzer.precision}")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    preprocess = preprocess_config_of(analyzer)
+    encoder = NormalizedImageEncoder(analyzer.model).eval().to("cpu")
+    dummy = torch.randn(1, 3, *preprocess.size)
+
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Dùng exporter TorchScript để không cần thêm onnxscript
+        export_kwargs["dynamo"] = False
+    # Không bọc trong torch.no_grad(): khi grad tắt, nn.MultiheadAttention đi vào
+    # fast path (_native_multi_head_attention) mà exporter ONNX không hỗ trợ
+    torch.onnx.export(
+        encoder,
+        dummy,
+        str(out_dir / ONNX_FILENAME),
+        input_names=["pixel_values"],
+        output_names=["image_features"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_features": {0: "batch"}},
+        opset_version=opset,
+        **export_kwargs,
+    )
+
+    text_features = analyzer.text_features.float().cpu().numpy()
+    np.save(out_dir / TEXT_FEATURES_FILENAME, text_features)
+
+    manifest = {
+        "format_version": 1,
+        "model_name": analyzer.model_name,
+        # Trọng số image tower + text features: export lại trọng số mới (cùng kiến trúc) đổi phiên bản
+        "weights_fingerprint": weights_fingerprint(analyzer.model, lambda name: name.startswith("visual.")),
+        "text_features_sha256": hashlib.sha256(text_features.tobytes()).hexdigest(),
+        "disease_list": list(analyzer.disease_list),
+        "prompt_template": PROMPT_TEMPLATE,
+        "preprocess": preprocess.to_dict(),
+        "embed_dim": int(text_features.shape[1]),
+        "logit_scale": 100.0,
+        "opset": opset,
+    }
+    with open(out_dir / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    # Đồng bộ analyzer gốc (đã chuyển về CPU khi export)
+    analyzer.model.to(analyzer.device)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export DermLIP image encoder sang ONNX")
+    parser.add_argument("--model", default="hf-hub:redlessone/DermLIP_ViT-B-16", help="Tên mô hình open_clip")
+    parser.add_argument("--out", required=True, help="Thư mục ghi artifact")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--weights", default="", help="Artifact safetensors (weights.py export) thay cho --model")
+    args = parser.parse_args()
+
+    # Export luôn từ image tower fp32 eager: không đọc DERM_PRECISION / DERM_WEIGHTS_DIR / DERM_COMPILE
+    analyzer = DermatologyAnalyzer(
+        model_name=args.model,
+        device="cpu",
+        precision="fp32",
+        weights_dir=args.weights,
+        compile_mode="off",
+    )
+    manifest = export_onnx(analyzer, args.out, opset=args.opset)
+    print(f"Đã export {manifest['model_name']} ({len(manifest['disease_list'])} bệnh) vào {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Engine ONNX Runtime cho DermLIP (không cần torch/open_clip khi chạy)
+
+Dùng artifact sinh bởi export_onnx.py:
+    - image_encoder.onnx: image tower, đầu ra là image features đã chuẩn hóa
+    - text_features.npy: ma trận text features đã chuẩn hóa (số bệnh x D)
+    - manifest.json: tên mô hình, danh sách bệnh, cấu hình tiền xử lý
+"""
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+from .base import BaseDermatologyAnalyzer
+from .preprocessing import BatchBuffer, PreprocessConfig, resize_crop
+from .tta import resolve_tta_mode
+
+
+logger = logging.getLogger(__name__)
+
+ONNX_FILENAME = "image_encoder.onnx"
+TEXT_FEATURES_FILENAME = "text_features.npy"
+MANIFEST_FILENAME = "manifest.json"
+
+
+class OnnxDermatologyAnalyzer(BaseDermatologyAnalyzer):
+    """
+    Phân tích ảnh da liễu bằng ONNX Runtime, tính điểm chỉ bằng numpy
+
+    Example:
+        >>> analyzer = OnnxDermatologyAnalyzer("models/dermlip-onnx")
+        >>> result = analyzer.analyze("skin_image.jpg")
+    """
+
+    backend = "onnx"
+
+    def __init__(
+        self,
+        model_dir: Union[str, Path],
+        disease_list: Optional[List[str]] = None,
+        providers: Optional[List[str]] = None,
+        intra_op_num_threads: Optional[int] = None,
+        tta: Optional[str] = None
+    ):
+        """
+        Khởi tạo analyzer
+
+        Args:
+            model_dir: Thư mục chứa artifact do export_onnx.py sinh ra
+            disease_list: Tập con các bệnh cần phân loại (mặc định: toàn bộ bệnh đã export)
+            providers: Execution providers (mặc định: CPUExecutionProvider)
+            intra_op_num_threads: Số thread cho ONNX Runtime (mặc định: để ORT tự chọn)
+            tta: Test-time augmentation "off" / "auto" / "always" (None: DERM_TTA, mặc định off)
+        """
+        model_dir = Path(model_dir)
+        manifest_path = model_dir / MANIFEST_FILENAME
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"Không tìm thấy {manifest_path}. Chạy export_onnx.py trước.")
+
+        with open(manifest_path, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        self.model_name = self.manifest.get("model_name", "unknown")
+        self.preprocess_config = PreprocessConfig.from_dict(self.manifest.get("preprocess", {}))
+        self._batch_buffer = BatchBuffer(self.preprocess_config)
+        self.logit_scale = float(self.manifest.get("logit_scale", 100.0))
+        self.tta = resolve_tta_mode(tta)
+
+        # Text features cố định sau khi export: chọn hàng theo disease_list nếu có
+        text_features = np.load(model_dir / TEXT_FEATURES_FILENAME).astype(np.float32)
+        exported_diseases = list(self.manifest["disease_list"])
+        if disease_list:
+            missing = [d for d in disease_list if d not in exported_diseases]
+            if missing:
+                raise ValueError(f"Các bệnh chưa có text features trong artifact: {missing}")
+            text_features = text_features[[exported_diseases.index(d) for d in disease_list]]
+            self.disease_list = list(disease_list)
+        else:
+            self.disease_list = exported_diseases
+        self.text_features = np.ascontiguousarray(text_features)
+
+        # Phiên ONNX Runtime
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_num_threads:
+            options.intra_op_num_threads = intra_op_num_threads
+        providers = providers or ["CPUExecutionProvider"]
+        self.session = ort.InferenceSession(str(model_dir / ONNX_FILENAME), options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.device = "cpu" if providers == ["CPUExecutionProvider"] else ",".join(providers)
+
+        # Phiên bản artifact: manifest (có fingerprint trọng số từ export_onnx); artifact cũ
+        # không có fingerprint thì băm toàn bộ file .onnx + text features
+        onnx_path = model_dir / ONNX_FILENAME
+        digest = hashlib.sha256(manifest_path.read_bytes())
+        if "weights_fingerprint" not in self.manifest:
+            with open(onnx_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            digest.update(self.text_features.tobytes())
+        self.weights_version = digest.hexdigest()[:12]
+        self._memory_bytes = onnx_path.stat().st_size + self.text_features.nbytes
+
+        logger.info(f"Đã tải engine ONNX {self.model_name} từ {model_dir}")
+
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def _load_image(self, image_input: Union[str, Path, Image.Image]) -> np.ndarray:
+        """Resize + crop thành mảng uint8 (H, W, 3); chuẩn hóa gộp trong _stack"""
+        image = self._open_image(image_input)
+        return resize_crop(image, self.preprocess_config)
+
+    def _stack(self, arrays: List[np.ndarray]) -> np.ndarray:
+        # ORT sao chép input khi run, nên view của buffer dùng lại được
+        return self._batch_buffer.fill(arrays)
+
+    def _encode(self, image_batch: np.ndarray) -> np.ndarray:
+        """Chạy image encoder (đã gồm chuẩn hóa L2 trong graph)"""
+        return self.session.run(None, {self.input_name: image_batch})[0]
+
+    def _probabilities(self, image_features: np.ndarray) -> np.ndarray:
+        logits = self.logit_scale * image_features @ self.text_features.T
+        logits -= logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def _top_k(self, probs: np.ndarray, top_k: int) -> List[tuple]:
+        k = min(top_k, len(self.disease_list))
+        indices = np.argsort(-probs)[:k]
+        return [(self.disease_list[idx], float(probs[idx])) for idx in indices]
+
+    def get_image_embedding(self, image_input: Union[str, Path, Image.Image]) -> np.ndarray:
+        """Lấy embedding vector (đã chuẩn hóa) của ảnh"""
+        return self._encode(self._stack([self._load_image(image_input)]))
@@ -0,0 +1,109 @@
+"""
+Chế độ độ chính xác cho image tower trên CPU (fp32 / bf16 / int8)
+
+- fp32: mặc định, như mô hình gốc
+- bf16: torch.autocast bfloat16 quanh encode_image
+- int8: dynamic quantization các lớp nn.Linear của image tower
+
+Kèm công cụ so sánh top-k với fp32 để kiểm tra trước khi chuyển chế độ:
+    python -m dermatology_module.precision --precision int8 img1.jpg img2.jpg
+"""
+import argparse
+import copy
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+
+PRECISION_MODES = ("fp32", "bf16", "int8")
+
+
+def resolve_precision(precision: Optional[str] = None) -> str:
+    """Chuẩn hóa chế độ độ chính xác; None -> biến môi trường DERM_PRECISION (mặc định fp32)"""
+    value = (precision or os.getenv("DERM_PRECISION") or "fp32").strip().lower()
+    if value not in PRECISION_MODES:
+        raise ValueError(f"precision phải là một trong {PRECISION_MODES}, nhận được: {value!r}")
+    return value
+
+
+def bf16_supported() -> bool:
+    """CPU có hỗ trợ bf16 qua oneDNN (AVX512-BF16/AMX) hay không"""
+    import torch
+
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def quantize_image_tower(visual):
+    """Dynamic int8 quantization các lớp nn.Linear của image tower (chạy trên CPU)"""
+    import torch
+
+    quantize_dynamic = getattr(torch.ao.quantization, "quantize_dynamic", None) or torch.quantization.quantize_dynamic
+    return quantize_dynamic(visual, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def precision_parity(reference, candidate, image_inputs: List, top_k: int = 5) -> Dict:
+    """
+    So sánh kết quả của candidate với reference (fp32) trên cùng tập ảnh
+
+    Returns:
+        Dict gồm tỉ lệ trùng top-1, độ trùng top-k trung bình, sai khác xác suất
+        lớn nhất và thời gian encode trung bình mỗi ảnh của từng chế độ
+    """
+    loaded = [reference._load_image(x) for x in image_inputs]
+    if not loaded:
+        raise ValueError("Cần ít nhất một ảnh để so sánh")
+    batch = reference._stack(loaded)
+
+    timings = {}
+    probs = {}
+    for name, analyzer in (("reference", reference), ("candidate", candidate)):
+        analyzer._encode(batch[:1])  # warmup
+        start = time.perf_counter()
+        probs[name] = analyzer._probabilities(analyzer._encode(batch))
+        timings[name] = (time.perf_counter() - start) * 1000.0 / len(loaded)
+
+    top1_agree = 0
+    overlaps = []
+    for ref_row, cand_row in zip(probs["reference"], probs["candidate"]):
+        ref_top = [d for d, _ in reference._top_k(ref_row, top_k)]
+        cand_top = [d for d, _ in candidate._top_k(cand_row, top_k)]
+        top1_agree += int(ref_top[0] == cand_top[0])
+        overlaps.append(len(set(ref_top) & set(cand_top)) / len(ref_top))
+
+    max_diff = float((probs["reference"].float() - probs["candidate"].float()).abs().max())
+    return {
+        "reference_precision": reference.precision,
+        "candidate_precision": candidate.precision,
+        "images": len(loaded),
+        "top_k": top_k,
+        "top1_agreement": top1_agree / len(loaded),
+        "topk_overlap": sum(overlaps) / len(overlaps),
+        "max_abs_prob_diff": max_diff,
+        "ms_per_image": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh top-k giữa fp32 và chế độ độ chính xác khác")
+    parser.add_argument("images", nargs="+", help="Ảnh dùng để so sánh")
+    parser.add_argument("--precision", choices=["bf16", "int8"], required=True)
+    parser.add_argument("--model", default="hf-hub:redlessone/DermLIP_ViT-B-16", help="Tên mô hình open_clip")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from .analyzer import DermatologyAnalyzer
+
+    reference = DermatologyAnalyzer(model_name=args.model, device="cpu", precision="fp32")
+    candidate = copy.deepcopy(reference)
+    candidate._apply_precision(args.precision)
+
+    report = precision_parity(reference, candidate, args.images, top_k=args.top_k)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Tiền xử lý ảnh bằng numpy (không phụ thuộc torch/torchvision)
+
+Tái hiện transform ảnh của open_clip (Resize cạnh ngắn -> CenterCrop ->
+ToTensor -> Normalize) để các engine không dùng torch (ONNX Runtime) cho ra
+cùng tensor đầu vào.
+
+Fast path cho batch: resize + crop gộp thành một lần resize PIL (chỉ vùng được
+giữ lại), rồi chuẩn hóa gộp (x * scale + bias) ghi thẳng vào buffer NCHW
+float32 cấp phát sẵn và dùng lại giữa các batch.
+"""
+import argparse
+import json
+import os
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+# Giá trị chuẩn hóa mặc định của CLIP (OpenAI)
+OPENAI_DATASET_MEAN = (0.48145466, 0.4578275, 0.40821073)
+OPENAI_DATASET_STD = (0.26862954, 0.26130258, 0.27577711)
+
+def fast_preprocess_enabled() -> bool:
+    """Bật/tắt fast path qua biến môi trường DERM_FAST_PREPROCESS (mặc định bật)"""
+    return os.getenv("DERM_FAST_PREPROCESS", "true").lower() in {"1", "true", "yes"}
+
+
+_PIL_INTERPOLATION = {
+    "bicubic": Image.BICUBIC,
+    "bilinear": Image.BILINEAR,
+    "nearest": Image.NEAREST,
+}
+
+
+@dataclass
+class PreprocessConfig:
+    """Cấu hình tiền xử lý (tương ứng preprocess_cfg của open_clip)"""
+    size: Tuple[int, int] = (224, 224)
+    mean: Tuple[float, ...] = OPENAI_DATASET_MEAN
+    std: Tuple[float, ...] = OPENAI_DATASET_STD
+    interpolation: str = "bicubic"
+    resize_mode: str = "shortest"
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PreprocessConfig":
+        size = data.get("size", cls.size)
+        if isinstance(size, int):
+            size = (size, size)
+        return cls(
+            size=tuple(size),
+            mean=tuple(data.get("mean", cls.mean)),
+            std=tuple(data.get("std", cls.std)),
+            interpolation=data.get("interpolation", cls.interpolation),
+            resize_mode=data.get("resize_mode", cls.resize_mode),
+        )
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_visual(cls, visual: Any) -> "PreprocessConfig":
+        """Lấy cấu hình từ image tower của open_clip (model.visual)"""
+        cfg = getattr(visual, "preprocess_cfg", None)
+        if cfg:
+            return cls.from_dict(cfg)
+        return cls.from_dict({
+            "size": getattr(visual, "image_size", (224, 224)),
+            "mean": getattr(visual, "image_mean", None) or cls.mean,
+            "std": getattr(visual, "image_std", None) or cls.std,
+        })
+
+    def normalization(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(scale, bias) dạng (C, 1, 1) sao cho (x / 255 - mean) / std == x * scale + bias"""
+        mean = np.asarray(self.mean, dtype=np.float32)
+        std = np.asarray(self.std, dtype=np.float32)
+        scale = (1.0 / (255.0 * std)).astype(np.float32)
+        bias = (-mean / std).astype(np.float32)
+        return scale[:, None, None], bias[:, None, None]
+
+
+def _resize_box(image: Image.Image, config: PreprocessConfig) -> Tuple[Tuple[int, int], Tuple[float, ...]]:
+    """
+    Kích thước đầu ra và vùng nguồn (box) để một lần resize cho kết quả của
+    torchvision Resize + CenterCrop
+
+    Resize cạnh ngắn làm tròn xuống như torchvision, offset crop làm tròn như
+    CenterCrop; box được quy về tọa độ ảnh gốc nên tỉ lệ lấy mẫu giữ nguyên.
+    """
+    out_h, out_w = config.size
+    w, h = image.size
+
+    if config.resize_mode == "squash":
+        return (out_w, out_h), (0.0, 0.0, float(w), float(h))
+    if config.resize_mode != "shortest":
+        raise ValueError(f"resize_mode không được hỗ trợ: {config.resize_mode}")
+
+    requested = min(out_h, out_w)
+    if w <= h:
+        new_w, new_h = requested, int(requested * h / w)
+    else:
+        new_w, new_h = int(requested * w / h), requested
+
+    top = int(round((new_h - out_h) / 2.0))
+    left = int(round((new_w - out_w) / 2.0))
+    sx, sy = w / new_w, h / new_h
+    return (out_w, out_h), (left * sx, top * sy, (left + out_w) * sx, (top + out_h) * sy)
+
+
+def resize_crop(image: Image.Image, config: PreprocessConfig) -> np.ndarray:
+    """
+    Resize + center crop trong một lần resize PIL (chỉ tính vùng được giữ lại)
+
+    Returns:
+        Mảng uint8 (H, W, 3)
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    size, box = _resize_box(image, config)
+    if box != (0.0, 0.0, float(image.size[0]), float(image.size[1])) or size != image.size:
+        resample = _PIL_INTERPOLATION.get(config.interpolation, Image.BICUBIC)
+        image = image.resize(size, resample, box=box)
+    return np.asarray(image)
+
+
+def normalize_into(array: np.ndarray, out: np.ndarray, scale: np.ndarray, bias: np.ndarray) -> np.ndarray:
+    """Ghi (array HWC uint8 -> CHW float32 đã chuẩn hóa) vào out, không tạo mảng trung gian"""
+    np.multiply(array.transpose(2, 0, 1), scale, out=out)
+    out += bias
+    return out
+
+
+def preprocess_image(image: Image.Image, config: PreprocessConfig) -> np.ndarray:
+    """
+    Tiền xử lý một ảnh PIL RGB
+
+    Returns:
+        Mảng float32 (C, H, W) đã chuẩn hóa
+    """
+    out = np.empty((3, *config.size), dtype=np.float32)
+    return normalize_into(resize_crop(image, config), out, *config.normalization())
+
+
+class BatchBuffer:
+    """
+    Buffer NCHW float32 cấp phát sẵn, mỗi thread một buffer
+
+    Mảng trả về từ fill() là view của buffer: chỉ dùng được cho tới lần fill()
+    tiếp theo trên cùng thread (đủ cho encode ngay sau đó).
+    """
+
+    def __init__(self, config: PreprocessConfig):
+        self.config = config
+        self.scale, self.bias = config.normalization()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # threading.local không copy/pickle được (copy.deepcopy(analyzer) trong precision.py)
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def fill(self, arrays: List[np.ndarray]) -> np.ndarray:
+        """Chuẩn hóa các ảnh uint8 (H, W, 3) từ resize_crop vào buffer, trả về view (N, C, H, W)"""
+        n = len(arrays)
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < n:
+            buffer = np.empty((n, 3, *self.config.size), dtype=np.float32)
+            self._local.buffer = buffer
+        for i, array in enumerate(arrays):
+            normalize_into(array, buffer[i], self.scale, self.bias)
+        return buffer[:n]
+
+
+def preprocess_parity(analyzer, image_inputs: List) -> Dict:
+    """
+    So sánh fast path với transform open_clip (analyzer.preprocess) trên cùng tập ảnh
+
+    Returns:
+        Dict gồm sai khác tuyệt đối lớn nhất / trung bình trên tensor đầu vào
+    """
+    config = PreprocessConfig.from_visual(analyzer.model.visual)
+    buffer = BatchBuffer(config)
+    images = [analyzer._open_image(x) for x in image_inputs]
+    if not images:
+        raise ValueError("Cần ít nhất một ảnh để so sánh")
+
+    reference = np.stack([analyzer.preprocess(image).numpy() for image in images])
+    fast = buffer.fill([resize_crop(image, config) for image in images])
+    diff = np.abs(reference - fast)
+    return {
+        "images": len(images),
+        "size": list(config.size),
+        "max_abs_diff": float(diff.max()),
+        "mean_abs_diff": float(diff.mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh fast path tiền xử lý với transform open_clip")
+    parser.add_argument("images", nargs="+", help="Ảnh dùng để so sánh")
+    parser.add_argument("--model", default="hf-hub:redlessone/DermLIP_ViT-B-16", help="Tên mô hình open_clip")
+    args = parser.parse_args()
+
+    from .analyzer import DermatologyAnalyzer
+
+    analyzer = DermatologyAnalyzer(model_name=args.model, device="cpu", fast_preprocess=False)
+    print(json.dumps(preprocess_parity(analyzer, args.images), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Cache text features trên đĩa
+
+Ma trận text features (đã chuẩn hóa) chỉ phụ thuộc vào mô hình, trọng số của
+text tower, prompt template và danh sách bệnh. Lưu lại dưới dạng .npy có phiên
+bản, khi khởi động chỉ cần memory-map file thay vì chạy lại text encoder.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Tăng khi định dạng file hoặc cách tính text features thay đổi
+TEXT_CACHE_VERSION = 1
+
+# Số phần tử lấy mẫu tối đa trên mỗi tensor khi tính fingerprint trọng số
+_FINGERPRINT_SAMPLES = 4096
+
+
+def default_cache_dir() -> Path:
+    """Thư mục cache: DERM_CACHE_DIR hoặc ~/.cache/dermatology_module"""
+    return Path(os.getenv("DERM_CACHE_DIR", Path.home() / ".cache" / "dermatology_module"))
+
+
+def text_cache_enabled() -> bool:
+    return os.getenv("DERM_TEXT_CACHE", "true").lower() in {"1", "true", "yes"}
+
+
+def weights_fingerprint(model, include: Callable[[str], bool]) -> str:
+    """
+    Fingerprint rẻ của một phần trọng số
+
+    Băm tên, shape, dtype và một mẫu đều (tối đa 4096 phần tử) của mọi tensor
+    có tên thỏa include; đủ để phát hiện checkpoint khác mà không phải đọc
+    toàn bộ trọng số.
+    """
+    digest = hashlib.sha256()
+    for name, tensor in sorted(model.state_dict().items()):
+        if not include(name):
+            continue
+        flat = tensor.detach().reshape(-1)
+        stride = max(1, flat.numel() // _FINGERPRINT_SAMPLES)
+        sample = flat[::stride].float().cpu().numpy()
+        digest.update(name.encode())
+        digest.update(str(tuple(tensor.shape)).encode())
+        digest.update(str(tensor.dtype).encode())
+        digest.update(sample.tobytes())
+    return digest.hexdigest()
+
+
+def text_weights_fingerprint(model) -> str:
+    """Fingerprint trọng số text tower (mọi tensor không thuộc image tower)"""
+    return weights_fingerprint(model, lambda name: not name.startswith("visual."))
+
+
+def text_cache_key(model_name: str, weights_hash: str, prompt_template: str, disease_list: List[str]) -> str:
+    payload = json.dumps(
+        {
+            "version": TEXT_CACHE_VERSION,
+            "model_name": model_name,
+            "weights_hash": weights_hash,
+            "prompt_template": prompt_template,
+            "disease_list": list(disease_list),
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_path(cache_dir: Union[str, Path], key: str) -> Path:
+    return Path(cache_dir) / f"text_features-v{TEXT_CACHE_VERSION}-{key[:32]}.npy"
+
+
+def load_text_features(cache_dir: Union[str, Path], key: str) -> Optional[np.ndarray]:
+    """Memory-map ma trận text features đã cache (copy-on-write), None nếu chưa có"""
+    path = _cache_path(cache_dir, key)
+    if not path.exists():
+        return None
+    try:
+        return np.load(path, mmap_mode="c")
+    except Exception as e:
+        logger.warning(f"Không đọc được cache text features {path}: {e}")
+        return None
+
+
+def save_text_features(cache_dir: Union[str, Path], key: str, features: np.ndarray, metadata: Dict) -> Optional[Path]:
+    """Ghi nguyên tử (file tạm + os.replace) để các process song song không đọc file dở"""
+    path = _cache_path(cache_dir, key)
+    tmp_name = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".npy.tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(features, dtype=np.float32))
+        os.replace(tmp_name, path)
+        with open(path.with_suffix(".json"), "w", encoding="utf-8") as f:
+            json.dump({**metadata, "key": key, "shape": list(features.shape)}, f, ensure_ascii=False, indent=2)
+        return path
+    except Exception as e:
+        logger.warning(f"Không ghi được cache text features vào {path}: {e}")
+        return None
+    finally:
+        # np.save / os.replace lỗi: không để lại file tạm trong thư mục cache
+        if tmp_name is not None and os.path.exists(tmp_name):
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
@@ -0,0 +1,140 @@
+"""
+Test-time augmentation (TTA) cho các ca khó phân định
+
+Sinh nhiều view của một ảnh (lật, xoay nhẹ, crop đa tỉ lệ), chạy tất cả trong
+một batch với một lần encode_image, rồi gộp xác suất (hoặc image features) của
+các view. Độ phân tán giữa các view được trả về như một tín hiệu bất định.
+
+Chế độ (DERM_TTA):
+    - off: không dùng (mặc định)
+    - auto: chỉ dùng khi khoảng cách top-1/top-2 của view gốc < DERM_TTA_MARGIN,
+      nên chi phí trung bình vẫn gần một lần forward
+    - always: luôn dùng (view gốc nằm chung batch với các view còn lại)
+"""
+import math
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+TTA_MODES = ("off", "auto", "always")
+TTA_REDUCTIONS = ("probs", "features")
+DEFAULT_TTA_VIEWS = "hflip,vflip,rot10,rot-10,crop0.85"
+
+
+def resolve_tta_mode(mode: Optional[str] = None) -> str:
+    """Chuẩn hóa chế độ TTA; None -> biến môi trường DERM_TTA (mặc định off)"""
+    value = (mode or os.getenv("DERM_TTA") or "off").strip().lower()
+    if value not in TTA_MODES:
+        raise ValueError(f"tta phải là một trong {TTA_MODES}, nhận được: {value!r}")
+    return value
+
+
+def tta_margin() -> float:
+    """Ngưỡng khoảng cách top-1/top-2 dưới đó chế độ auto bật TTA"""
+    return float(os.getenv("DERM_TTA_MARGIN", "0.15"))
+
+
+def tta_view_names() -> List[str]:
+    return [v.strip().lower() for v in os.getenv("DERM_TTA_VIEWS", DEFAULT_TTA_VIEWS).split(",") if v.strip()]
+
+
+def tta_reduction() -> str:
+    value = os.getenv("DERM_TTA_REDUCE", "probs").strip().lower()
+    if value not in TTA_REDUCTIONS:
+        raise ValueError(f"DERM_TTA_REDUCE phải là một trong {TTA_REDUCTIONS}, nhận được: {value!r}")
+    return value
+
+
+def _rotate(image: Image.Image, degrees: float) -> Image.Image:
+    """Xoay rồi crop hình chữ nhật nội tiếp để không còn góc đen"""
+    rotated = image.rotate(degrees, resample=Image.BILINEAR)
+    theta = math.radians(abs(degrees))
+    ratio = 1.0 / (math.cos(theta) + math.sin(theta))
+    return _center_crop(rotated, ratio)
+
+
+def _center_crop(image: Image.Image, fraction: float) -> Image.Image:
+    width, height = image.size
+    crop_w, crop_h = max(1, round(width * fraction)), max(1, round(height * fraction))
+    left, top = (width - crop_w) // 2, (height - crop_h) // 2
+    return image.crop((left, top, left + crop_w, top + crop_h))
+
+
+def _view_fn(name: str) -> Callable[[Image.Image], Image.Image]:
+    if name == "hflip":
+        return lambda image: image.transpose(Image.FLIP_LEFT_RIGHT)
+    if name == "vflip":
+        return lambda image: image.transpose(Image.FLIP_TOP_BOTTOM)
+    if name.startswith("rot"):
+        degrees = float(name[3:])
+        return lambda image: _rotate(image, degrees)
+    if name.startswith("crop"):
+        fraction = float(name[4:])
+        if not 0.0 < fraction <= 1.0:
+            raise ValueError(f"Tỉ lệ crop phải trong (0, 1]: {name}")
+        return lambda image: _center_crop(image, fraction)
+    raise ValueError(f"View TTA không hợp lệ: {name!r} (hflip, vflip, rot<độ>, crop<tỉ lệ>)")
+
+
+def make_views(image: Image.Image, names: Optional[Sequence[str]] = None) -> List[Image.Image]:
+    """Các view augment của ảnh (không gồm view gốc)"""
+    names = tta_view_names() if names is None else names
+    return [_view_fn(name)(image) for name in names]
+
+
+def top2_margin(probs: np.ndarray) -> float:
+    """Khoảng cách top-1 - top-2 của một vector xác suất"""
+    if probs.shape[-1] < 2:
+        return 1.0
+    top2 = np.partition(probs, -2)[-2:]
+    return float(top2[1] - top2[0])
+
+
+def reduce_views(
+    view_probs: np.ndarray,
+    view_features: np.ndarray,
+    score: Callable[[np.ndarray], np.ndarray],
+    reduction: str = "probs",
+) -> Tuple[np.ndarray, Dict]:
+    """
+    Gộp các view thành một vector xác suất và tính độ phân tán giữa các view
+
+    Args:
+        view_probs: (V, số bệnh) xác suất của từng view (view 0 là ảnh gốc)
+        view_features: (V, D) image features đã chuẩn hóa của từng view
+        score: image features (N, D) -> xác suất (N, số bệnh), dùng khi reduction="features"
+        reduction: "probs" (trung bình xác suất) hoặc "features" (trung bình features rồi chuẩn hóa lại)
+
+    Returns:
+        (xác suất đã gộp, thông tin bất định)
+    """
+    if reduction == "features":
+        mean_features = view_features.mean(axis=0, keepdims=True)
+        mean_features /= np.linalg.norm(mean_features, axis=-1, keepdims=True)
+        probs = score(mean_features)[0]
+    else:
+        probs = view_probs.mean(axis=0)
+
+    top1 = int(np.argmax(probs))
+    top1_per_view = view_probs[:, top1]
+    uncertainty = {
+        "applied": True,
+        "views": int(view_probs.shape[0]),
+        "reduction": reduction,
+        "single_view_margin": top2_margin(view_probs[0]),
+        "margin": top2_margin(probs),
+        # Tỉ lệ view có cùng top-1 với kết quả gộp
+        "agreement": float(np.mean(np.argmax(view_probs, axis=-1) == top1)),
+        # Độ lệch chuẩn / khoảng xác suất của bệnh top-1 giữa các view
+        "top1_std": float(top1_per_view.std()),
+        "top1_range": float(top1_per_view.max() - top1_per_view.min()),
+    }
+    return probs, uncertainty
+
+
+def top_k_from_probs(probs: np.ndarray, disease_list: Sequence[str], top_k: int) -> List[tuple]:
+    order = np.argsort(-probs)[: min(top_k, len(disease_list))]
+    return [(disease_list[i], float(probs[i])) for i in order]
@@ -0,0 +1,293 @@
+"""
+Tải trọng số open_clip từ safetensors bằng memory-map
+
+open_clip.create_model_and_transforms(...) khởi tạo ngẫu nhiên toàn bộ mô hình
+rồi đọc và sao chép checkpoint vào các tensor vừa cấp phát ở mỗi lần khởi động.
+Ở đây kiến trúc được dựng trên thiết bị "meta" (không cấp phát, không khởi tạo),
+rồi gán thẳng các tensor là view của file safetensors đã mmap (MAP_PRIVATE):
+
+    - trang được đọc lười khi forward chạm tới (lazy page-in)
+    - không sao chép khi dtype trong file khớp dtype của mô hình
+    - page cache của file dùng chung giữa mọi process trên cùng máy
+
+Artifact (cũng là một thư mục "local-dir:" hợp lệ của open_clip):
+    <out_dir>/open_clip_config.json
+    <out_dir>/open_clip_model.safetensors
+    <out_dir>/non_persistent_buffers.safetensors   (buffer không nằm trong state_dict, ví dụ attn_mask)
+
+Metadata của open_clip_model.safetensors lưu sẵn fingerprint trọng số image/text
+tower (text_cache.weights_fingerprint) để analyzer không phải đọc trọng số lúc
+khởi động chỉ để tính phiên bản.
+
+Example:
+    python -m dermatology_module.weights export --out models/dermlip-safetensors
+    python -m dermatology_module.weights bench --weights models/dermlip-safetensors
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+import torch
+
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILENAME = "open_clip_config.json"
+WEIGHTS_FILENAME = "open_clip_model.safetensors"
+BUFFERS_FILENAME = "non_persistent_buffers.safetensors"
+
+_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def weights_dir_from_env() -> Optional[str]:
+    """Thư mục artifact safetensors: DERM_WEIGHTS_DIR (None nếu không đặt)"""
+    return os.getenv("DERM_WEIGHTS_DIR") or None
+
+
+def read_safetensors(path: Union[str, Path]) -> Tuple[Dict[str, torch.Tensor], Dict[str, str]]:
+    """
+    Memory-map một file safetensors
+
+    Mọi tensor là view của cùng một storage ánh xạ từ file (copy-on-write),
+    không có byte trọng số nào được đọc cho tới khi tensor được dùng.
+
+    Returns:
+        (tensors theo tên, metadata của file)
+    """
+    path = Path(path)
+    size = path.stat().st_size
+    header_len, header = _read_header(path)
+    metadata = header.pop("__metadata__", None) or {}
+    data_start = 8 + header_len
+
+    # shared=False: ánh xạ MAP_PRIVATE, ghi vào tensor không sửa file
+    storage = torch.UntypedStorage.from_file(str(path), False, size)
+    tensors = {}
+    for name, info in header.items():
+        dtype = _DTYPES.get(info["dtype"])
+        if dtype is None:
+            raise ValueError(f"dtype safetensors không được hỗ trợ: {info['dtype']} ({name})")
+        begin, end = info["data_offsets"]
+        shape = tuple(info["shape"])
+        itemsize = torch.empty(0, dtype=dtype).element_size()
+        offset = data_start + begin
+        if offset % itemsize:
+            # Không căn hàng theo kích thước phần tử: sao chép riêng tensor này
+            raw = torch.empty(0, dtype=torch.uint8).set_(storage, offset, (end - begin,), (1,))
+            tensors[name] = raw.clone().view(dtype).reshape(shape)
+            continue
+        tensor = torch.empty(0, dtype=dtype)
+        tensor.set_(storage, offset // itemsize, shape, _contiguous_strides(shape))
+        tensors[name] = tensor
+    return tensors, metadata
+
+
+def _read_header(path: Path) -> Tuple[int, Dict[str, Any]]:
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        return header_len, json.loads(f.read(header_len))
+
+
+def read_fingerprints(weights_dir: Union[str, Path]) -> Dict[str, str]:
+    """
+    Fingerprint trọng số lưu trong metadata của artifact (chỉ đọc header)
+
+    Returns:
+        {"visual": ..., "text": ...}; rỗng với artifact export trước khi có fingerprint
+    """
+    metadata = _read_header(Path(weights_dir) / WEIGHTS_FILENAME)[1].get("__metadata__") or {}
+    return {
+        part: metadata[f"{part}_fingerprint"]
+        for part in ("visual", "text")
+        if f"{part}_fingerprint" in metadata
+    }
+
+
+def _contiguous_strides(shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    strides, step = [], 1
+    for dim in reversed(shape):
+        strides.append(step)
+        step *= max(dim, 1)
+    return tuple(reversed(strides))
+
+
+def _non_persistent_buffers(model: torch.nn.Module) -> Dict[str, torch.Tensor]:
+    persistent = set(model.state_dict().keys())
+    return {name: buffer for name, buffer in model.named_buffers() if name not in persistent}
+
+
+def export_safetensors(model: torch.nn.Module, model_name: str, out_dir: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Ghi artifact safetensors từ một mô hình open_clip đã tải
+
+    Returns:
+        Thông tin artifact (tên mô hình, số tensor, dung lượng)
+    """
+    import open_clip
+    from safetensors.torch import save_file
+
+    from .text_cache import text_weights_fingerprint, weights_fingerprint
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    model_cfg = open_clip.get_model_config(model_name)
+    if model_cfg is None:
+        raise ValueError(f"Không lấy được cấu hình open_clip của {model_name}")
+    config = {
+        "model_cfg": model_cfg,
+        "preprocess_cfg": dict(getattr(model.visual, "preprocess_cfg", {}) or {}),
+    }
+    with open(out_dir / CONFIG_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+    metadata = {
+        "model_name": model_name,
+        "format": "pt",
+        "visual_fingerprint": weights_fingerprint(model, lambda name: name.startswith("visual.")),
+        "text_fingerprint": text_weights_fingerprint(model),
+    }
+    state = {name: tensor.detach().cpu().contiguous() for name, tensor in model.state_dict().items()}
+    save_file(state, str(out_dir / WEIGHTS_FILENAME), metadata=metadata)
+    buffers = {name: t.detach().cpu().contiguous() for name, t in _non_persistent_buffers(model).items()}
+    save_file(buffers, str(out_dir / BUFFERS_FILENAME), metadata=metadata)
+
+    info = {
+        "model_name": model_name,
+        "tensors": len(state),
+        "non_persistent_buffers": sorted(buffers),
+        "size_mb": round((out_dir / WEIGHTS_FILENAME).stat().st_size / 1024 ** 2, 1),
+    }
+    logger.info(f"Đã export safetensors {model_name} vào {out_dir}")
+    return info
+
+
+def load_open_clip(weights_dir: Union[str, Path]) -> Tuple[torch.nn.Module, Any, str]:
+    """
+    Dựng mô hình open_clip từ artifact safetensors, trọng số memory-map (trên CPU)
+
+    Returns:
+        (model, transform tiền xử lý, tên mô hình gốc lưu trong artifact)
+    """
+    import open_clip
+
+    weights_dir = Path(weights_dir).resolve()
+    state, metadata = read_safetensors(weights_dir / WEIGHTS_FILENAME)
+    buffers_path = weights_dir / BUFFERS_FILENAME
+    buffers = read_safetensors(buffers_path)[0] if buffers_path.exists() else {}
+
+    # Kiến trúc trên "meta": không cấp phát, không khởi tạo ngẫu nhiên
+    with torch.device("meta"):
+        model, _, preprocess = open_clip.create_model_and_transforms(
+            f"local-dir:{weights_dir}", load_weights=False, device="meta"
+        )
+
+    # Giữ dtype của mô hình: chỉ tensor lệch dtype mới bị sao chép
+    expected = model.state_dict()
+    for name, tensor in state.items():
+        target = expected.get(name)
+        if target is not None and tensor.dtype != target.dtype:
+            state[name] = tensor.to(target.dtype)
+    model.load_state_dict(state, strict=True, assign=True)
+
+    for name, tensor in buffers.items():
+        module_name, _, buffer_name = name.rpartition(".")
+        module = model.get_submodule(module_name) if module_name else model
+        module._buffers[buffer_name] = tensor
+
+    leftover = [name for name, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+    if leftover:
+        raise RuntimeError(f"Artifact thiếu tensor (vẫn ở meta): {leftover[:5]}")
+
+    model_name = metadata.get("model_name", f"local-dir:{weights_dir}")
+    logger.info(f"Đã memory-map trọng số {model_name} từ {weights_dir}")
+    return model, preprocess, model_name
+
+
+# ----------------------------------------------------------------------
+# Đo cold start: mỗi lần đo chạy trong một process mới
+# ----------------------------------------------------------------------
+# Đo cả constructor của analyzer (tokenizer, text features, fingerprint, ...), không chỉ phần tải trọng số
+_BENCH_SNIPPET = """
+import json, resource, time
+import torch
+from dermatology_module.analyzer import DermatologyAnalyzer
+started = time.perf_counter()
+if {mmap!r}:
+    analyzer = DermatologyAnalyzer(device="cpu", weights_dir={weights!r}, precision="fp32", compile_mode="off")
+else:
+    analyzer = DermatologyAnalyzer("local-dir:" + {weights!r}, device="cpu", weights_dir="", precision="fp32", compile_mode="off")
+load = time.perf_counter() - started
+with torch.inference_mode():
+    analyzer.model.encode_image(torch.zeros(1, 3, *analyzer.preprocess_config.size))
+first = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{"load_seconds": load, "first_forward_seconds": first, "max_rss_mb": rss}}))
+"""
+
+
+def _bench_once(weights_dir: str, mmap: bool) -> Dict[str, float]:
+    code = _BENCH_SNIPPET.format(weights=weights_dir, mmap=mmap)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(Path(__file__).resolve().parent.parent), os.getenv("PYTHONPATH", "")]))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def benchmark(weights_dir: Union[str, Path], runs: int = 3) -> Dict[str, Any]:
+    """
+    So sánh cold start của DermatologyAnalyzer trên cùng artifact: đường tải của
+    open_clip ("local-dir:", khởi tạo ngẫu nhiên rồi sao chép checkpoint) và memory-map
+    """
+    weights_dir = str(Path(weights_dir).resolve())
+    report = {}
+    for label, mmap in (("open_clip", False), ("mmap", True)):
+        samples = [_bench_once(weights_dir, mmap) for _ in range(runs)]
+        report[label] = {
+            key: round(min(sample[key] for sample in samples), 3)
+            for key in ("load_seconds", "first_forward_seconds", "max_rss_mb")
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Artifact safetensors memory-map cho DermLIP")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Ghi artifact safetensors")
+    export.add_argument("--model", default="hf-hub:redlessone/DermLIP_ViT-B-16", help="Tên mô hình open_clip")
+    export.add_argument("--out", required=True, help="Thư mục ghi artifact")
+
+    bench = sub.add_parser("bench", help="Đo cold start so với open_clip")
+    bench.add_argument("--weights", required=True, help="Thư mục artifact safetensors")
+    bench.add_argument("--runs", type=int, default=3)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        import open_clip
+
+        model = open_clip.create_model_and_transforms(args.model)[0]
+        info = export_safetensors(model, args.model, args.out)
+    else:
+        info = benchmark(args.weights, runs=args.runs)
+    print(json.dumps(info, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ from pathlib import Path
 
 # Import from parent dermatology_module
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from dermatology_module import DermatologyAnalyzer as _BaseAnalyzer
+import dermatology_module
 
 class DermaAnalyzer:
     """
@@ -35,7 +35,8 @@ class DermaAnalyzer:
         
         self._model_name = model_name
         self._device = device
-        self._analyzer = _BaseAnalyzer(model_name=model_name, device=device)
+        # Engine torch/open_clip chỉ được import ở đây, không phải khi import package
+        self._analyzer = dermatology_module.DermatologyAnalyzer(model_name=model_name, device=device)
     
     def analyze(self, image_path, top_k=5):
         """
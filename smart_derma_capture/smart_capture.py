@@ -37,12 +37,15 @@ class SmartCapture:
         self.enhancer = ImageEnhancer(target_size=target_size)
         self.guide = CaptureGuide()
     
-    def check_quality(self, image: Union[str, np.ndarray]) -> Dict:
+    def check_quality(self, image: Union[str, np.ndarray], scale: float = 1.0) -> Dict:
         """
         Check image quality
         
         Args:
             image: Image path or numpy array
+            scale: Decoded / original size when the image was decoded
+                downscaled; the checker scales its resolution and blur
+                thresholds by it
             
         Returns:
             Dict with is_acceptable, score, issues, recommendations
@@ -50,7 +53,10 @@ class SmartCapture:
         if isinstance(image, str):
             image = cv2.imread(image)
         
-        is_acceptable, issues, score = self.checker.check_quality(image)
+        if scale < 1.0:
+            is_acceptable, issues, score = self.checker.check_quality(image, scale=scale)
+        else:
+            is_acceptable, issues, score = self.checker.check_quality(image)
         
         return {
             'is_acceptable': is_acceptable,